@@ -0,0 +1,134 @@
+"""
+Отложенная запись ответов теста в базу.
+
+Раньше каждый ответ синхронно вызывал db.update_user_answers, и запись в
+SQLite (с fsync) стояла на пути ответа пользователю. AnswerWriter складывает
+обновления в буфер и сбрасывает их пачками из фонового потока - когда набралось
+batch_size ответов или прошло flush_interval секунд. write_batch возвращает
+число незаписанных ответов пачки (или бросает исключение - тогда незаписанной
+считается вся пачка); они учитываются в failed. Повторный ответ того же
+пользователя на тот же вопрос заменяет предыдущий, еще не записанный. При
+остановке бота буфер сбрасывается полностью.
+"""
+
+import threading
+import time
+
+
+class AnswerWriter:
+    """Буфер ответов с пакетным сбросом в фоновом потоке"""
+
+    def __init__(self, write_batch, batch_size=200, flush_interval=1.0):
+        # write_batch(items) получает список (user_id, question_id, answer_value)
+        # и возвращает число незаписанных (None - записаны все)
+        self._write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = None
+
+        # Метрики
+        self.enqueued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+        self.flushes = 0
+        self.max_depth = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+
+    def start(self):
+        """Запустить фоновый поток (повторный вызов ничего не делает)"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='answer-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, user_id, question_id, answer_value):
+        """Поставить ответ в очередь на запись"""
+        key = (user_id, question_id)
+        with self._lock:
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = answer_value
+            self.enqueued += 1
+            depth = len(self._pending)
+            if depth > self.max_depth:
+                self.max_depth = depth
+            if depth >= self.batch_size:
+                self._wakeup.notify()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._stopped and len(self._pending) < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def flush(self):
+        """Записать все накопленные ответы одной пачкой"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+
+            items = [(user_id, question_id, value) for (user_id, question_id), value in batch.items()]
+            started = time.perf_counter()
+            try:
+                failed = self._write_batch(items) or 0
+                self.written += len(items) - failed
+                self.failed += failed
+            except Exception as e:
+                self.failed += len(items)
+                print(f"❌ Ошибка записи ответов ({len(items)} шт.): {e}")
+            elapsed = time.perf_counter() - started
+
+            self.flushes += 1
+            self.last_flush_seconds = elapsed
+            self.total_flush_seconds += elapsed
+            if elapsed > self.max_flush_seconds:
+                self.max_flush_seconds = elapsed
+            return len(items)
+
+    def stop(self, timeout=10.0):
+        """Остановить поток, дописав все, что осталось в буфере"""
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            thread.join(timeout)
+        # Ответы, пришедшие во время остановки, тоже не теряем
+        self.flush()
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def stats(self):
+        """Счетчики буфера для админ-статистики"""
+        return {
+            'depth': len(self._pending),
+            'max_depth': self.max_depth,
+            'enqueued': self.enqueued,
+            'coalesced': self.coalesced,
+            'written': self.written,
+            'failed': self.failed,
+            'flushes': self.flushes,
+            'last_flush_ms': self.last_flush_seconds * 1000,
+            'max_flush_ms': self.max_flush_seconds * 1000,
+            'avg_flush_ms': self.total_flush_seconds * 1000 / self.flushes if self.flushes else 0.0,
+        }
@@ -0,0 +1,271 @@
+"""
+Асинхронный режим бота на AsyncTeleBot.
+
+В обычном режиме каждый обработчик блокирует поток на HTTP-запросах и
+запросах к SQLite. В асинхронном режиме обновления принимает AsyncTeleBot, и
+самые частые действия - ответ на вопрос теста и кнопка "Начать тест" -
+обходятся без потока обработчика: ответ проверяется по снимку каталога
+коротким вызовом accept_answer в пуле потоков (при первом обращении снимок
+читается из базы), запись в базу уходит в AnswerWriter, а следующий вопрос
+отправляется через aiohttp. Тысячи проходящих тест пользователей
+обслуживаются одним циклом событий без потока на каждого.
+
+Все остальное (админ-панель, результаты, отчеты) выполняется прежними
+синхронными обработчиками fixed_bot в пуле потоков. Обновления одного чата
+обрабатываются строго по очереди в обоих случаях. Одновременно в обработке не
+больше max_in_flight обновлений: пока лимит занят, следующий getUpdates не
+выполняется.
+
+Отправки быстрого пути идут через aiohttp мимо Outbox. Общий лимит бота
+они делят с Outbox (его global_limiter), лимит на чат и повторы после 429 и
+сетевых ошибок повторяют логику Outbox здесь же. Счет по чату у быстрого пути
+свой: сообщение синхронного обработчика в тот же чат (результаты) в него не
+попадает.
+
+Запуск: python fixed_bot.py --mode async
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+import telebot
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from ratelimit import TokenBucket
+from sharding import update_key
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Асинхронная обертка над Database: методы выполняются в пуле потоков"""
+
+    # Методы Database, которые вызывает бот
+    METHODS = (
+        'get_all_questions', 'add_question', 'delete_question',
+        'create_user_session', 'update_user_answers', 'get_all_users', 'get_user_statistics',
+        'get_specialization_from_code', 'get_all_specializations', 'add_specialization',
+        'delete_specialization', 'get_all_universities', 'get_universities_by_specialization',
+        'get_unique_universities', 'delete_university_by_name', 'sync_website_data',
+    )
+
+    def __init__(self, db, workers=4):
+        self._db = db
+        # SQLite плохо переносит много параллельных писателей - пул небольшой
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='async-db')
+        for name in self.METHODS:
+            method = getattr(db, name, None)
+            if method is not None:
+                setattr(self, name, self._wrap(method))
+
+    def _wrap(self, method):
+        @functools.wraps(method)
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(method, *args, **kwargs))
+        return call
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+class AsyncItBot(AsyncTeleBot):
+    """AsyncTeleBot с быстрым путем для теста и синхронными обработчиками для остального"""
+
+    def __init__(self, app, token, db_workers=4, sync_workers=16, max_in_flight=1024):
+        # app - модуль fixed_bot (обработчики, хранилища и синхронный бот)
+        super().__init__(token)
+        self.app = app
+        self.adb = AsyncDatabase(app.db, db_workers)
+        self._sync_executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix='sync-handlers')
+        self._chat_locks = {}
+        self.max_in_flight = max_in_flight
+        # Ссылки на задачи, иначе сборщик мусора может удалить их посреди работы
+        self._tasks = set()
+        self._has_room = asyncio.Event()
+        self._has_room.set()
+        self._chat_buckets = {}     # chat_id -> [TokenBucket, время последней отправки]
+        self._last_prune = time.monotonic()
+
+    async def get_updates(self, *args, **kwargs):
+        # Цикл опроса telebot вызывает process_new_updates отдельной задачей и сразу
+        # идет за следующими обновлениями - притормаживаем его здесь
+        await self._has_room.wait()
+        return await super().get_updates(*args, **kwargs)
+
+    async def process_new_updates(self, updates):
+        # Каждое обновление - отдельная задача; порядок в чате держит блокировка чата.
+        # Здесь нет await: задачи создаются сразу и в порядке получения
+        for update in updates:
+            task = asyncio.create_task(self._process(update_key(update), update))
+            self._tasks.add(task)
+            task.add_done_callback(self._task_done)
+        if len(self._tasks) >= self.max_in_flight:
+            self._has_room.clear()
+
+    def _task_done(self, task):
+        self._tasks.discard(task)
+        if len(self._tasks) < self.max_in_flight:
+            self._has_room.set()
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ошибка задачи обработки обновления", exc_info=task.exception())
+
+    async def _process(self, key, update):
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await self._handle(update)
+        except Exception:
+            logger.exception("Ошибка обработки обновления")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def _handle(self, update):
+        app = self.app
+        message = update.message
+        if message is not None and message.text and not message.text.startswith('/'):
+            user_id = message.from_user.id
+            handler = app.router.resolve(message)
+            if handler is app.begin_test_button:
+                await self._timed(handler, self._begin_test(message, user_id))
+                return
+            if handler is app.handle_all_messages and user_id not in app.admin_states:
+                await self._timed(handler, self._answer(message, user_id))
+                return
+        # Остальное - прежними синхронными обработчиками (без шардов: порядок уже держим мы)
+        await self._run_sync(telebot.TeleBot.process_new_updates, app.bot, [update])
+
+    async def _timed(self, handler, coroutine):
+        # Быстрый путь попадает в ту же гистограмму, что и синхронный обработчик
+        started = time.perf_counter()
+        error = False
+        try:
+            await coroutine
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.app.handler_metrics.observe(handler.__name__, time.perf_counter() - started, error)
+
+    async def _run_sync(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._sync_executor, functools.partial(func, *args))
+
+    async def _mark_active(self, user_id):
+        if self.app.delivery_status.is_dead(user_id):
+            await self._run_sync(self.app.mark_user_active, user_id)
+
+    async def _acquire(self, limiter):
+        while True:
+            wait = limiter.try_acquire()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _chat_bucket(self, chat_id):
+        outbox = self.app.bot.outbox
+        now = time.monotonic()
+        if now - self._last_prune > 60:
+            # Ведро, которое уже наполнилось, можно забыть
+            self._last_prune = now
+            full_after = outbox.per_chat_burst / outbox.per_chat_rate
+            for stale in [key for key, (_, used) in self._chat_buckets.items() if now - used > full_after]:
+                del self._chat_buckets[stale]
+        entry = self._chat_buckets.get(chat_id)
+        if entry is None:
+            entry = self._chat_buckets[chat_id] = [TokenBucket(outbox.per_chat_rate, outbox.per_chat_burst), now]
+        entry[1] = now
+        return entry[0]
+
+    async def _send(self, chat_id, send):
+        """Выполнить send() с лимитами и повторами, как это делает Outbox"""
+        outbox = self.app.bot.outbox
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._acquire(self._chat_bucket(chat_id))
+            # Общий лимит отправки делим с очередью синхронного бота
+            await self._acquire(outbox.global_limiter)
+            try:
+                return await send()
+            except asyncio_helper.ApiTelegramException as e:
+                if e.error_code != 429 or attempt >= outbox.max_attempts:
+                    raise
+                retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                # Telegram ограничил весь бот - притормаживаем и синхронную очередь
+                outbox.global_limiter.pause(retry_after)
+            except (aiohttp.ClientError, asyncio.TimeoutError, asyncio_helper.RequestTimeout):
+                if attempt >= outbox.max_attempts:
+                    raise
+                await asyncio.sleep(outbox.backoff * 2 ** (attempt - 1))
+
+    async def _send_question(self, chat_id, question):
+        await self._send(chat_id, lambda: self.send_message(chat_id, question.prompt,
+                                                            reply_markup=question.keyboard))
+
+    async def _begin_test(self, message, user_id):
+        """Кнопка "Начать тест" без блокирующих вызовов в цикле событий"""
+        app = self.app
+        await self._mark_active(user_id)
+        try:
+            session_id = await self.adb.create_user_session(user_id)
+            await self._run_sync(app.open_test_session, user_id, session_id)
+            await self._send_question(message.chat.id, app.catalog_holder.current().by_position(1))
+        except Exception:
+            logger.exception("Ошибка в begin_test_button")
+            await self._send(message.chat.id, lambda: self.reply_to(
+                message, "❌ Произошла ошибка при запуске теста. Попробуйте еще раз."))
+
+    async def _answer(self, message, user_id):
+        """Ответ на вопрос теста"""
+        app = self.app
+        await self._mark_active(user_id)
+        # При первом обращении снимок каталога загружается из базы - не в цикле событий
+        outcome, question = await self._run_sync(app.accept_answer, user_id, message.text)
+        if outcome == app.ANSWER_NEXT:
+            await self._send_question(message.chat.id, question)
+        elif outcome == app.ANSWER_COMPLETE:
+            await self._run_sync(app.show_results, message)
+        else:
+            text = app.answer_reply(outcome, user_id)
+            await self._send(message.chat.id, lambda: self.reply_to(message, text))
+
+    async def shutdown(self):
+        # Задачи process_new_updates, созданные циклом опроса, завершаются сразу;
+        # ждем задачи обработки обновлений
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.close_session()
+        self._sync_executor.shutdown(wait=True)
+        self.adb.close()
+
+
+def run(app):
+    """Запустить бота в асинхронном режиме (app - модуль fixed_bot)"""
+    if app.Config.TELEGRAM_API_URL:
+        asyncio_helper.API_URL = app.Config.TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+    async_bot = AsyncItBot(
+        app,
+        app.Config.BOT_TOKEN,
+        db_workers=app.Config.ASYNC_DB_WORKERS,
+        sync_workers=app.Config.ASYNC_SYNC_WORKERS,
+        max_in_flight=app.Config.ASYNC_MAX_IN_FLIGHT
+    )
+
+    async def main():
+        try:
+            await async_bot.polling(non_stop=True)
+        finally:
+            await async_bot.shutdown()
+
+    asyncio.run(main())
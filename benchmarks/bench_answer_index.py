@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Стоимость проверки и подсчета одного ответа в зависимости от числа вариантов.
+
+Сравнивает старый путь (список допустимых ответов + поиск значения и категории
+перебором options) с индексами снимка каталога (answers / categories).
+
+Запуск: python -m benchmarks.bench_answer_index
+"""
+
+import timeit
+
+from catalog import QuestionCatalog
+
+CATEGORIES = ['code', 'data', 'design', 'security', 'devops', 'mobile', 'game', 'ai_ml']
+OPTION_COUNTS = [2, 4, 8, 32, 128, 512]
+REPEAT = 5
+NUMBER = 20000
+
+
+def make_question(option_count):
+    """Синтетический вопрос с заданным числом вариантов"""
+    options = []
+    for i in range(option_count):
+        options.append({
+            'text': f"Вариант ответа номер {i}",
+            'category': CATEGORIES[i % len(CATEGORIES)],
+            'value': i + 1,
+        })
+    return {'text': 'Синтетический вопрос', 'category': 'bench', 'options': options}
+
+
+def linear_answer(question, text):
+    """Старый путь из handle_all_messages + show_results"""
+    valid_answers = [option['text'] for option in question['options']]
+    if text not in valid_answers:
+        return None
+    value = next(option['value'] for option in question['options'] if option['text'] == text)
+    for option in question['options']:
+        if option['value'] == value:
+            return value, option['category']
+    return None
+
+
+def indexed_answer(question, text):
+    """Путь через индексы снимка каталога"""
+    answer = question.answers.get(text)
+    if answer is None:
+        return None
+    return answer[0], question.categories.get(answer[0])
+
+
+def best_ns(func, *args):
+    """Лучшее время одного вызова в наносекундах"""
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(repeat=REPEAT, number=NUMBER)) / NUMBER * 1e9
+
+
+def main():
+    print(f"{'вариантов':>10} {'перебор, нс':>14} {'индекс, нс':>12}")
+    for option_count in OPTION_COUNTS:
+        raw_question = make_question(option_count)
+        question = QuestionCatalog({1: raw_question}).by_position(1)
+        # Худший случай для перебора - последний вариант
+        text = raw_question['options'][-1]['text']
+        assert linear_answer(raw_question, text) == indexed_answer(question, text)
+
+        linear = best_ns(linear_answer, raw_question, text)
+        indexed = best_ns(indexed_answer, question, text)
+        print(f"{option_count:>10} {linear:>14.0f} {indexed:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
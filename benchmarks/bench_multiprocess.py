@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Масштабирование по процессам: WorkerPool из supervisor.py с 1..N процессами.
+
+Каждое сообщение - работа только на CPU, похожая на show_results: подсчет
+баллов по ответам, построение текста результатов и сериализация в JSON.
+Потоки здесь не помогают из-за GIL, а процессы должны давать почти линейный
+рост до числа ядер. Сообщения раздаются по ID пользователя, как обновления
+в supervisor.py.
+
+Запуск: python -m benchmarks.bench_multiprocess [--max-workers N]
+"""
+
+import argparse
+import json
+import os
+import time
+
+from supervisor import WorkerPool
+
+MESSAGES = 4000
+USERS = 500
+QUESTIONS = 30
+CATEGORIES = ('programming', 'security', 'design', 'analytics', 'devops', 'ai', 'testing', 'support')
+
+
+def results_work(user_id):
+    """Баллы по категориям, текст результатов и JSON - как при показе результатов"""
+    scores = dict.fromkeys(CATEGORIES, 0)
+    for question in range(QUESTIONS):
+        scores[CATEGORIES[(user_id + question * 7) % len(CATEGORIES)]] += (user_id * question) % 5
+    total = sum(scores.values()) or 1
+    lines = [f"🎯 Результаты пользователя {user_id}"]
+    for category, score in sorted(scores.items(), key=lambda item: -item[1]):
+        percentage = score * 100 / total
+        lines.append(f"• {category}: {score} баллов ({percentage:.1f}%) {'█' * int(percentage / 5)}")
+    text = "\n".join(lines)
+    return len(json.dumps({'user_id': user_id, 'scores': scores, 'text': text}, ensure_ascii=False))
+
+
+def bench_worker(index, workers, inbox, control):
+    control.put(('ready', index))
+    done = 0
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        for _ in range(20):
+            results_work(item)
+        done += 1
+    control.put(('done', done))
+
+
+def run(workers):
+    pool = WorkerPool(bench_worker, workers)
+    pool.start()
+    for _ in range(workers):
+        pool.control.get()
+
+    started = time.perf_counter()
+    for n in range(MESSAGES):
+        user_id = 100000 + n % USERS
+        pool.dispatch(user_id, user_id)
+    pool.stop()
+    elapsed = time.perf_counter() - started
+
+    processed = sum(pool.control.get()[1] for _ in range(workers))
+    assert processed == MESSAGES, processed
+    return elapsed, pool.dispatched
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    counts = sorted({1, 2, 4, 8, 16, args.max_workers} & set(range(1, args.max_workers + 1)))
+    print(f"Сообщений: {MESSAGES}, пользователей: {USERS}, ядер: {os.cpu_count()}")
+    print(f"{'процессов':>10} {'время, с':>10} {'сообщ/с':>10} {'ускорение':>10} {'эффективность':>14}")
+    base = None
+    for workers in counts:
+        elapsed, dispatched = run(workers)
+        rate = MESSAGES / elapsed
+        base = base or rate
+        speedup = rate / base
+        print(f"{workers:>10} {elapsed:>10.2f} {rate:>10.0f} {speedup:>9.2f}x {speedup / workers:>13.0%}"
+              f"   распределение: {min(dispatched)}..{max(dispatched)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Стоимость выбора обработчика в зависимости от числа зарегистрированных кнопок.
+
+Сравнивает цепочку фильтров в стиле telebot (перебор lambda по порядку) с
+Router из router.py. Худший случай - ответ на вопрос теста, который не
+совпадает ни с одной кнопкой и доходит до общего обработчика.
+
+Запуск: python -m benchmarks.bench_router
+"""
+
+import timeit
+from types import SimpleNamespace
+
+from router import Router, ROLE_ADMIN, ROLE_USER
+
+BUTTON_COUNTS = [10, 40, 160, 640, 2560]
+REPEAT = 5
+NUMBER = 5000
+
+admin_states = {1: {'state': 'admin_main'}}
+
+
+def build_chain(button_count):
+    """Цепочка фильтров: половина по тексту, половина по состоянию"""
+    chain = []
+    for i in range(button_count):
+        if i % 2:
+            text = f"Кнопка {i}"
+            chain.append((lambda message, text=text: message.text == text, i))
+        else:
+            state = f"state_{i}"
+            chain.append((lambda message, state=state: admin_states.get(message.from_user.id, {}).get('state') == state, i))
+    chain.append((lambda message: True, 'fallback'))
+    return chain
+
+
+def chain_dispatch(chain, message):
+    for test, handler in chain:
+        if test(message):
+            return handler
+
+
+def build_router(button_count):
+    router = Router(
+        state_getter=lambda user_id: admin_states.get(user_id, {}).get('state'),
+        role_getter=lambda user_id: ROLE_ADMIN if user_id in admin_states else ROLE_USER
+    )
+    for i in range(button_count):
+        if i % 2:
+            router.text(f"Кнопка {i}")(i)
+        else:
+            router.state(f"state_{i}")(i)
+    router.fallback('fallback')
+    return router
+
+
+def best_ns(func, *args):
+    timer = timeit.Timer(lambda: func(*args))
+    return min(timer.repeat(repeat=REPEAT, number=NUMBER)) / NUMBER * 1e9
+
+
+def main():
+    answer = SimpleNamespace(text='Вариант ответа', from_user=SimpleNamespace(id=2))
+    print(f"{'кнопок':>8} {'цепочка, нс':>14} {'router, нс':>12}")
+    for button_count in BUTTON_COUNTS:
+        chain = build_chain(button_count)
+        router = build_router(button_count)
+        assert chain_dispatch(chain, answer) == router.resolve(answer) == 'fallback'
+
+        chain_ns = best_ns(chain_dispatch, chain, answer)
+        router_ns = best_ns(router.resolve, answer)
+        print(f"{button_count:>8} {chain_ns:>14.0f} {router_ns:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
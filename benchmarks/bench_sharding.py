@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Пропускная способность обработки обновлений: один поток против шардов по чату.
+
+Обработчик имитирует типичный ответ на вопрос теста - немного работы на CPU и
+ожидание ввода-вывода (запрос к базе и отправка сообщения). Обновления
+распределяются по CHATS чатам; для шардов дополнительно проверяется, что
+сообщения каждого чата обработаны в исходном порядке.
+
+Запуск: python -m benchmarks.bench_sharding
+"""
+
+import threading
+import time
+
+import telebot
+
+from sharding import ShardedUpdatesMixin
+
+UPDATES = 2000
+CHATS = 200
+IO_SECONDS = 0.002
+WORKER_COUNTS = [1, 4, 8, 16, 32]
+
+
+class PlainBot(telebot.TeleBot):
+    pass
+
+
+class ShardedBot(ShardedUpdatesMixin, telebot.TeleBot):
+    pass
+
+
+def make_updates(count, chats):
+    """Синтетические обновления с текстовыми сообщениями"""
+    updates = []
+    for n in range(count):
+        chat_id = 100000 + n % chats
+        updates.append(telebot.types.Update.de_json({
+            'update_id': n + 1,
+            'message': {
+                'message_id': n + 1,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Test'},
+                'text': str(n),
+            },
+        }))
+    return updates
+
+
+def attach_handler(bot, seen):
+    lock = threading.Lock()
+
+    @bot.message_handler(func=lambda message: True)
+    def handle(message):
+        sum(range(200))
+        time.sleep(IO_SECONDS)
+        with lock:
+            seen.setdefault(message.chat.id, []).append(int(message.text))
+
+
+def run_plain(updates):
+    seen = {}
+    bot = PlainBot('1:bench', threaded=False)
+    attach_handler(bot, seen)
+    started = time.perf_counter()
+    # Как при опросе: пачками по 100 обновлений
+    for start in range(0, len(updates), 100):
+        bot.process_new_updates(updates[start:start + 100])
+    return time.perf_counter() - started, seen
+
+
+def run_sharded(updates, workers):
+    seen = {}
+    bot = ShardedBot('1:bench', update_workers=workers)
+    attach_handler(bot, seen)
+    started = time.perf_counter()
+    for start in range(0, len(updates), 100):
+        bot.process_new_updates(updates[start:start + 100])
+    bot.update_executor.join()
+    elapsed = time.perf_counter() - started
+    bot.update_executor.stop()
+    return elapsed, seen
+
+
+def in_order(seen):
+    return all(values == sorted(values) for values in seen.values())
+
+
+def main():
+    updates = make_updates(UPDATES, CHATS)
+    plain_seconds, seen = run_plain(updates)
+    assert in_order(seen)
+    print(f"{'режим':>14} {'обновл./с':>10} {'ускорение':>10} {'порядок':>8}")
+    print(f"{'один поток':>14} {UPDATES / plain_seconds:>10.0f} {1.0:>10.1f} {'да':>8}")
+    for workers in WORKER_COUNTS:
+        seconds, seen = run_sharded(updates, workers)
+        assert sum(len(values) for values in seen.values()) == UPDATES
+        print(f"{f'шардов: {workers}':>14} {UPDATES / seconds:>10.0f} "
+              f"{plain_seconds / seconds:>10.1f} {'да' if in_order(seen) else 'НЕТ':>8}")
+
+
+if __name__ == '__main__':
+    main()
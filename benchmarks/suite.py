@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Набор микробенчмарков горячих обработчиков бота с сохраненными базовыми замерами.
+
+Замеряются send_question, ответ на вопрос через handle_all_messages,
+show_results (первый показ, с сохранением результата), analyze_answers,
+show_all_universities_user, get_admin_statistics и sync_server.export_from_db
+на синтетических каталогах нескольких размеров (benchmarks/synthetic.py).
+Обработчики работают с базой в памяти, отправка сообщений подменена
+приемником без сети - замеряется только работа самого бота.
+
+Результат - медиана времени одного вызова в микросекундах по repeat
+повторам и шум замера: межквартильный размах повторов относительно медианы.
+send_question короче микросекунды, поэтому один вызов бенчмарка - это
+SEND_BATCH отправок подряд.
+
+Базовые значения хранятся в benchmarks/baseline.json вместе с шумом.
+Замедлением считается рост медианы больше max(--threshold, NOISE_FACTOR x
+шум базы или текущего замера): у коротких и шумных бенчмарков допуск шире.
+Сравнение завершается с кодом 1, если что-то замедлилось или бенчмарк с
+базовым значением не удалось запустить.
+
+Абсолютные времена зависят от машины, поэтому baseline.json сравним только с
+замерами на той же машине: базу записывают заново (--save-baseline) на
+сервере, где работает бот, или на машине CI, где идет проверка, и
+перезаписывают при смене железа или версии Python.
+
+Запуск:
+    python -m benchmarks.suite                     # замер и сравнение с baseline.json
+    python -m benchmarks.suite --save-baseline     # записать текущие значения как базовые
+    python -m benchmarks.suite --filter show_ --threshold 0.2
+"""
+
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+from benchmarks import synthetic
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+QUESTION_SIZES = [30, 120, 480]
+UNIVERSITY_SIZES = [50, 500, 5000]
+BENCH_USER_ID = 500000001
+SEND_BATCH = 100
+# Во сколько раз изменение должно превышать шум, чтобы считаться замедлением
+NOISE_FACTOR = 3
+
+_versions = itertools.count(1000)
+
+
+class BotFixture:
+    """fixed_bot с синтетической базой и отправкой сообщений без сети"""
+
+    def __init__(self, workdir):
+        # Служебные таблицы (результаты, статусы доставки) - во временной базе
+        os.environ.setdefault('BOT_TOKEN', '1:bench')
+        os.environ['BOT_DB_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ['BOT_SESSION_SNAPSHOT_PATH'] = os.path.join(workdir, 'sessions.snapshot')
+        os.environ['BOT_BROADCAST_STATE_PATH'] = os.path.join(workdir, 'broadcast.json')
+        # Замеры не зависят от настоящей базы: если database.queries нет, его заменяет синтетическая
+        synthetic.install_database_module()
+        import fixed_bot
+        from catalog import QuestionCatalog
+        self.app = fixed_bot
+        self._catalog_class = QuestionCatalog
+        self.sent_chars = 0
+
+        def sink(chat_id, text, *args, **kwargs):
+            self.sent_chars += len(text)
+
+        fixed_bot.bot.send_message = sink
+
+    def use(self, questions=30, universities=100):
+        """Подставить базу и каталог нужного размера"""
+        app = self.app
+        app.db = synthetic.SyntheticDatabase(questions, universities)
+        app.catalog_holder.install(self._catalog_class(app.db.get_all_questions(), next(_versions)))
+        app.refresh_specializations(notify=False)
+        return app
+
+    def finished_session(self):
+        """Сессия с ответами на все вопросы текущего каталога"""
+        app = self.app
+        catalog = app.catalog_holder.current()
+        session = app.Session(1, total_questions=catalog.total)
+        for question in catalog.questions:
+            option_index = question.position % len(question.options)
+            option = question.options[option_index]
+            session.record_answer(question.position, option_index, option.value, option.category)
+        session.current_question = catalog.total + 1
+        return session
+
+
+# ----- Бенчмарки: setup(size, fixture, workdir) возвращает функцию без аргументов -----
+
+def bench_send_question(size, fixture, workdir):
+    app = fixture.use(questions=size)
+    position = size // 2
+
+    def run():
+        for _ in range(SEND_BATCH):
+            app.send_question(BENCH_USER_ID, BENCH_USER_ID, position)
+
+    return run
+
+
+def bench_answer(size, fixture, workdir):
+    app = fixture.use(questions=size)
+    session = app.Session(1, total_questions=size)
+    app.user_sessions.put(BENCH_USER_ID, session)
+    position = size // 2
+    question = app.catalog_holder.current().by_position(position)
+    message = synthetic.make_message(BENCH_USER_ID, question.options[-1].text)
+
+    def run():
+        session.current_question = position
+        app.handle_all_messages(message)
+
+    return run
+
+
+def bench_show_results(size, fixture, workdir):
+    app = fixture.use(questions=size)
+    template = fixture.finished_session().to_bytes()
+    message = synthetic.make_message(BENCH_USER_ID, 'результаты')
+
+    def run():
+        # Каждый раз первый показ: подсчет, текст и сохранение результата
+        app.user_sessions.put(BENCH_USER_ID, app.Session.from_bytes(template))
+        app.show_results(message)
+
+    return run
+
+
+def bench_analyze_answers(size, fixture, workdir):
+    app = fixture.use(questions=size)
+    counts = app.as_dict(fixture.finished_session().counts)
+    return lambda: app.analyze_answers(counts)
+
+
+def bench_all_universities(size, fixture, workdir):
+    app = fixture.use(universities=size)
+    session = fixture.finished_session()
+    scores, counts = app.as_dict(session.scores), app.as_dict(session.counts)
+    percentages = dict.fromkeys(app.SPECIALIZATIONS, 0)
+    session.save_results(scores, counts, percentages, app.SPECIALIZATIONS[0])
+    session.show_all_universities = True
+    app.user_sessions.put(BENCH_USER_ID, session)
+    message = synthetic.make_message(BENCH_USER_ID, 'Все вузы')
+    return lambda: app.show_all_universities_user(message)
+
+
+def bench_admin_statistics(size, fixture, workdir):
+    app = fixture.use(universities=size)
+    # get_admin_statistics читает universities.json из текущего каталога
+    synthetic.write_universities_json(os.path.join(workdir, 'universities.json'), size)
+    return app.get_admin_statistics
+
+
+def bench_sync_export(size, fixture, workdir):
+    import sync_server
+    path = os.path.join(workdir, f'sync_{size}.db')
+    synthetic.write_sync_database(path, size)
+    sync_server.DB_PATH = path
+    return sync_server.export_from_db
+
+
+# (имя, размеры, setup, нужен ли fixed_bot)
+BENCHMARKS = [
+    (f'send_question_x{SEND_BATCH}', QUESTION_SIZES, bench_send_question, True),
+    ('answer', QUESTION_SIZES, bench_answer, True),
+    ('show_results', QUESTION_SIZES, bench_show_results, True),
+    ('analyze_answers', [30], bench_analyze_answers, True),
+    ('show_all_universities', UNIVERSITY_SIZES, bench_all_universities, True),
+    ('admin_statistics', UNIVERSITY_SIZES, bench_admin_statistics, True),
+    ('sync_export', UNIVERSITY_SIZES, bench_sync_export, False),
+]
+
+
+def measure_us(func, repeat):
+    """Медиана времени одного вызова в микросекундах и относительный шум"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(times)
+    q1, _, q3 = statistics.quantiles(times, n=4)
+    return median, (q3 - q1) / median
+
+
+def run_suite(name_filter=None, repeat=15):
+    """Замерить все бенчмарки; возвращает ({ключ: мкс}, {ключ: шум}, {ключ: причина пропуска})"""
+    results = {}
+    noise = {}
+    skipped = {}
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    cwd = os.getcwd()
+    fixture = None
+    fixture_error = None
+    try:
+        os.chdir(workdir)
+        for name, sizes, setup, needs_bot in BENCHMARKS:
+            if name_filter and name_filter not in name:
+                continue
+            if needs_bot and fixture is None and fixture_error is None:
+                try:
+                    sys.path.insert(0, cwd)
+                    fixture = BotFixture(workdir)
+                except Exception as e:
+                    fixture_error = f"fixed_bot не загружен: {e}"
+            for size in sizes:
+                key = f"{name}[{size}]"
+                if needs_bot and fixture is None:
+                    skipped[key] = fixture_error
+                    continue
+                # Служебные print при подготовке в вывод замеров не попадают
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    func = setup(size, fixture, workdir)
+                    func()
+                    results[key], noise[key] = measure_us(func, repeat)
+                print(f"  {key:<32} {results[key]:>12.1f} мкс  ±{noise[key]:.0%}")
+    finally:
+        os.chdir(cwd)
+    return results, noise, skipped
+
+
+def load_baseline(path=BASELINE_PATH):
+    """Базовые значения: ({ключ: мкс}, {ключ: шум})"""
+    if not os.path.exists(path):
+        return {}, {}
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return data.get('results', {}), data.get('noise', {})
+
+
+def save_baseline(results, noise, path=BASELINE_PATH):
+    """Записать замеры; значения бенчмарков, которые не запускались, сохраняются"""
+    merged, merged_noise = load_baseline(path)
+    merged.update((key, round(value, 1)) for key, value in results.items())
+    merged_noise.update((key, round(value, 3)) for key, value in noise.items())
+    data = {
+        'meta': {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor() or platform.machine(),
+        },
+        'results': dict(sorted(merged.items())),
+        'noise': dict(sorted(merged_noise.items())),
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+
+
+def compare(results, noise, baseline, baseline_noise, threshold):
+    """Таблица сравнения; возвращает список замедлившихся ключей"""
+    regressions = []
+    print(f"{'бенчмарк':<32} {'база, мкс':>12} {'сейчас, мкс':>12} {'изменение':>10} {'допуск':>8}")
+    for key, current in results.items():
+        base = baseline.get(key)
+        if base is None:
+            print(f"{key:<32} {'-':>12} {current:>12.1f} {'новый':>10}")
+            continue
+        change = current / base - 1
+        tolerance = max(threshold, NOISE_FACTOR * max(noise.get(key, 0), baseline_noise.get(key, 0)))
+        mark = ''
+        if change > tolerance:
+            mark = '  ⚠️ медленнее'
+            regressions.append(key)
+        elif change < -tolerance:
+            mark = '  ✅ быстрее'
+        print(f"{key:<32} {base:>12.1f} {current:>12.1f} {change:>+10.1%} {tolerance:>8.0%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих обработчиков бота")
+    parser.add_argument('--filter', help="только бенчмарки, в имени которых есть эта строка")
+    parser.add_argument('--repeat', type=int, default=15, help="повторов на бенчмарк (медиана)")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="наименьший допуск замедления относительно базы (0.10 = 10%%); "
+                             "у шумных бенчмарков допуск шире")
+    parser.add_argument('--save-baseline', action='store_true', help="сохранить замеры как базовые")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    print("⏱️ Замеры:")
+    results, noise, skipped = run_suite(args.filter, args.repeat)
+    for key, reason in skipped.items():
+        print(f"  {key:<32} пропущен ({reason})")
+
+    if args.save_baseline:
+        save_baseline(results, noise, args.baseline)
+        print(f"💾 Базовые значения сохранены: {args.baseline}")
+        return 0
+
+    print()
+    baseline, baseline_noise = load_baseline(args.baseline)
+    regressions = compare(results, noise, baseline, baseline_noise, args.threshold)
+    # Пропущенный бенчмарк с базовым значением - тоже провал: иначе проверка проходит без замеров
+    missing = [key for key in skipped if key in baseline]
+    if missing:
+        print(f"\n⚠️ Не замерены ({len(missing)}): {', '.join(missing)}")
+    if regressions:
+        print(f"\n⚠️ Замедлились ({len(regressions)}): {', '.join(regressions)}")
+    return 1 if regressions or missing else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
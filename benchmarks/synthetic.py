@@ -0,0 +1,160 @@
+"""
+Синтетические данные для benchmarks.suite.
+
+Каталог вопросов, специализации и вузы заданного размера, база в памяти с теми
+методами Database, которые вызывают замеряемые обработчики, и SQLite-файл со
+схемой, которую читает sync_server.export_from_db.
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import types
+from types import SimpleNamespace
+
+from scoring import CATEGORIES, SPECIALIZATIONS
+
+CITIES = ['Москва', 'Санкт-Петербург', 'Новосибирск', 'Екатеринбург', 'Казань',
+          'Нижний Новгород', 'Самара', 'Томск', 'Пермь', 'Воронеж']
+
+
+def make_questions(count, options=4):
+    """{id: вопрос} в формате Database.get_all_questions"""
+    questions = {}
+    for question_id in range(1, count + 1):
+        questions[question_id] = {
+            'text': f"Синтетический вопрос номер {question_id}: что вам ближе?",
+            'category': CATEGORIES[question_id % len(CATEGORIES)],
+            'options': [
+                {
+                    'text': f"Вариант {question_id}.{n}",
+                    'category': CATEGORIES[(question_id + n) % len(CATEGORIES)],
+                    'value': n + 1,
+                }
+                for n in range(options)
+            ],
+        }
+    return questions
+
+
+def make_specializations():
+    """{код: специализация} в формате Database.get_specialization_from_code"""
+    return {
+        name: {
+            'id': spec_id,
+            'name': name,
+            'description': f"Описание специализации «{name}». " * 5,
+            'skills': "• Навык 1\n• Навык 2\n• Навык 3",
+            'careers': "• Профессия 1\n• Профессия 2",
+        }
+        for spec_id, name in enumerate(SPECIALIZATIONS, 1)
+    }
+
+
+def make_universities(count, specialization_id=1):
+    return [
+        {
+            'name': f"Университет {n}",
+            'city': CITIES[n % len(CITIES)],
+            'score_min': 150 + n % 100,
+            'score_max': 250 + n % 50,
+            'url': f"https://university{n}.example",
+            'specialization_id': specialization_id,
+        }
+        for n in range(count)
+    ]
+
+
+class SyntheticDatabase:
+    """Database в памяти: только методы, которые вызывают замеряемые обработчики"""
+
+    def __init__(self, questions=30, universities=100):
+        self.questions = make_questions(questions)
+        self.specializations = make_specializations()
+        self.universities = {
+            spec['id']: make_universities(universities, spec['id'])
+            for spec in self.specializations.values()
+        }
+        self._sessions = 0
+
+    def get_all_questions(self):
+        return self.questions
+
+    def get_all_specializations(self):
+        return {spec['id']: spec for spec in self.specializations.values()}
+
+    def get_specialization_from_code(self, code):
+        return self.specializations.get(code)
+
+    def get_universities_by_specialization(self, specialization_id):
+        return self.universities.get(specialization_id, [])
+
+    def get_all_users(self):
+        return list(range(1, 10001))
+
+    def get_user_statistics(self):
+        return {'total_users': 10000, 'active_sessions': 250, 'completed_tests': 7000}
+
+    def create_user_session(self, user_id):
+        self._sessions += 1
+        return self._sessions
+
+    def update_user_answers(self, user_id, question_id, answer_value):
+        return True
+
+
+def install_database_module():
+    """Подставить database.queries с SyntheticDatabase, если настоящего модуля нет.
+
+    fixed_bot создает Database(Config.DB_URL) при импорте; замеряемые
+    обработчики все равно работают с базой, которую подставляет BotFixture.
+    """
+    try:
+        import database.queries  # noqa: F401
+        return False
+    except ImportError:
+        pass
+    package = types.ModuleType('database')
+    package.__path__ = []
+    queries = types.ModuleType('database.queries')
+    queries.Database = lambda db_url: SyntheticDatabase()
+    package.queries = queries
+    sys.modules['database'] = package
+    sys.modules['database.queries'] = queries
+    return True
+
+
+def write_universities_json(path, count):
+    """universities.json для get_admin_statistics"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(make_universities(count), f, ensure_ascii=False)
+
+
+def write_sync_database(path, count):
+    """SQLite со схемой, которую читает sync_server.export_from_db"""
+    if os.path.exists(path):
+        os.remove(path)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE specializations (id INTEGER PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE universities (id INTEGER PRIMARY KEY, name TEXT, city TEXT, "
+                 "score_min INTEGER, score_max INTEGER, url TEXT, specialization_id INTEGER)")
+    conn.executemany("INSERT INTO specializations (id, name) VALUES (?, ?)",
+                     list(enumerate(SPECIALIZATIONS, 1)))
+    conn.executemany(
+        "INSERT INTO universities (name, city, score_min, score_max, url, specialization_id) "
+        "VALUES (:name, :city, :score_min, :score_max, :url, :specialization_id)",
+        [dict(uni, specialization_id=n % len(SPECIALIZATIONS) + 1)
+         for n, uni in enumerate(make_universities(count))]
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_message(user_id, text):
+    """Объект с полями сообщения, которые читают обработчики"""
+    user = SimpleNamespace(id=user_id, first_name='Bench', username=None)
+    return SimpleNamespace(
+        message_id=1, text=text, from_user=user,
+        chat=SimpleNamespace(id=user_id, type='private'), content_type='text'
+    )
@@ -0,0 +1,314 @@
+"""
+Фоновая рассылка сообщений всем пользователям или сегменту аудитории.
+
+Раньше broadcast_process отправлял сообщения по одному прямо в обработчике
+админа: рассылка на 100 тысяч пользователей на часы занимала поток опроса
+и не учитывала лимит Telegram (~30 сообщений в секунду). BroadcastManager
+выполняет рассылку в фоне пулом потоков, а прогресс сохраняет в JSON-файл,
+поэтому после перезапуска бота рассылка продолжается с места остановки.
+Лимиты частоты и повторы после 429 и сетевых ошибок - забота Outbox
+(см. outbox.py): сообщения рассылки идут в нем с приоритетом bulk.
+
+Пользователи, заблокировавшие бота (см. delivery_status.py), в рассылку не
+попадают; сэкономленные отправки учитываются в счетчике skipped.
+
+Получатели читаются потоком из источника (см. user_source.py) по
+возрастанию ID и раздаются потокам через ограниченную очередь. В файле
+хранится cursor - ID, до которого (включительно) все сообщения уже
+обработаны; после перезапуска повторно могут уйти только сообщения,
+отправлявшиеся в момент остановки.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+import outbox
+
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_CANCELLED = 'cancelled'
+
+
+class BroadcastJob:
+    """Состояние одной рассылки (сохраняется в файл целиком)"""
+
+    FIELDS = ('job_id', 'text', 'admin_chat_id', 'segment', 'progress_message_id', 'status',
+              'cursor', 'total', 'sent', 'failed', 'dead', 'skipped', 'started_at', 'finished_at')
+
+    def __init__(self, text, admin_chat_id, job_id=None, segment=None):
+        self.job_id = job_id or int(time.time())
+        self.text = text
+        self.admin_chat_id = admin_chat_id
+        self.segment = segment      # описание сегмента аудитории (None - все пользователи)
+        self.progress_message_id = None
+        self.status = STATUS_RUNNING
+        self.cursor = None
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.dead = 0       # получатели, оказавшиеся недоступными в этой рассылке
+        self.skipped = 0    # заранее исключенные недоступные получатели
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def processed(self):
+        return self.sent + self.failed + self.skipped
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, data):
+        job = cls(data['text'], data['admin_chat_id'], data['job_id'])
+        for field in cls.FIELDS:
+            if field in data:
+                setattr(job, field, data[field])
+        return job
+
+
+class BroadcastManager:
+    """Запускает рассылки, следит за прогрессом и продолжает их после перезапуска"""
+
+    def __init__(self, bot, audience_for, state_path, workers=8,
+                 progress_interval=5.0, delivery_status=None):
+        # audience_for(segment) -> источник получателей с count(after) и iter_ids(after),
+        # см. user_source.py и segments.py
+        # delivery_status - DeliveryStatusStore для исключения недоступных получателей
+        self.bot = bot
+        self.audience_for = audience_for
+        self.delivery_status = delivery_status
+        self.state_path = state_path
+        self.workers = workers
+        self.progress_interval = progress_interval
+        self.job = None
+        self._lock = threading.Lock()
+        self._cancel = threading.Event()
+        self._thread = None
+        self._run_started = 0.0
+        self._run_processed = 0
+
+    # ----- Управление -----
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, text, admin_chat_id, segment=None, audience=None):
+        """Запустить новую рассылку; RuntimeError, если предыдущая еще идет.
+
+        audience - уже созданный источник получателей сегмента (например, после
+        подсчета получателей для админа); None - взять audience_for(segment).
+        """
+        with self._lock:
+            if self.is_running():
+                raise RuntimeError("Рассылка уже выполняется")
+            job = BroadcastJob(text, admin_chat_id, segment=segment)
+            self._launch(job, audience)
+            return job
+
+    def resume(self):
+        """Продолжить незавершенную рассылку из файла состояния (при старте бота)"""
+        if not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, 'r', encoding='utf-8') as f:
+            job = BroadcastJob.from_dict(json.load(f))
+        if job.status != STATUS_RUNNING:
+            return None
+        with self._lock:
+            if self.is_running():
+                return None
+            self._launch(job)
+            return job
+
+    def cancel(self):
+        """Остановить текущую рассылку (уже отправленное не отменяется)"""
+        if not self.is_running():
+            return False
+        self._cancel.set()
+        return True
+
+    def _launch(self, job, audience=None):
+        self.job = job
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._run, args=(job, audience), name='broadcast', daemon=True)
+        self._thread.start()
+
+    # ----- Выполнение -----
+
+    def _run(self, job, audience=None):
+        try:
+            if audience is None:
+                audience = self.audience_for(job.segment)
+            # Количество нужно только для процентов и ETA; сами ID читаются потоком
+            job.total = job.processed + audience.count(job.cursor)
+            self._run_started = time.monotonic()
+            self._run_processed = job.processed
+            if job.progress_message_id is None:
+                self._send_progress(job)
+            self._save(job)
+
+            tasks = queue.Queue(maxsize=self.workers * 4)
+            pending = {}      # индекс -> ID получателя, еще не вошедшего в cursor
+            completed = set()
+            watermark = [-1]  # индекс последнего получателя, до которого все обработано
+            progress_lock = threading.Lock()
+
+            def complete(index):
+                # Вызывается под progress_lock
+                completed.add(index)
+                while watermark[0] + 1 in completed:
+                    watermark[0] += 1
+                    completed.discard(watermark[0])
+                    job.cursor = pending.pop(watermark[0])
+
+            def worker():
+                # Сообщения рассылки пропускают вперед ответы пользователям (см. outbox.py)
+                with outbox.bulk():
+                    while True:
+                        item = tasks.get()
+                        if item is None:
+                            return
+                        handle(*item)
+
+            def handle(index, chat_id):
+                outcome = self._deliver(job, chat_id)
+                with progress_lock:
+                    if outcome is True:
+                        job.sent += 1
+                    else:
+                        job.failed += 1
+                        if outcome:
+                            job.dead += 1
+                    complete(index)
+
+            threads = [threading.Thread(target=worker, name=f'broadcast-{n}', daemon=True)
+                       for n in range(self.workers)]
+            for thread in threads:
+                thread.start()
+
+            last_report = time.monotonic()
+            for index, chat_id in enumerate(audience.iter_ids(job.cursor)):
+                if self._cancel.is_set():
+                    break
+                with progress_lock:
+                    pending[index] = chat_id
+                    # Недоступных получателей не отправляем, но курсор двигаем
+                    if self.delivery_status is not None and self.delivery_status.is_dead(chat_id):
+                        job.skipped += 1
+                        complete(index)
+                        continue
+                tasks.put((index, chat_id))
+                if time.monotonic() - last_report >= self.progress_interval:
+                    last_report = time.monotonic()
+                    with progress_lock:
+                        self._save(job)
+                    self._update_progress(job)
+
+            for _ in threads:
+                tasks.put(None)
+            for thread in threads:
+                thread.join()
+
+            job.status = STATUS_CANCELLED if self._cancel.is_set() else STATUS_DONE
+            job.finished_at = time.time()
+            self._save(job)
+            self._update_progress(job)
+        except Exception as e:
+            print(f"❌ Ошибка рассылки: {e}")
+            try:
+                self._save(job)
+            except Exception as save_error:
+                print(f"❌ Ошибка сохранения состояния рассылки: {save_error}")
+
+    def _deliver(self, job, chat_id):
+        """Отправить сообщение одному получателю.
+
+        True при успехе, статус получателя, если он недоступен, иначе False.
+        Ожидание лимита и повторы выполняет Outbox; здесь ошибка только
+        классифицируется.
+        """
+        try:
+            self.bot.send_message(chat_id, f"📢 Сообщение от администратора:\n\n{job.text}",
+                                  disable_web_page_preview=True)
+            return True
+        except ApiTelegramException as e:
+            if self.delivery_status is not None:
+                return self.delivery_status.record_failure(chat_id, e) or False
+            return False
+        except Exception:
+            return False
+
+    # ----- Состояние и прогресс -----
+
+    def _save(self, job):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job.to_dict(), f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def status(self):
+        """Сводка по текущей (или последней) рассылке"""
+        job = self.job
+        if job is None:
+            return None
+        elapsed = time.monotonic() - self._run_started if self._run_started else 0.0
+        done_in_run = job.processed - self._run_processed
+        rate = done_in_run / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, job.total - job.processed)
+        return {
+            'status': job.status,
+            'total': job.total,
+            'processed': job.processed,
+            'sent': job.sent,
+            'failed': job.failed,
+            'dead': job.dead,
+            'skipped': job.skipped,
+            'percent': job.processed * 100 // job.total if job.total else 100,
+            'rate': rate,
+            'eta_seconds': remaining / rate if rate > 0 else None,
+        }
+
+    def progress_text(self):
+        """Текст сообщения с прогрессом для администратора"""
+        status = self.status()
+        if status is None:
+            return "📢 Рассылок еще не было"
+        titles = {
+            STATUS_RUNNING: "📢 Рассылка выполняется",
+            STATUS_DONE: "✅ Рассылка завершена",
+            STATUS_CANCELLED: "⛔ Рассылка остановлена",
+        }
+        text = (f"{titles.get(status['status'], status['status'])}\n\n"
+                f"📬 Обработано: {status['processed']} из {status['total']} ({status['percent']}%)\n"
+                f"✅ Доставлено: {status['sent']}\n"
+                f"❌ Ошибок: {status['failed']} (из них недоступны: {status['dead']})\n"
+                f"🚫 Пропущено недоступных: {status['skipped']}\n"
+                f"⚡ Скорость: {status['rate']:.1f} сообщ./с")
+        if status['status'] == STATUS_RUNNING and status['eta_seconds'] is not None:
+            minutes, seconds = divmod(int(status['eta_seconds']), 60)
+            text += f"\n⏳ Осталось: ~{minutes} мин {seconds} с"
+        return text
+
+    def _send_progress(self, job):
+        try:
+            sent = self.bot.send_message(job.admin_chat_id, self.progress_text())
+            job.progress_message_id = sent.message_id
+        except Exception as e:
+            print(f"❌ Ошибка отправки прогресса рассылки: {e}")
+
+    def _update_progress(self, job):
+        if job.progress_message_id is None:
+            return
+        try:
+            self.bot.edit_message_text(self.progress_text(), job.admin_chat_id, job.progress_message_id)
+        except Exception:
+            # "message is not modified" и подобное не мешает рассылке
+            pass
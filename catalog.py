@@ -0,0 +1,132 @@
+"""
+Снимок каталога вопросов теста.
+
+Каталог собирается один раз из db.get_all_questions() и дальше не меняется:
+при добавлении или удалении вопроса админом строится новый снимок и целиком
+подменяет старый. Обработчики ответов читают только текущий снимок и не ходят
+в базу данных.
+"""
+
+import threading
+import zlib
+from collections import namedtuple
+
+from telebot import types
+
+# Вариант ответа и вопрос в снимке (неизменяемые)
+CatalogOption = namedtuple('CatalogOption', ['text', 'category', 'value'])
+CatalogQuestion = namedtuple('CatalogQuestion', [
+    'id', 'position', 'text', 'category', 'options',
+    'answers',      # текст варианта -> (value, category, индекс варианта)
+    'categories',   # value варианта -> category
+    'prompt',       # готовый текст сообщения с заголовком "Вопрос N/M"
+    'keyboard',     # готовая JSON-клавиатура с вариантами ответа
+])
+
+
+def build_keyboard(options):
+    """Сериализованная клавиатура: по одной кнопке-варианту в ряд"""
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    for option in options:
+        markup.add(types.KeyboardButton(option.text))
+    return markup.to_json()
+
+
+def catalog_fingerprint(questions):
+    """Контрольная сумма порядка вопросов и их вариантов.
+
+    Ответы в сессиях хранятся индексами вариантов по позициям, поэтому они
+    совместимы только со снимком с тем же отпечатком.
+    """
+    checksum = 0
+    for question in questions:
+        checksum = zlib.crc32(str(question.id).encode(), checksum)
+        for option in question.options:
+            checksum = zlib.crc32(b'\0' + option.text.encode('utf-8'), checksum)
+        checksum = zlib.crc32(b'\n', checksum)
+    return checksum
+
+
+class QuestionCatalog:
+    """Неизменяемый упорядоченный снимок вопросов"""
+
+    __slots__ = ('version', 'questions', 'positions', 'total', 'fingerprint')
+
+    def __init__(self, questions_dict, version=0):
+        questions = []
+        total = len(questions_dict)
+        for position, question_id in enumerate(sorted(questions_dict.keys()), 1):
+            question = questions_dict[question_id]
+            options = tuple(
+                CatalogOption(option['text'], option.get('category'), option.get('value'))
+                for option in question.get('options', [])
+            )
+            # Индексы для проверки и подсчета ответа одним обращением к словарю.
+            # При совпадении текста или значения побеждает первый вариант,
+            # как и при линейном поиске по списку.
+            answers = {}
+            categories = {}
+            for option_index, option in enumerate(options):
+                answers.setdefault(option.text, (option.value, option.category, option_index))
+                categories.setdefault(option.value, option.category)
+            # Сообщение с вопросом собирается один раз на снимок
+            prompt = f"❓ Вопрос {position}/{total}:\n\n{question['text']}"
+            questions.append(CatalogQuestion(
+                question_id, position, question['text'], question.get('category'), options,
+                answers, categories, prompt, build_keyboard(options)
+            ))
+
+        self.version = version
+        self.questions = tuple(questions)
+        self.positions = {question.id: question.position for question in self.questions}
+        self.total = total
+        self.fingerprint = catalog_fingerprint(self.questions)
+
+    def by_position(self, position):
+        """Вопрос по порядковому номеру (с 1) или None"""
+        if 1 <= position <= self.total:
+            return self.questions[position - 1]
+        return None
+
+    def by_id(self, question_id):
+        """Вопрос по ID из базы данных или None"""
+        position = self.positions.get(question_id)
+        if position is None:
+            return None
+        return self.questions[position - 1]
+
+
+class CatalogHolder:
+    """Хранит текущий снимок каталога и подменяет его при изменениях"""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._version = 0
+
+    def current(self):
+        """Текущий снимок; при первом обращении загружается из базы"""
+        catalog = self._catalog
+        if catalog is None:
+            catalog = self.reload()
+        return catalog
+
+    def reload(self):
+        """Загрузить вопросы заново и атомарно подменить снимок"""
+        with self._lock:
+            questions_dict = self._loader()
+            self._version += 1
+            catalog = QuestionCatalog(questions_dict, self._version)
+            self._catalog = catalog
+        return catalog
+
+    def install(self, catalog):
+        """Использовать готовый снимок (загруженный другим процессом)"""
+        with self._lock:
+            self._version = max(self._version, catalog.version)
+            self._catalog = catalog
+
+    def invalidate(self):
+        """Сбросить снимок: следующий current() перечитает базу"""
+        self._catalog = None
@@ -1,11 +1,85 @@
 # Bot configuration
 
+import os
+
 class Config:
-	# Telegram bot token
-	BOT_TOKEN = "8169709719:AAHrr2koPWiqGwOCD_fjp0TgnpgIbbx7maM"
+	# Telegram bot token (BOT_TOKEN in the environment overrides it, e.g. for fake_telegram.py)
+	BOT_TOKEN = os.environ.get("BOT_TOKEN", "8169709719:AAHrr2koPWiqGwOCD_fjp0TgnpgIbbx7maM")
+
+	# Bot API server, e.g. http://127.0.0.1:8081 for fake_telegram.py (empty - api.telegram.org)
+	TELEGRAM_API_URL = os.environ.get("TELEGRAM_API_URL", "")
 
 	# Admin user IDs
 	ADMIN_IDS = {6589814866, 1215743664}
 
 	# SQLAlchemy database URL
-	DB_URL = "sqlite:///database/bot_new.db" 
\ No newline at end of file
+	DB_URL = os.environ.get("BOT_DB_URL", "sqlite:///database/bot_new.db")
+
+	# In-memory test sessions: max sessions kept and idle time before eviction (seconds)
+	SESSION_MAX_SIZE = 100000
+	SESSION_IDLE_TTL = 7 * 24 * 3600
+
+	# Write-behind for test answers: flush after this many updates or seconds
+	ANSWER_BATCH_SIZE = 200
+	ANSWER_FLUSH_INTERVAL = 1.0
+
+	# Session snapshots: file path (BOT_SESSION_SNAPSHOT_PATH in the environment overrides it) and how often to write it (seconds)
+	SESSION_SNAPSHOT_PATH = os.environ.get("BOT_SESSION_SNAPSHOT_PATH", "database/sessions.snapshot")
+	SESSION_SNAPSHOT_INTERVAL = 60
+
+	# Broadcasts: progress file and sender threads (rate limits are the outbox's)
+	BROADCAST_STATE_PATH = os.environ.get("BOT_BROADCAST_STATE_PATH", "database/broadcast.json")
+	BROADCAST_WORKERS = 8
+
+	# Broadcast audience: users table and its Telegram ID column to stream "all users" page by page;
+	# checked at startup - if the table or column is missing (or USERS_TABLE is empty), db.get_all_users() is used
+	USERS_TABLE = "users"
+	USERS_ID_COLUMN = "telegram_id"
+	BROADCAST_PAGE_SIZE = 1000
+
+	# Test counts as abandoned for broadcasts after this many seconds without finishing
+	BROADCAST_ABANDONED_AFTER = 24 * 3600
+
+	# Outgoing queue: messages per second for the bot and per chat, per-chat burst, sender threads
+	OUTBOX_GLOBAL_RATE = 30
+	OUTBOX_PER_CHAT_RATE = 1
+	OUTBOX_PER_CHAT_BURST = 3
+	OUTBOX_WORKERS = 8
+
+	# Threads processing incoming updates; each chat is always handled by the same thread
+	UPDATE_WORKERS = 8
+
+	# Runtime: "sync" (TeleBot) or "async" (AsyncTeleBot); async mode thread pools for DB and sync handlers
+	BOT_MODE = "sync"
+	ASYNC_DB_WORKERS = 4
+	ASYNC_SYNC_WORKERS = 16
+	# Async mode: updates processed at once; over the limit reading new updates waits
+	ASYNC_MAX_IN_FLIGHT = 1024
+
+	# Webhook mode: local listen address and path, public URL registered with Telegram
+	# (empty - the webhook is set up externally), secret token checked on every request
+	WEBHOOK_HOST = "127.0.0.1"
+	WEBHOOK_PORT = 8443
+	WEBHOOK_PATH = "/webhook"
+	WEBHOOK_URL = ""
+	WEBHOOK_SECRET = ""
+	# Updates being processed at once (over the limit Telegram gets 503 and retries), connections Telegram may open
+	WEBHOOK_MAX_IN_FLIGHT = 256
+	WEBHOOK_MAX_CONNECTIONS = 40
+
+	# supervisor.py: number of worker processes (0 - one per CPU core)
+	SUPERVISOR_WORKERS = 0
+
+	# Prometheus-style /metrics endpoint (0 - disabled)
+	METRICS_HOST = "127.0.0.1"
+	METRICS_PORT = 9108
+
+	# Logging: level (LOG_LEVEL in the environment overrides it) and share of frequent debug events kept
+	LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+	LOG_SAMPLING = {"message": 0.01, "answer": 0.01, "results": 0.1}
+
+	# Sampling profiler started from the admin panel: window length (seconds) and sampling interval
+	PROFILER_DURATION = 30
+	PROFILER_INTERVAL = 0.01
+	# Keep stacks of threads idling in wait/queue.get/select (they usually hide handler time)
+	PROFILER_INCLUDE_IDLE = False
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""
+Учет недоступных получателей рассылок.
+
+Пользователи, заблокировавшие бота или удалившие аккаунт, при каждой
+рассылке стоили полный запрос к API и просто увеличивали счетчик ошибок.
+DeliveryStatusStore запоминает такие исходы в таблице delivery_status
+(blocked / deactivated / chat_not_found), держит множество недоступных ID
+в памяти и исключает их из рассылок. Если пользователь снова пишет боту,
+запись удаляется.
+
+Копия в памяти своя у каждого процесса (см. supervisor.py): об изменениях
+store сообщает через change_hooks, а изменения из других процессов
+принимает apply().
+"""
+
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from storage import connect
+
+STATUS_BLOCKED = 'blocked'
+STATUS_DEACTIVATED = 'deactivated'
+STATUS_CHAT_NOT_FOUND = 'chat_not_found'
+
+# Фрагменты описания ошибки Telegram -> статус получателя
+_DESCRIPTIONS = (
+    ('bot was blocked by the user', STATUS_BLOCKED),
+    ('user is deactivated', STATUS_DEACTIVATED),
+    ('chat not found', STATUS_CHAT_NOT_FOUND),
+    ('user not found', STATUS_CHAT_NOT_FOUND),
+    ("bot can't initiate conversation", STATUS_CHAT_NOT_FOUND),
+)
+
+
+def classify_error(error):
+    """Статус недоступного получателя по исключению отправки или None"""
+    if not isinstance(error, ApiTelegramException) or error.error_code not in (400, 403):
+        return None
+    description = (error.description or '').lower()
+    for fragment, status in _DESCRIPTIONS:
+        if fragment in description:
+            return status
+    return None
+
+
+class DeliveryStatusStore:
+    """Таблица недоступных получателей и ее копия в памяти"""
+
+    def __init__(self, db_url):
+        self.db_url = db_url
+        self._lock = threading.Lock()
+        self._dead = {}
+        # hook(user_id, status) после записи в базу; status None - пользователь снова доступен
+        self.change_hooks = []
+        self._ensure_schema()
+        self._load()
+
+    def _ensure_schema(self):
+        conn = connect(self.db_url)
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS delivery_status (
+                    user_id INTEGER PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    description TEXT,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _load(self):
+        conn = connect(self.db_url)
+        try:
+            rows = conn.execute("SELECT user_id, status FROM delivery_status").fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            self._dead = dict(rows)
+
+    def is_dead(self, user_id):
+        return user_id in self._dead
+
+    def apply(self, user_id, status):
+        """Обновить копию в памяти по изменению, уже записанному в базу другим процессом"""
+        with self._lock:
+            if status is None:
+                self._dead.pop(user_id, None)
+            else:
+                self._dead[user_id] = status
+
+    def _notify(self, user_id, status):
+        for hook in self.change_hooks:
+            hook(user_id, status)
+
+    def mark_dead(self, user_id, status, description=None):
+        """Запомнить, что получателю нельзя доставить сообщение"""
+        conn = connect(self.db_url)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO delivery_status (user_id, status, description, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (user_id, status, description, time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._dead[user_id] = status
+        self._notify(user_id, status)
+
+    def record_failure(self, user_id, error):
+        """Учесть ошибку отправки; возвращает статус, если получатель недоступен"""
+        status = classify_error(error)
+        if status is not None:
+            self.mark_dead(user_id, status, getattr(error, 'description', None))
+        return status
+
+    def revive(self, user_id):
+        """Пользователь снова пишет боту - он опять доступен для рассылок"""
+        # Быстрая проверка без обращения к базе: вызывается на каждое сообщение
+        if user_id not in self._dead:
+            return False
+        conn = connect(self.db_url)
+        try:
+            conn.execute("DELETE FROM delivery_status WHERE user_id = ?", (user_id,))
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._dead.pop(user_id, None)
+        self._notify(user_id, None)
+        return True
+
+    def stats(self):
+        """Количество недоступных получателей по статусам"""
+        with self._lock:
+            statuses = list(self._dead.values())
+        return {
+            'total': len(statuses),
+            STATUS_BLOCKED: statuses.count(STATUS_BLOCKED),
+            STATUS_DEACTIVATED: statuses.count(STATUS_DEACTIVATED),
+            STATUS_CHAT_NOT_FOUND: statuses.count(STATUS_CHAT_NOT_FOUND),
+        }
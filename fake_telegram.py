@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Telegram Bot API для нагрузочных и интеграционных тестов.
+
+Реализует методы, которыми пользуется бот: getMe, getUpdates (с долгим
+опросом), sendMessage, editMessageText, answerCallbackQuery, sendDocument,
+sendChatAction, setWebhook/deleteWebhook. Обновления от «пользователей»
+добавляются через push_message / push_callback, а все исходящие вызовы бота
+записываются и доступны через sent_to / wait_for_messages.
+
+Для воспроизводимых замеров можно задать задержку ответа (latency и разброс
+jitter) и долю ответов 429 (rate_limit_ratio, seed для генератора).
+
+Запуск отдельно:
+    python fake_telegram.py --port 8081 --latency 0.05 --rate-limit 0.01
+и бот против него:
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_TOKEN=1:fake python fixed_bot.py
+"""
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_itbot'}
+
+# Методы, которые отправляют что-то пользователю и могут получить 429
+SEND_METHODS = {'sendMessage', 'editMessageText', 'sendDocument'}
+
+# Дольше не держим getUpdates, даже если бот просит больше
+MAX_POLL_SECONDS = 10
+
+
+def _decode_value(value):
+    # reply_markup и подобные параметры telebot передает строкой JSON
+    if isinstance(value, str) and value[:1] in ('{', '['):
+        try:
+            return json.loads(value)
+        except ValueError:
+            pass
+    return value
+
+
+class FakeTelegram:
+    """Сервер, отвечающий как Bot API, и его состояние"""
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, rate_limit_ratio=0.0,
+                 retry_after=1, seed=0, record_path=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._record_lock = threading.Lock()
+        self._record_file = open(record_path, 'a', encoding='utf-8') if record_path else None
+
+        self._cond = threading.Condition()
+        self._updates = []                      # ожидающие getUpdates
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._sent = {}                         # chat_id -> [вызов]
+
+        # Метрики
+        self.requests = {}
+        self.rate_limited = 0
+        self.sent_total = 0
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def api_url(self):
+        """Шаблон для telebot.apihelper.API_URL"""
+        return self.url + "/bot{0}/{1}"
+
+    # ----- Обновления от пользователей -----
+
+    def _push(self, update):
+        with self._cond:
+            update['update_id'] = next(self._update_ids)
+            self._updates.append(update)
+            self._cond.notify_all()
+        return update['update_id']
+
+    def push_message(self, user_id, text, first_name='Test'):
+        """Пользователь user_id пишет боту text; возвращает update_id"""
+        return self._push({
+            'message': {
+                'message_id': next(self._message_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private', 'first_name': first_name},
+                'from': {'id': user_id, 'is_bot': False, 'first_name': first_name},
+                'text': text,
+            },
+        })
+
+    def push_callback(self, user_id, data, message_id=None, first_name='Test'):
+        """Пользователь нажимает инлайн-кнопку с callback_data=data"""
+        return self._push({
+            'callback_query': {
+                'id': str(next(self._message_ids)),
+                'from': {'id': user_id, 'is_bot': False, 'first_name': first_name},
+                'chat_instance': str(user_id),
+                'data': data,
+                'message': {
+                    'message_id': message_id or next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': user_id, 'type': 'private'},
+                    'from': BOT_USER,
+                    'text': '',
+                },
+            },
+        })
+
+    # ----- Исходящие вызовы бота -----
+
+    def sent_to(self, chat_id):
+        """Все вызовы, адресованные чату, по порядку"""
+        with self._cond:
+            return list(self._sent.get(chat_id, ()))
+
+    def wait_for_messages(self, chat_id, count, timeout=10.0):
+        """Дождаться, пока у чата наберется count вызовов; возвращает их список"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._sent.get(chat_id, ())) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Чат {chat_id}: ждали {count} сообщений, "
+                                       f"получено {len(self._sent.get(chat_id, ()))}")
+                self._cond.wait(remaining)
+            return list(self._sent[chat_id])
+
+    def _record(self, method, params):
+        chat_id = params.get('chat_id')
+        if chat_id is not None:
+            chat_id = int(chat_id)
+        entry = {
+            'method': method,
+            'chat_id': chat_id,
+            'text': params.get('text'),
+            'reply_markup': params.get('reply_markup'),
+            'message_id': next(self._message_ids),
+            'time': time.time(),
+        }
+        with self._cond:
+            self._sent.setdefault(chat_id, []).append(entry)
+            self.sent_total += 1
+            self._cond.notify_all()
+        if self._record_file is not None:
+            line = json.dumps(entry, ensure_ascii=False)
+            with self._record_lock:
+                self._record_file.write(line + "\n")
+        return entry
+
+    # ----- Методы API -----
+
+    def _get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = min(float(params.get('timeout') or 0), MAX_POLL_SECONDS)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # Обновления до offset бот подтвердил - забываем их
+            self._updates = [update for update in self._updates if update['update_id'] >= offset]
+            while not self._updates:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return self._updates[:limit]
+
+    def _message(self, entry, params):
+        return {
+            'message_id': entry['message_id'],
+            'date': int(entry['time']),
+            'chat': {'id': entry['chat_id'], 'type': 'private'},
+            'from': BOT_USER,
+            'text': params.get('text') or '',
+        }
+
+    def call(self, method, params):
+        """Выполнить метод API; возвращает (HTTP-статус, тело ответа)"""
+        with self._cond:
+            self.requests[method] = self.requests.get(method, 0) + 1
+
+        if method == 'getUpdates':
+            return 200, {'ok': True, 'result': self._get_updates(params)}
+
+        delay = self.latency
+        with self._random_lock:
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            limited = method in SEND_METHODS and self._random.random() < self.rate_limit_ratio
+        if delay > 0:
+            time.sleep(delay)
+
+        if limited:
+            with self._cond:
+                self.rate_limited += 1
+            return 429, {
+                'ok': False,
+                'error_code': 429,
+                'description': f"Too Many Requests: retry after {self.retry_after}",
+                'parameters': {'retry_after': self.retry_after},
+            }
+
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+        if method in ('answerCallbackQuery', 'sendChatAction', 'setWebhook', 'deleteWebhook'):
+            return 200, {'ok': True, 'result': True}
+        if method in SEND_METHODS:
+            entry = self._record(method, params)
+            return 200, {'ok': True, 'result': self._message(entry, params)}
+        return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}
+
+    # ----- HTTP -----
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self):
+                parts = urlsplit(self.path)
+                # /bot<token>/<method>
+                method = parts.path.rsplit('/', 1)[-1]
+                params = dict(parse_qsl(parts.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/json'):
+                    params.update(json.loads(body))
+                elif body and content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update(parse_qsl(body.decode('utf-8')))
+                # multipart (sendDocument): параметры у telebot в строке запроса, файл не разбираем
+                params = {key: _decode_value(value) for key, value in params.items()}
+
+                status, response = server.call(method, params)
+                payload = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _handle
+            do_POST = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Запустить сервер в фоновом потоке"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._record_file is not None:
+            self._record_file.close()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'requests': dict(self.requests),
+                'sent': self.sent_total,
+                'rate_limited': self.rate_limited,
+                'pending_updates': len(self._updates),
+                'chats': len(self._sent),
+            }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная замена Telegram Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа, секунд")
+    parser.add_argument('--jitter', type=float, default=0.0, help="случайная добавка к задержке, секунд")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="доля отправок, получающих 429")
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--record', help="файл JSONL для записи исходящих сообщений")
+    args = parser.parse_args()
+
+    server = FakeTelegram(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                          rate_limit_ratio=args.rate_limit, retry_after=args.retry_after,
+                          seed=args.seed, record_path=args.record)
+    print(f"🧪 Fake Telegram API: {server.url}")
+    print(f"   TELEGRAM_API_URL={server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Остановлен")
+    finally:
+        server.httpd.server_close()
+        print(f"📊 {server.stats()}")
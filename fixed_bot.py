@@ -4,22 +4,143 @@
 """
 
 import telebot
+import argparse
+import atexit
+import sys
+import io
 import json
 import logging
+from datetime import datetime, timedelta
 from telebot import types
 from config import Config
 from database.queries import Database
-
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
+from catalog import CatalogHolder
+from scoring import engine_for, as_dict, SPECIALIZATIONS
+from router import Router, ROLE_ADMIN, ROLE_USER
+from sessions import Session, SessionStore
+from results_store import ResultsStore
+from answer_writer import AnswerWriter
+from session_snapshot import SessionSnapshotter
+from broadcast import BroadcastManager
+from delivery_status import DeliveryStatusStore
+from outbox import Outbox, QueuedTeleBot, PRIORITY_INTERACTIVE, PRIORITY_BULK
+from sharding import ShardedUpdatesMixin
+from metrics import Registry, MetricsServer, note_error
+from log_setup import setup_logging
+from profiler import SamplingProfiler
+import segments
+
+# Настройка логирования: запись из обработчика - только постановка в очередь,
+# частые отладочные события прореживаются (Config.LOG_SAMPLING)
+setup_logging(Config.LOG_LEVEL, Config.LOG_SAMPLING, on_error=note_error)
 logger = logging.getLogger(__name__)
 
+# Метки событий для прореживания отладочных записей
+LOG_MESSAGE = {'event': 'message'}
+LOG_ANSWER = {'event': 'answer'}
+LOG_RESULTS = {'event': 'results'}
+
+# Локальный сервер Bot API вместо api.telegram.org (например, fake_telegram.py)
+if Config.TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = Config.TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+
+# Гистограммы задержек обработчиков и вызовов Telegram (GET /metrics)
+metrics_registry = Registry()
+handler_metrics = metrics_registry.histogram('handler_seconds', "Message handler duration", 'handler')
+metrics_server = None
+
+# Профилировщик, запускаемый из админ-панели
+profiler = SamplingProfiler(Config.PROFILER_INTERVAL, include_idle=Config.PROFILER_INCLUDE_IDLE)
+
 # Инициализация бота и компонентов
-bot = telebot.TeleBot(Config.BOT_TOKEN)
+class ItBot(ShardedUpdatesMixin, QueuedTeleBot):
+    """Бот: обновления разных чатов параллельно, исходящие через общую очередь"""
+
+# Все исходящие сообщения идут через общую очередь с лимитами Telegram,
+# а входящие обновления обрабатываются потоками по ID чата
+bot = ItBot(
+    Config.BOT_TOKEN,
+    outbox=Outbox(
+        global_rate=Config.OUTBOX_GLOBAL_RATE,
+        per_chat_rate=Config.OUTBOX_PER_CHAT_RATE,
+        per_chat_burst=Config.OUTBOX_PER_CHAT_BURST,
+        workers=Config.OUTBOX_WORKERS,
+        metrics=metrics_registry
+    ),
+    update_workers=Config.UPDATE_WORKERS
+)
 db = Database(Config.DB_URL)
 
-# Словарь для хранения состояния пользователей
-user_states = {}
+# Снимок каталога вопросов (обновляется при изменении вопросов в админке)
+catalog_holder = CatalogHolder(db.get_all_questions)
+
+# Сессии пользователей (ограничены по размеру и времени простоя)
+user_sessions = SessionStore(max_size=Config.SESSION_MAX_SIZE, idle_ttl=Config.SESSION_IDLE_TTL)
+
+# Снимки сессий на диск, чтобы перезапуск не обрывал начатые тесты
+session_snapshotter = SessionSnapshotter(
+    user_sessions,
+    Config.SESSION_SNAPSHOT_PATH,
+    fingerprint_getter=lambda: catalog_holder.current().fingerprint,
+    interval=Config.SESSION_SNAPSHOT_INTERVAL
+)
+
+# Результаты тестов на случай вытеснения сессии из памяти
+results_store = ResultsStore(Config.DB_URL)
+
+def write_answers_batch(items):
+    """Записать пачку ответов (user_id, question_id, answer_value) в базу.
+    
+    Возвращает количество незаписанных ответов (учитываются в answer_writer.failed).
+    """
+    failed = 0
+    last_error = None
+    for user_id, question_id, answer_value in items:
+        try:
+            db.update_user_answers(user_id, question_id, answer_value)
+        except Exception as e:
+            failed += 1
+            last_error = e
+    if failed:
+        logger.error("Не записано ответов: %s из %s, последняя ошибка: %s", failed, len(items), last_error)
+    return failed
+
+# Ответы пишутся в базу пачками из фонового потока, а не на пути ответа пользователю
+answer_writer = AnswerWriter(
+    write_answers_batch,
+    batch_size=Config.ANSWER_BATCH_SIZE,
+    flush_interval=Config.ANSWER_FLUSH_INTERVAL
+)
+answer_writer.start()
+atexit.register(answer_writer.stop)
+
+# Пользователи, заблокировавшие бота, не получают рассылки
+delivery_status = DeliveryStatusStore(Config.DB_URL)
+
+# Сегменты аудитории для рассылок (все / по специализации / бросившие тест / по дате)
+broadcast_segments = segments.Segments(
+    Config.DB_URL, Config.USERS_TABLE, Config.USERS_ID_COLUMN, page_size=Config.BROADCAST_PAGE_SIZE,
+    load_all_users=db.get_all_users
+)
+
+# Рассылки выполняются в фоне с ограничением частоты и продолжаются после перезапуска
+broadcast_manager = BroadcastManager(
+    bot,
+    broadcast_segments.audience_for,
+    Config.BROADCAST_STATE_PATH,
+    workers=Config.BROADCAST_WORKERS,
+    delivery_status=delivery_status
+)
+
+# Датчики для /metrics
+metrics_registry.gauge('sessions', "Test sessions in memory", lambda: len(user_sessions))
+metrics_registry.gauge('outbox_interactive_depth', "Queued replies",
+                       lambda: bot.outbox.depth()[PRIORITY_INTERACTIVE])
+metrics_registry.gauge('outbox_bulk_depth', "Queued broadcast messages",
+                       lambda: bot.outbox.depth()[PRIORITY_BULK])
+metrics_registry.gauge('answer_writer_depth', "Answers waiting to be written", answer_writer.depth)
+metrics_registry.gauge('update_queue_depth', "Updates waiting for a handler thread",
+                       lambda: sum(bot.update_executor.stats()['depth']))
 
 # Состояния админ-панели
 admin_states = {}
@@ -28,13 +149,87 @@ def is_admin(user_id):
     """Проверка, является ли пользователь администратором"""
     return user_id in Config.ADMIN_IDS
 
+# Маршрутизация кнопок и состояний админ-панели (вместо цепочки фильтров telebot)
+router = Router(
+    state_getter=lambda user_id: admin_states.get(user_id, {}).get('state'),
+    role_getter=lambda user_id: ROLE_ADMIN if is_admin(user_id) else ROLE_USER
+)
+
+def get_result_session(user_id):
+    """Сессия пользователя; вытесненная сессия восстанавливается из сохраненных результатов"""
+    session = user_sessions.get(user_id)
+    if session is not None:
+        return session
+    
+    try:
+        result = results_store.load(user_id)
+        if result is None:
+            return None
+        
+        session = Session(current_question=None)
+        session.save_results(result['scores'], result['counts'], result['percentages'],
+                             result['specialization'])
+        session.show_all_universities = result['specialization_id'] is not None
+        user_sessions.put(user_id, session)
+        return session
+    except Exception as e:
+        logger.error("Ошибка восстановления результатов пользователя %s: %s", user_id, e)
+        return None
+
+# Информация о специализациях по коду (сбрасывается при изменении специализаций)
+spec_info_cache = {}
+
+def get_spec_info(specialization):
+    """Информация о специализации из БД (с кэшированием)"""
+    if specialization not in spec_info_cache:
+        spec_info_cache[specialization] = db.get_specialization_from_code(specialization)
+    return spec_info_cache[specialization]
+
+def mark_user_active(user_id):
+    """Вернуть пользователя в рассылки, если раньше он был недоступен"""
+    try:
+        if delivery_status.revive(user_id):
+            logger.info("Пользователь %s снова доступен для рассылок", user_id)
+    except Exception as e:
+        logger.error("Ошибка обновления статуса доставки: %s", e)
+
+# Вызываются после изменения вопросов или специализаций в админке
+# (в supervisor.py - перезагрузка каталога в остальных процессах)
+catalog_reload_hooks = []
+
+def notify_catalog_changed():
+    for hook in catalog_reload_hooks:
+        try:
+            hook()
+        except Exception as e:
+            logger.error("Ошибка оповещения об обновлении каталога: %s", e)
+
+def refresh_question_catalog(notify=True):
+    """Пересобрать снимок вопросов после изменения в админке"""
+    try:
+        catalog_holder.reload()
+    except Exception as e:
+        logger.error("Ошибка обновления каталога вопросов: %s", e)
+        # Следующее обращение к каталогу перечитает базу
+        catalog_holder.invalidate()
+    if notify:
+        notify_catalog_changed()
+
+def refresh_specializations(notify=True):
+    """Сбросить кэш специализаций после изменения в админке"""
+    spec_info_cache.clear()
+    if notify:
+        notify_catalog_changed()
+
 @bot.message_handler(commands=['start'])
+@handler_metrics.timed
 def start(message):
     """Начальное приветствие"""
+    mark_user_active(message.from_user.id)
+    
     # Получаем актуальное количество вопросов из базы данных
     try:
-        questions_dict = db.get_all_questions()
-        total_questions = len(questions_dict)
+        total_questions = catalog_holder.current().total
     except:
         total_questions = 30  # Fallback значение
     
@@ -55,12 +250,12 @@ def start(message):
     bot.reply_to(message, welcome_text, reply_markup=markup)
 
 @bot.message_handler(commands=['help'])
+@handler_metrics.timed
 def help_command(message):
     """Справка по командам"""
     # Получаем актуальное количество вопросов из базы данных
     try:
-        questions_dict = db.get_all_questions()
-        total_questions = len(questions_dict)
+        total_questions = catalog_holder.current().total
     except:
         total_questions = 30  # Fallback значение
     
@@ -81,6 +276,7 @@ def help_command(message):
     bot.reply_to(message, help_text)
 
 @bot.message_handler(commands=['admin'])
+@handler_metrics.timed
 def admin_command(message):
 	admin_panel(message)
 
@@ -111,6 +307,7 @@ def admin_panel(message):
 • Специализации - добавление/удаление/редактирование
 • Рассылка - отправка сообщений всем пользователям
 • Статистика - подробная аналитика
+• Профилирование - стеки обработчиков за {Config.PROFILER_DURATION} с (flamegraph)
     """
     
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
@@ -123,7 +320,8 @@ def admin_panel(message):
         types.KeyboardButton('📢 Рассылка')
     )
     markup.add(
-        types.KeyboardButton('📊 Статистика')
+        types.KeyboardButton('📊 Статистика'),
+        types.KeyboardButton('🔥 Профилирование')
     )
     markup.add(
         types.KeyboardButton('⬅️ Выход')
@@ -136,7 +334,7 @@ def get_admin_statistics():
     """Получение статистики для админ-панели"""
     try:
         # Получаем базовую статистику
-        total_questions = len(db.get_all_questions())
+        total_questions = catalog_holder.current().total
         total_specializations = len(db.get_all_specializations())
         
         # Получаем количество университетов из JSON файла
@@ -174,7 +372,7 @@ def get_admin_statistics():
             'total_specializations': total_specializations
         }
     except Exception as e:
-        print(f"❌ Ошибка получения статистики: {e}")
+        logger.error("Ошибка получения статистики: %s", e)
         return {
             'total_users': 0,
             'active_sessions': 0,
@@ -184,48 +382,52 @@ def get_admin_statistics():
             'total_specializations': 0
         }
 
-@bot.message_handler(func=lambda message: message.text == 'Начать тест')
+def open_test_session(user_id, session_id):
+    """Заменить сессию пользователя новой и запомнить начало теста"""
+    # Очищаем предыдущее состояние пользователя
+    user_sessions.pop(user_id)
+    user_sessions.put(user_id, Session(session_id, total_questions=catalog_holder.current().total))
+    
+    # Время начала нужно для рассылки тем, кто бросил тест
+    try:
+        results_store.record_start(user_id)
+    except Exception as e:
+        logger.error("Ошибка сохранения начала теста: %s", e)
+
+@router.text('Начать тест')
 def begin_test_button(message):
     """Начать тестирование"""
     try:
         user_id = message.from_user.id
         
-        # Очищаем предыдущее состояние пользователя
-        if user_id in user_states:
-            del user_states[user_id]
-        
-        # Создаем новую сессию
+        # Создаем новую сессию (баллы по категориям копятся по мере ответов)
         session_id = db.create_user_session(user_id)
-        user_states[user_id] = {
-            'session_id': session_id,
-            'current_question': 1,
-            'answers': {}
-        }
+        open_test_session(user_id, session_id)
         
         # Отправляем первый вопрос
         send_question(message.chat.id, user_id, 1)
     except Exception as e:
-        print(f"❌ Ошибка в begin_test_button: {e}")
+        logger.exception("Ошибка в begin_test_button")
         bot.reply_to(message, "❌ Произошла ошибка при запуске теста. Попробуйте еще раз.")
 
-@bot.message_handler(func=lambda message: message.text == 'Помощь')
+@router.text('Помощь')
 def help_button(message):
     """Показать справку"""
     help_command(message)
 
-@bot.message_handler(func=lambda message: message.text == 'Назад к результатам')
+@router.text('Назад к результатам')
 def back_to_results(message):
     """Вернуться к результатам теста"""
     try:
         user_id = message.from_user.id
         
-        if user_id not in user_states:
+        current_state = get_result_session(user_id)
+        
+        if current_state is None:
             bot.reply_to(message, "❌ Нет активной сессии. Начните тест заново.")
             return
         
-        current_state = user_states[user_id]
-        
-        if not current_state.get('show_all_universities'):
+        if not current_state.show_all_universities:
             bot.reply_to(message, "❌ Сначала пройдите тест до конца.")
             return
         
@@ -233,32 +435,34 @@ def back_to_results(message):
         show_results(message)
         
     except Exception as e:
-        print(f"❌ Ошибка в back_to_results: {e}")
+        logger.exception("Ошибка в back_to_results")
         bot.reply_to(message, "❌ Произошла ошибка при возврате к результатам.")
 
-@bot.message_handler(func=lambda message: message.text == 'Все вузы')
+@router.text('Все вузы')
 def show_all_universities_user(message):
     """Показать все университеты для специализации"""
     try:
         user_id = message.from_user.id
         
-        if user_id not in user_states:
+        current_state = get_result_session(user_id)
+        
+        if current_state is None:
             bot.reply_to(message, "❌ Нет активной сессии. Начните тест заново.")
             return
         
-        current_state = user_states[user_id]
-        
-        if not current_state.get('show_all_universities'):
+        if not current_state.show_all_universities:
             bot.reply_to(message, "❌ Сначала пройдите тест до конца.")
             return
         
-        specialization_id = current_state.get('specialization_id')
-        specialization_name = current_state.get('specialization_name')
+        spec_info = get_spec_info(current_state.saved_specialization)
         
-        if not specialization_id:
+        if not spec_info:
             bot.reply_to(message, "❌ Информация о специализации не найдена.")
             return
         
+        specialization_id = spec_info['id']
+        specialization_name = spec_info['name']
+        
         # Получаем все университеты для специализации
         universities = db.get_universities_by_specialization(specialization_id)
         
@@ -302,43 +506,33 @@ def show_all_universities_user(message):
         # НЕ очищаем состояние пользователя - он нужен для кнопки "Назад"
         
     except Exception as e:
-        print(f"❌ Ошибка в show_all_universities: {e}")
+        logger.exception("Ошибка в show_all_universities")
         bot.reply_to(message, "❌ Произошла ошибка при показе университетов.")
 
 def send_question(chat_id, user_id, question_number):
     """Отправить вопрос пользователю"""
     try:
-        # Получаем все вопросы из БД
-        all_questions = db.get_all_questions()
-        question_ids = sorted(all_questions.keys())
+        # Берем вопрос из снимка каталога
+        catalog = catalog_holder.current()
+        question = catalog.by_position(question_number)
         
         # Проверяем, что номер вопроса в пределах
-        if question_number > len(question_ids):
+        if question is None:
             bot.send_message(chat_id, f"❌ Вопрос {question_number} не найден")
             return
         
-        # Получаем вопрос по номеру
-        question_id = question_ids[question_number - 1]
-        question = all_questions[question_id]
-        
-        # Создаем клавиатуру с вариантами ответов
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-        for option in question['options']:
-            markup.add(types.KeyboardButton(option['text']))
-        
-        # Отправляем вопрос
-        total_questions = len(question_ids)
-        bot.send_message(chat_id, f"❓ Вопрос {question_number}/{total_questions}:\n\n{question['text']}", reply_markup=markup)
+        # Текст и клавиатура подготовлены при сборке снимка каталога
+        bot.send_message(chat_id, question.prompt, reply_markup=question.keyboard)
         
     except Exception as e:
-        print(f"❌ Ошибка в send_question: {e}")
+        logger.exception("Ошибка в send_question")
         bot.send_message(chat_id, "❌ Ошибка при отправке вопроса")
 
 # ============================================================================
 # ОБРАБОТЧИКИ АДМИН-ПАНЕЛИ (должны быть ПЕРЕД общим обработчиком)
 # ============================================================================
 
-@bot.message_handler(func=lambda message: message.text == '❓ Управление вопросами')
+@router.text('❓ Управление вопросами')
 def questions_management(message):
     """Управление вопросами"""
     user_id = message.from_user.id
@@ -359,7 +553,7 @@ def questions_management(message):
     
     bot.reply_to(message, "❓ Управление вопросами\n\nВыберите действие:", reply_markup=markup)
 
-@bot.message_handler(func=lambda message: message.text == '📋 Показать все вопросы')
+@router.text('📋 Показать все вопросы')
 def show_all_questions(message):
     """Показать все вопросы с пагинацией"""
     user_id = message.from_user.id
@@ -391,6 +585,7 @@ def show_all_questions(message):
         show_questions_page(message, user_id)
         
     except Exception as e:
+        logger.exception("Ошибка в show_all_questions")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 def show_questions_page(message, user_id):
@@ -458,7 +653,7 @@ def show_questions_page(message, user_id):
     
     bot.reply_to(message, text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'viewing_questions')
+@router.state('viewing_questions')
 def handle_questions_navigation(message):
     """Обработка навигации по вопросам"""
     user_id = message.from_user.id
@@ -496,6 +691,7 @@ def handle_questions_navigation(message):
             admin_states[user_id] = state
             show_questions_page(message, user_id)
         except Exception as e:
+            logger.exception("Ошибка в handle_questions_navigation")
             bot.reply_to(message, f"❌ Ошибка при обновлении: {e}")
     
     elif message.text == '⬅️ К управлению':
@@ -555,7 +751,7 @@ def show_question_details(message, user_id, question_id):
     state['current_question_id'] = question_id
     admin_states[user_id] = state
 
-@bot.message_handler(func=lambda message: message.text in ['✏️ Редактировать', '🗑️ Удалить', '⬅️ К списку'])
+@router.text('✏️ Редактировать', '🗑️ Удалить', '⬅️ К списку')
 def handle_question_actions(message):
     """Обработка действий с вопросом"""
     user_id = message.from_user.id
@@ -574,6 +770,7 @@ def handle_question_actions(message):
             try:
                 success = db.delete_question(question_id)
                 if success:
+                    refresh_question_catalog()
                     bot.reply_to(message, f"✅ Вопрос ID {question_id} успешно удален")
                     # Обновляем список вопросов
                     questions_dict = db.get_all_questions()
@@ -585,6 +782,7 @@ def handle_question_actions(message):
                 else:
                     bot.reply_to(message, f"❌ Ошибка при удалении вопроса ID {question_id}")
             except Exception as e:
+                logger.exception("Ошибка в handle_question_actions")
                 bot.reply_to(message, f"❌ Ошибка при удалении: {e}")
         else:
             bot.reply_to(message, "❌ ID вопроса не найден")
@@ -592,7 +790,7 @@ def handle_question_actions(message):
     elif message.text == '⬅️ К списку':
         show_questions_page(message, user_id)
 
-@bot.message_handler(func=lambda message: message.text == '➕ Добавить вопрос')
+@router.text('➕ Добавить вопрос')
 def add_question_start(message):
     """Начало добавления вопроса"""
     user_id = message.from_user.id
@@ -611,7 +809,7 @@ def add_question_start(message):
                  "📝 Отправьте текст вопроса:", 
                  reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'adding_question')
+@router.state('adding_question')
 def add_question_process(message):
     """Обработка добавления вопроса"""
     user_id = message.from_user.id
@@ -802,12 +1000,14 @@ def add_question_process(message):
                 }
                 
                 question_id = db.add_question(question_data)
+                refresh_question_catalog()
                 
                 del admin_states[user_id]
                 bot.reply_to(message, f"✅ Вопрос успешно добавлен! ID: {question_id}")
                 admin_panel(message)
                 
             except Exception as e:
+                logger.exception("Ошибка в add_question_process")
                 bot.reply_to(message, f"❌ Ошибка при добавлении вопроса: {e}")
                 
         elif message.text == '🔄 Начать заново':
@@ -831,7 +1031,7 @@ def add_question_process(message):
         else:
             bot.reply_to(message, "❌ Выберите действие из кнопок")
 
-@bot.message_handler(func=lambda message: message.text == '🗑️ Удалить вопрос')
+@router.text('🗑️ Удалить вопрос')
 def delete_question_start(message):
     """Начало удаления вопроса"""
     user_id = message.from_user.id
@@ -863,6 +1063,7 @@ def delete_question_start(message):
         show_delete_questions_page(message, user_id)
         
     except Exception as e:
+        logger.exception("Ошибка в delete_question_start")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 def show_delete_questions_page(message, user_id):
@@ -907,7 +1108,7 @@ def show_delete_questions_page(message, user_id):
     
     bot.reply_to(message, text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'deleting_questions')
+@router.state('deleting_questions')
 def delete_question_process(message):
     """Обработка удаления вопроса"""
     user_id = message.from_user.id
@@ -949,6 +1150,7 @@ def delete_question_process(message):
         
         # Удаляем вопрос
         db.delete_question(question_id)
+        refresh_question_catalog()
         
         del admin_states[user_id]
         bot.reply_to(message, f"✅ Вопрос {question_id} успешно удален!")
@@ -959,9 +1161,10 @@ def delete_question_process(message):
     except ValueError:
         bot.reply_to(message, "❌ Введите корректный ID (число)")
     except Exception as e:
+        logger.exception("Ошибка в delete_question_process")
         bot.reply_to(message, f"❌ Ошибка при удалении вопроса: {e}")
 
-@bot.message_handler(func=lambda message: message.text == '🎓 Управление вузами')
+@router.text('🎓 Управление вузами')
 def universities_management(message):
     """Управление вузами"""
     user_id = message.from_user.id
@@ -988,7 +1191,7 @@ def universities_management(message):
                  "Выберите действие:", 
                  reply_markup=markup)
 
-@bot.message_handler(func=lambda message: message.text == '📋 Показать все вузы')
+@router.text('📋 Показать все вузы')
 def show_all_universities_admin(message):
     """Показать все вузы с пагинацией"""
     user_id = message.from_user.id
@@ -1015,6 +1218,7 @@ def show_all_universities_admin(message):
         show_universities_page(message, user_id)
         
     except Exception as e:
+        logger.exception("Ошибка в show_all_universities_admin")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 def show_universities_page(message, user_id):
@@ -1074,7 +1278,7 @@ def show_universities_page(message, user_id):
     
     bot.reply_to(message, text, reply_markup=markup, disable_web_page_preview=True)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'viewing_universities')
+@router.state('viewing_universities')
 def handle_universities_navigation(message):
     """Обработка навигации по вузам"""
     user_id = message.from_user.id
@@ -1110,6 +1314,7 @@ def handle_universities_navigation(message):
             admin_states[user_id] = state
             show_universities_page(message, user_id)
         except Exception as e:
+            logger.exception("Ошибка в handle_universities_navigation")
             bot.reply_to(message, f"❌ Ошибка при обновлении: {e}")
     
     elif message.text == '⬅️ К управлению':
@@ -1157,7 +1362,7 @@ def show_university_details(message, user_id, university_name):
     state['current_university_name'] = university_name
     admin_states[user_id] = state
 
-@bot.message_handler(func=lambda message: message.text == '➕ Добавить вуз')
+@router.text('➕ Добавить вуз')
 def add_university_start(message):
     """Начало добавления вуза"""
     user_id = message.from_user.id
@@ -1176,7 +1381,7 @@ def add_university_start(message):
                  "📝 Отправьте название вуза:", 
                  reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'adding_university')
+@router.state('adding_university')
 def add_university_process(message):
     """Обработка добавления вуза"""
     user_id = message.from_user.id
@@ -1281,11 +1486,12 @@ def add_university_process(message):
             admin_panel(message)
             
         except Exception as e:
+            logger.exception("Ошибка в add_university_process")
             bot.reply_to(message, f"❌ Ошибка при создании вуза: {e}")
             del admin_states[user_id]
             admin_panel(message)
 
-@bot.message_handler(func=lambda message: message.text in ['✏️ Редактировать', '🗑️ Удалить', '⬅️ К списку'])
+@router.text('✏️ Редактировать', '🗑️ Удалить', '⬅️ К списку')
 def handle_university_actions(message):
     """Обработка действий с вузом"""
     user_id = message.from_user.id
@@ -1310,6 +1516,7 @@ def handle_university_actions(message):
                         db.sync_website_data()
                         bot.reply_to(message, f"✅ Вуз '{uni_name}' и все его записи удалены!")
                     except Exception as e:
+                        logger.exception("Ошибка обновления сайта в handle_university_actions")
                         bot.reply_to(message, f"✅ Вуз удален, но ошибка обновления сайта: {e}")
                     del admin_states[user_id]
                     
@@ -1318,6 +1525,7 @@ def handle_university_actions(message):
                 else:
                     bot.reply_to(message, f"❌ Ошибка при удалении вуза с ID {university_id}")
             except Exception as e:
+                logger.exception("Ошибка в handle_university_actions")
                 bot.reply_to(message, f"❌ Ошибка при удалении: {e}")
         else:
             bot.reply_to(message, "❌ ID вуза не найден")
@@ -1327,7 +1535,7 @@ def handle_university_actions(message):
 
 
 
-@bot.message_handler(func=lambda message: message.text == '🎯 Управление специализациями')
+@router.text('🎯 Управление специализациями')
 def specializations_management(message):
     """Управление специализациями"""
     user_id = message.from_user.id
@@ -1367,7 +1575,7 @@ def specializations_management(message):
     
     bot.reply_to(message, admin_text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: message.text == '⬅️ Назад' and admin_states.get(message.from_user.id, {}).get('state') == 'admin_main')
+@router.text('⬅️ Назад', state='admin_main')
 def specializations_back(message):
     """Возврат из управления специализациями в админ-панель"""
     user_id = message.from_user.id
@@ -1378,7 +1586,7 @@ def specializations_back(message):
     
     admin_panel(message)
 
-@bot.message_handler(func=lambda message: message.text == '📋 Показать все специализации')
+@router.text('📋 Показать все специализации')
 def show_all_specializations(message):
     """Показать все специализации с пагинацией"""
     user_id = message.from_user.id
@@ -1410,6 +1618,7 @@ def show_all_specializations(message):
         show_specializations_page(message, user_id)
         
     except Exception as e:
+        logger.exception("Ошибка в show_all_specializations")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 def show_specializations_page(message, user_id):
@@ -1472,7 +1681,7 @@ def show_specializations_page(message, user_id):
     
     bot.reply_to(message, text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'viewing_specializations')
+@router.state('viewing_specializations')
 def handle_specializations_navigation(message):
     """Обработка навигации по специализациям"""
     user_id = message.from_user.id
@@ -1510,6 +1719,7 @@ def handle_specializations_navigation(message):
             admin_states[user_id] = state
             show_specializations_page(message, user_id)
         except Exception as e:
+            logger.exception("Ошибка в handle_specializations_navigation")
             bot.reply_to(message, f"❌ Ошибка при обновлении: {e}")
     
     elif message.text == '⬅️ К управлению':
@@ -1561,7 +1771,7 @@ def show_specialization_details(message, user_id, specialization_id):
     state['current_specialization_id'] = specialization_id
     admin_states[user_id] = state
 
-@bot.message_handler(func=lambda message: message.text in ['✏️ Редактировать', '🗑️ Удалить', '⬅️ К списку'] and admin_states.get(message.from_user.id, {}).get('state') == 'viewing_specializations')
+@router.text('✏️ Редактировать', '🗑️ Удалить', '⬅️ К списку', state='viewing_specializations')
 def handle_specialization_actions(message):
     """Обработка действий со специализациями"""
     user_id = message.from_user.id
@@ -1583,6 +1793,7 @@ def handle_specialization_actions(message):
                 specialization = specializations_dict.get(specialization_id)
                 if specialization:
                     success = db.delete_specialization(specialization_id)
+                    refresh_specializations()
                     if success:
                         bot.reply_to(message, f"✅ Специализация '{specialization['name']}' успешно удалена!")
                     else:
@@ -1590,6 +1801,7 @@ def handle_specialization_actions(message):
                 else:
                     bot.reply_to(message, "❌ Специализация не найдена")
             except Exception as e:
+                logger.exception("Ошибка в handle_specialization_actions")
                 bot.reply_to(message, f"❌ Ошибка: {e}")
         else:
             bot.reply_to(message, "❌ ID специализации не найден")
@@ -1602,7 +1814,7 @@ def handle_specialization_actions(message):
         bot.reply_to(message, "✏️ Редактирование специализаций пока не реализовано")
         show_specialization_details(message, user_id, specialization_id)
 
-@bot.message_handler(func=lambda message: message.text == '➕ Добавить специализацию')
+@router.text('➕ Добавить специализацию')
 def add_specialization_start(message):
     """Начало добавления специализации"""
     user_id = message.from_user.id
@@ -1621,7 +1833,7 @@ def add_specialization_start(message):
                  "📝 Отправьте название специализации:", 
                  reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'adding_specialization')
+@router.state('adding_specialization')
 def add_specialization_process(message):
     """Обработка добавления специализации"""
     user_id = message.from_user.id
@@ -1755,18 +1967,20 @@ def add_specialization_process(message):
                     creative_score,
                     state['careers']
                 )
+                refresh_specializations()
                 
                 del admin_states[user_id]
                 bot.reply_to(message, "✅ Специализация успешно добавлена!")
                 specializations_management(message)
                 
             except Exception as e:
+                logger.exception("Ошибка в add_specialization_process")
                 bot.reply_to(message, f"❌ Ошибка при добавлении специализации: {e}")
                 
         except ValueError:
             bot.reply_to(message, "❌ Введите корректное число")
 
-@bot.message_handler(func=lambda message: message.text == '🎓 Добавить специализацию в вуз')
+@router.text('🎓 Добавить специализацию в вуз')
 def add_specialization_to_university_start(message):
     """Начало добавления специализации в вуз"""
     user_id = message.from_user.id
@@ -1806,9 +2020,10 @@ def add_specialization_to_university_start(message):
                      reply_markup=markup)
                      
     except Exception as e:
+        logger.exception("Ошибка в add_specialization_to_university_start")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'adding_spec_to_uni')
+@router.state('adding_spec_to_uni')
 def add_specialization_to_university_process(message):
     """Обработка добавления специализации в вуз"""
     user_id = message.from_user.id
@@ -1878,6 +2093,7 @@ def add_specialization_to_university_process(message):
                              reply_markup=markup)
                              
             except Exception as e:
+                logger.exception("Ошибка в add_specialization_to_university_process")
                 bot.reply_to(message, f"❌ Ошибка при загрузке вузов: {e}")
                 return
                          
@@ -2031,12 +2247,13 @@ def add_specialization_to_university_process(message):
                 specializations_management(message)
                 
             except Exception as e:
+                logger.exception("Ошибка в add_specialization_to_university_process")
                 bot.reply_to(message, f"❌ Ошибка при добавлении университета: {e}")
                          
         except ValueError:
             bot.reply_to(message, "❌ Введите корректное число")
 
-@bot.message_handler(func=lambda message: message.text == '🗑️ Удалить специализацию из вуза')
+@router.text('🗑️ Удалить специализацию из вуза')
 def delete_specialization_from_university_start(message):
     """Начало удаления специализации из вуза"""
     user_id = message.from_user.id
@@ -2097,9 +2314,10 @@ def delete_specialization_from_university_start(message):
                      reply_markup=markup)
                      
     except Exception as e:
+        logger.exception("Ошибка в delete_specialization_from_university_start")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'deleting_spec_from_uni')
+@router.state('deleting_spec_from_uni')
 def delete_specialization_from_university_process(message):
     """Обработка удаления специализации из вуза"""
     user_id = message.from_user.id
@@ -2190,12 +2408,13 @@ def delete_specialization_from_university_process(message):
                 specializations_management(message)
                 
             except Exception as e:
+                logger.exception("Ошибка в delete_specialization_from_university_process")
                 bot.reply_to(message, f"❌ Ошибка при удалении: {e}")
                 
         except ValueError:
             bot.reply_to(message, "❌ Введите корректный ID специальности")
 
-@bot.message_handler(func=lambda message: message.text == '🗑️ Удалить специализацию')
+@router.text('🗑️ Удалить специализацию')
 def delete_specialization_start(message):
     """Начало удаления специализации"""
     user_id = message.from_user.id
@@ -2227,6 +2446,7 @@ def delete_specialization_start(message):
         show_delete_specializations_page(message, user_id)
         
     except Exception as e:
+        logger.exception("Ошибка в delete_specialization_start")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 def show_delete_specializations_page(message, user_id):
@@ -2271,7 +2491,7 @@ def show_delete_specializations_page(message, user_id):
     
     bot.reply_to(message, text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'deleting_specializations')
+@router.state('deleting_specializations')
 def delete_specialization_process(message):
     """Обработка удаления специализации"""
     user_id = message.from_user.id
@@ -2313,6 +2533,7 @@ def delete_specialization_process(message):
         
         # Удаляем специализацию
         db.delete_specialization(specialization_id)
+        refresh_specializations()
         
         del admin_states[user_id]
         bot.reply_to(message, f"✅ Специализация {specialization_id} успешно удалена!")
@@ -2323,9 +2544,10 @@ def delete_specialization_process(message):
     except ValueError:
         bot.reply_to(message, "❌ Введите корректный ID (число)")
     except Exception as e:
+        logger.exception("Ошибка в delete_specialization_process")
         bot.reply_to(message, f"❌ Ошибка при удалении специализации: {e}")
 
-@bot.message_handler(func=lambda message: message.text == '🗑️ Удалить вуз')
+@router.text('🗑️ Удалить вуз')
 def delete_university_start(message):
     """Начало удаления вуза"""
     user_id = message.from_user.id
@@ -2352,6 +2574,7 @@ def delete_university_start(message):
         show_delete_universities_page(message, user_id)
         
     except Exception as e:
+        logger.exception("Ошибка в delete_university_start")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
 def show_delete_universities_page(message, user_id):
@@ -2394,7 +2617,7 @@ def show_delete_universities_page(message, user_id):
     
     bot.reply_to(message, text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'deleting_universities')
+@router.state('deleting_universities')
 def delete_university_process(message):
     """Обработка удаления вуза"""
     user_id = message.from_user.id
@@ -2455,6 +2678,7 @@ def delete_university_process(message):
             try:
                 db.sync_website_data()
             except Exception as e:
+                logger.exception("Ошибка обновления сайта в delete_university_process")
                 bot.reply_to(message, f"⚠️ Вуз удален, но ошибка обновления сайта: {e}")
             
             # Возвращаемся к управлению вузами
@@ -2465,9 +2689,10 @@ def delete_university_process(message):
     except ValueError:
         bot.reply_to(message, "❌ Введите корректный ID (число)")
     except Exception as e:
+        logger.exception("Ошибка в delete_university_process")
         bot.reply_to(message, f"❌ Ошибка при удалении вуза: {e}")
 
-@bot.message_handler(func=lambda message: message.text == '📢 Рассылка')
+@router.text('📢 Рассылка')
 def broadcast_start(message):
     """Начало рассылки"""
     user_id = message.from_user.id
@@ -2476,17 +2701,140 @@ def broadcast_start(message):
         bot.reply_to(message, "❌ Доступ запрещен")
         return
     
-    admin_states[user_id] = {'state': 'broadcasting'}
+    # Пока идет рассылка, показываем ее прогресс вместо новой
+    if broadcast_manager.is_running():
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add(types.KeyboardButton('⛔ Остановить рассылку'))
+        markup.add(types.KeyboardButton('⬅️ Назад'))
+        bot.reply_to(message, broadcast_manager.progress_text(), reply_markup=markup)
+        return
     
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    admin_states[user_id] = {'state': 'broadcast_segment'}
+    
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+    markup.add(
+        types.KeyboardButton('👥 Всем пользователям'),
+        types.KeyboardButton('🎯 По специализации')
+    )
+    markup.add(
+        types.KeyboardButton('⏸ Не завершившим тест'),
+        types.KeyboardButton('📅 Завершившим за период')
+    )
     markup.add(types.KeyboardButton('⬅️ Отмена'))
     
     bot.reply_to(message, 
                  "📢 Рассылка сообщений\n\n"
-                 "Отправьте текст сообщения для рассылки всем пользователям:", 
+                 "Выберите, кому отправить сообщение:", 
+                 reply_markup=markup)
+
+def ask_broadcast_text(message, user_id, segment):
+    """Показать размер сегмента и запросить текст рассылки"""
+    try:
+        audience = broadcast_segments.audience_for(segment)
+        recipients = audience.count()
+    except Exception as e:
+        logger.exception("Ошибка в ask_broadcast_text")
+        bot.reply_to(message, f"❌ Ошибка выбора получателей: {e}")
+        return
+    
+    # Тот же источник пойдет в рассылку - список получателей не загружается второй раз
+    admin_states[user_id] = {'state': 'broadcasting', 'segment': segment, 'audience': audience}
+    
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(types.KeyboardButton('⬅️ Отмена'))
+    
+    bot.reply_to(message,
+                 f"👥 Получатели: {segments.describe(segment)}\n"
+                 f"📬 Количество: {recipients}\n\n"
+                 "Отправьте текст сообщения для рассылки:",
                  reply_markup=markup)
 
-@bot.message_handler(func=lambda message: admin_states.get(message.from_user.id, {}).get('state') == 'broadcasting')
+@router.state('broadcast_segment')
+def broadcast_segment_process(message):
+    """Выбор сегмента рассылки"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        return
+    
+    if message.text == '⬅️ Отмена':
+        del admin_states[user_id]
+        admin_panel(message)
+        return
+    
+    if message.text == '👥 Всем пользователям':
+        ask_broadcast_text(message, user_id, segments.all_users())
+    elif message.text == '⏸ Не завершившим тест':
+        ask_broadcast_text(message, user_id, segments.abandoned(Config.BROADCAST_ABANDONED_AFTER))
+    elif message.text == '🎯 По специализации':
+        admin_states[user_id] = {'state': 'broadcast_specialization'}
+        
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
+        markup.add(*[types.KeyboardButton(name) for name in SPECIALIZATIONS])
+        markup.add(types.KeyboardButton('⬅️ Отмена'))
+        
+        bot.reply_to(message, "🎯 Выберите рекомендованную специализацию:", reply_markup=markup)
+    elif message.text == '📅 Завершившим за период':
+        admin_states[user_id] = {'state': 'broadcast_dates'}
+        
+        markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+        markup.add(types.KeyboardButton('⬅️ Отмена'))
+        
+        bot.reply_to(message,
+                     "📅 Введите период в формате ДД.ММ.ГГГГ-ДД.ММ.ГГГГ\n"
+                     "Например: 01.09.2024-30.09.2024",
+                     reply_markup=markup)
+    else:
+        bot.reply_to(message, "❌ Выберите получателей кнопкой ниже")
+
+@router.state('broadcast_specialization')
+def broadcast_specialization_process(message):
+    """Рассылка по рекомендованной специализации"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        return
+    
+    if message.text == '⬅️ Отмена':
+        del admin_states[user_id]
+        admin_panel(message)
+        return
+    
+    if message.text not in SPECIALIZATIONS:
+        bot.reply_to(message, "❌ Выберите специализацию кнопкой ниже")
+        return
+    
+    ask_broadcast_text(message, user_id, segments.by_specialization(message.text))
+
+@router.state('broadcast_dates')
+def broadcast_dates_process(message):
+    """Рассылка завершившим тест за период"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        return
+    
+    if message.text == '⬅️ Отмена':
+        del admin_states[user_id]
+        admin_panel(message)
+        return
+    
+    try:
+        start_text, end_text = message.text.replace(' ', '').split('-')
+        since = datetime.strptime(start_text, '%d.%m.%Y')
+        # Последний день периода включается целиком
+        until = datetime.strptime(end_text, '%d.%m.%Y') + timedelta(days=1)
+    except ValueError:
+        bot.reply_to(message, "❌ Неверный формат. Пример: 01.09.2024-30.09.2024")
+        return
+    
+    if until <= since:
+        bot.reply_to(message, "❌ Конец периода раньше начала")
+        return
+    
+    ask_broadcast_text(message, user_id, segments.finished_between(since.timestamp(), until.timestamp()))
+
+@router.state('broadcasting')
 def broadcast_process(message):
     """Обработка рассылки"""
     user_id = message.from_user.id
@@ -2500,25 +2848,35 @@ def broadcast_process(message):
         return
     
     try:
-        users = db.get_all_users()
-        sent_count = 0
-        error_count = 0
-        
-        for user_id in users:
-            try:
-                bot.send_message(user_id, f"📢 Сообщение от администратора:\n\n{message.text}", disable_web_page_preview=True)
-                sent_count += 1
-            except Exception:
-                error_count += 1
-                # Не выводим ошибки для несуществующих пользователей
+        # Рассылка идет в фоне; прогресс обновляется в отдельном сообщении
+        segment = admin_states[user_id].get('segment')
+        broadcast_manager.start(message.text, message.chat.id, segment=segment,
+                                audience=admin_states[user_id].get('audience'))
         
-        bot.reply_to(message, f"✅ Отправлено {sent_count} пользователям")
+        bot.reply_to(message, "🚀 Рассылка запущена. Прогресс будет обновляться ниже.")
         admin_states[message.from_user.id] = {'state': 'admin_main'}
         
+    except RuntimeError as e:
+        bot.reply_to(message, f"❌ {e}")
     except Exception as e:
+        logger.exception("Ошибка в broadcast_process")
         bot.reply_to(message, f"❌ Ошибка рассылки: {e}")
 
-@bot.message_handler(func=lambda message: message.text == '📊 Статистика')
+@router.text('⛔ Остановить рассылку')
+def broadcast_cancel(message):
+    """Остановка текущей рассылки"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        return
+    
+    if broadcast_manager.cancel():
+        bot.reply_to(message, "⛔ Рассылка останавливается...")
+    else:
+        bot.reply_to(message, "❌ Сейчас нет активной рассылки")
+    admin_panel(message)
+
+@router.text('📊 Статистика')
 def detailed_statistics(message):
     """Подробная статистика"""
     user_id = message.from_user.id
@@ -2529,6 +2887,22 @@ def detailed_statistics(message):
     
     try:
         stats = get_admin_statistics()
+        sessions = user_sessions.stats()
+        writes = answer_writer.stats()
+        snapshots = session_snapshotter.stats()
+        dead = delivery_status.stats()
+        outgoing = bot.outbox.stats()
+        interactive = outgoing['interactive_latency']
+        bulk = outgoing['bulk_latency']
+        last_broadcast = broadcast_manager.status()
+        saved_sends = last_broadcast['skipped'] if last_broadcast else 0
+        
+        # Самые медленные обработчики по p95
+        handler_stats = sorted(handler_metrics.summary().items(), key=lambda item: -item[1]['p95'])
+        slowest = "\n".join(
+            f"• {name}: p95 ≤ {row['p95'] * 1000:.0f} мс, вызовов {row['count']}, ошибок {row['errors']}"
+            for name, row in handler_stats[:5]
+        ) or "• Нет данных"
         
         text = f"""
 📊 Подробная статистика
@@ -2547,6 +2921,39 @@ def detailed_statistics(message):
 
 📈 Активность:
 • Среднее время прохождения теста: ~10-15 минут
+
+🧠 Сессии в памяти:
+• Активных сессий: {sessions['size']} из {sessions['max_size']}
+• Вытеснено по лимиту: {sessions['evicted_lru']}
+• Вытеснено по простою: {sessions['evicted_ttl']}
+• Память (оценка): {sessions['approx_bytes'] // 1024} КБ
+
+💾 Запись ответов:
+• В очереди: {writes['depth']} (максимум {writes['max_depth']})
+• Записано: {writes['written']}, ошибок: {writes['failed']}
+• Объединено повторных: {writes['coalesced']}
+• Сброс пачки: {writes['avg_flush_ms']:.1f} мс в среднем, {writes['max_flush_ms']:.1f} мс максимум
+
+📸 Снимки сессий:
+• Последний снимок: {snapshots['last_saved']} сессий за {snapshots['last_save_ms']:.0f} мс
+• При старте загружено: {snapshots['loaded']} за {snapshots['last_load_ms']:.0f} мс (отброшено {snapshots['dropped']})
+
+🚫 Недоступные получатели:
+• Всего: {dead['total']}
+• Заблокировали бота: {dead['blocked']}
+• Удалили аккаунт: {dead['deactivated']}
+• Чат не найден: {dead['chat_not_found']}
+• Сэкономлено отправок в последней рассылке: {saved_sends}
+
+📤 Очередь исходящих:
+• Ожидают: ответы {outgoing['interactive_depth']}, рассылка {outgoing['bulk_depth']}
+• Отправлено: {outgoing['sent']}, повторов: {outgoing['retried']}, ошибок: {outgoing['failed']}
+• Ответов 429: {outgoing['rate_limited']}
+• Ожидание ответов: p50 {interactive['p50_ms']:.0f} мс, p95 {interactive['p95_ms']:.0f} мс
+• Ожидание рассылки: p50 {bulk['p50_ms']:.0f} мс, p95 {bulk['p95_ms']:.0f} мс
+
+⏱️ Самые медленные обработчики:
+{slowest}
         """
         
         markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
@@ -2555,9 +2962,39 @@ def detailed_statistics(message):
         bot.reply_to(message, text, reply_markup=markup)
         
     except Exception as e:
+        logger.exception("Ошибка в detailed_statistics")
         bot.reply_to(message, f"❌ Ошибка при получении статистики: {e}")
 
-@bot.message_handler(func=lambda message: message.text == '⬅️ Назад')
+@router.text('🔥 Профилирование')
+def start_profiling(message):
+    """Снять профиль работающего бота и прислать его файлом"""
+    user_id = message.from_user.id
+    
+    if not is_admin(user_id):
+        bot.reply_to(message, "❌ Доступ запрещен")
+        return
+    
+    chat_id = message.chat.id
+    
+    def send_profile(profile):
+        try:
+            name = f"itbot-{datetime.now().strftime('%Y%m%d-%H%M%S')}.folded"
+            document = io.BytesIO(profile.collapsed().encode('utf-8'))
+            caption = (f"🔥 Профиль за {profile.elapsed:.0f} с: {profile.samples} выборок, "
+                       f"{len(profile.stacks)} стеков, пропущено простаивающих: {profile.idle}\n"
+                       f"Открыть: speedscope.app или flamegraph.pl {name} > profile.svg")
+            bot.send_document(chat_id, document, visible_file_name=name, caption=caption)
+        except Exception:
+            logger.exception("Ошибка отправки профиля")
+    
+    duration = Config.PROFILER_DURATION
+    if not profiler.start(duration, send_profile):
+        left = max(0, profiler.started_at + profiler.duration - datetime.now().timestamp())
+        bot.reply_to(message, f"⏳ Профилирование уже идет, осталось ~{left:.0f} с")
+        return
+    bot.reply_to(message, f"🔥 Профилирование запущено на {duration} с, файл придет в этот чат")
+
+@router.text('⬅️ Назад')
 def go_back(message):
     """Возврат в главное меню админ-панели"""
     user_id = message.from_user.id
@@ -2567,7 +3004,7 @@ def go_back(message):
     
     admin_panel(message)
 
-@bot.message_handler(func=lambda message: message.text == '⬅️ Выход')
+@router.text('⬅️ Выход')
 def exit_admin(message):
     """Выход из админ-панели"""
     user_id = message.from_user.id
@@ -2596,22 +3033,27 @@ def exit_admin(message):
     
     bot.reply_to(message, welcome_text, reply_markup=markup)
 
-@bot.message_handler(func=lambda message: message.text == 'Подробный отчёт')
+@router.text('Подробный отчёт')
 def handle_detailed_report(message):
     try:
         user_id = message.from_user.id
-        state = user_states.get(user_id) or {}
-        scores = state.get('saved_scores')
-        percentages = state.get('saved_percentages')
-        top_spec = state.get('saved_specialization')
-        answers = state.get('answers', {})
+        state = get_result_session(user_id)
+        if state is None:
+            bot.reply_to(message, "❌ Нет данных для отчёта. Пройдите тест заново.")
+            return
+        
+        results = state.saved_results()
+        top_spec = state.saved_specialization
         
-        if not scores or not percentages or not top_spec or not answers:
+        if results is None or not top_spec:
             bot.reply_to(message, "❌ Нет данных для отчёта. Пройдите тест заново.")
             return
         
-        # Анализируем каждый ответ
-        analysis = analyze_answers(answers)
+        # Количество ответов по категориям накоплено во время теста
+        _, category_counts, percentages = results
+        
+        # Анализируем склонности
+        analysis = analyze_answers(category_counts)
         
         # Формируем подробный отчёт
         lines = [f"📊 <b>ДЕТАЛЬНЫЙ АНАЛИЗ ВАШИХ ОТВЕТОВ</b>\n"]
@@ -2654,10 +3096,11 @@ def handle_detailed_report(message):
         
         bot.send_message(message.chat.id, "\n".join(lines), parse_mode='HTML')
     except Exception as e:
+        logger.exception("Ошибка в handle_detailed_report")
         bot.reply_to(message, f"❌ Ошибка: {e}")
 
-def analyze_answers(answers):
-    """Анализирует ответы пользователя и создает персонализированный отчет"""
+def analyze_answers(category_counts):
+    """Анализирует ответы пользователя (количество по категориям) и создает персонализированный отчет"""
     analysis = {
         'tendencies': '',
         'strengths': [],
@@ -2667,18 +3110,6 @@ def analyze_answers(answers):
         'next_steps': []
     }
     
-    # Подсчитываем ответы по категориям
-    category_counts = {'code': 0, 'data': 0, 'design': 0, 'security': 0, 'devops': 0, 'mobile': 0, 'game': 0, 'ai_ml': 0}
-    
-    for question_id, answer_value in answers.items():
-        question = db.get_question(int(question_id))
-        if question:
-            for option in question['options']:
-                if option['value'] == answer_value:
-                    category = option['category']
-                    category_counts[category] += 1
-                    break
-    
     # Определяем основные склонности
     max_category = max(category_counts, key=category_counts.get)
     max_count = category_counts[max_category]
@@ -2990,13 +3421,84 @@ def analyze_answers(answers):
 # ОБЩИЙ ОБРАБОТЧИК (должен быть ПОСЛЕ всех специфических обработчиков)
 # ============================================================================
 
-@bot.message_handler(func=lambda message: True)
+# Исходы обработки ответа на вопрос теста
+ANSWER_NO_SESSION = 'no_session'
+ANSWER_FINISHED = 'finished'
+ANSWER_NOT_FOUND = 'not_found'
+ANSWER_INVALID = 'invalid'
+ANSWER_NEXT = 'next'
+ANSWER_COMPLETE = 'complete'
+
+def accept_answer(user_id, text):
+    """Проверить и записать ответ на текущий вопрос.
+    
+    Возвращает (исход, следующий вопрос или None). Не отправляет сообщений и
+    не ходит в базу синхронно, поэтому используется и в асинхронном режиме.
+    """
+    # Проверяем, есть ли активная сессия
+    current_state = user_sessions.get(user_id)
+    if current_state is None:
+        return ANSWER_NO_SESSION, None
+    
+    # Проверяем, что тест еще не завершен
+    if current_state.finished:
+        return ANSWER_FINISHED, None
+    
+    current_question = current_state.current_question
+    
+    # Берем вопрос из снимка каталога
+    catalog = catalog_holder.current()
+    question = catalog.by_position(current_question)
+    
+    # Проверяем, что номер вопроса в пределах
+    if question is None:
+        return ANSWER_NOT_FOUND, None
+    
+    # Проверяем, что ответ соответствует одному из вариантов
+    answer = question.answers.get(text)
+    
+    logger.debug("Пользователь %s, вопрос %s: ответ %r", user_id, current_question, text, extra=LOG_ANSWER)
+    
+    if answer is None:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Ответ %r не найден среди допустимых: %s", text, list(question.answers))
+        return ANSWER_INVALID, None
+    
+    # Сохраняем ответ, сразу учитываем его в баллах и переходим к следующему
+    # вопросу - под блокировкой сессии, чтобы снимок не застал их по отдельности
+    answer_value, answer_category, option_index = answer
+    with user_sessions.locked(user_id):
+        current_state.record_answer(current_question, option_index, answer_value, answer_category)
+        current_state.current_question += 1
+    
+    # Обновляем в базе данных (запись в фоне, пачками)
+    answer_writer.submit(user_id, question.id, answer_value)
+    
+    logger.debug("Пользователь %s: следующий вопрос %s из %s", user_id, current_state.current_question,
+                 catalog.total, extra=LOG_ANSWER)
+    
+    next_question = catalog.by_position(current_state.current_question)
+    if next_question is None:
+        return ANSWER_COMPLETE, None
+    return ANSWER_NEXT, next_question
+
+def answer_reply(outcome, user_id):
+    """Текст ответа пользователю для исходов без следующего вопроса"""
+    if outcome == ANSWER_NO_SESSION:
+        return "Нажмите 'Начать тест' для начала тестирования"
+    if outcome == ANSWER_FINISHED:
+        return "❌ Тест уже завершен. Нажмите 'Начать тест' для нового тестирования."
+    if outcome == ANSWER_NOT_FOUND:
+        session = user_sessions.get(user_id)
+        return f"❌ Вопрос {session.current_question if session else '?'} не найден"
+    return "❌ Пожалуйста, выберите один из предложенных вариантов"
+
+@router.fallback
 def handle_all_messages(message):
     """Обработка всех остальных сообщений"""
     user_id = message.from_user.id
     
-    # Отладочная информация
-    print(f"🔍 Получено сообщение от {user_id}: '{message.text}'")
+    logger.debug("Сообщение от %s: %r", user_id, message.text, extra=LOG_MESSAGE)
     
     # Проверяем команды в первую очередь
     if message.text.startswith('/'):
@@ -3016,118 +3518,52 @@ def handle_all_messages(message):
         # Пользователь в админ-панели, не обрабатываем здесь
         return
     
-    # Проверяем, есть ли активная сессия
-    if user_id not in user_states:
-        bot.reply_to(message, "Нажмите 'Начать тест' для начала тестирования")
-        return
-    
-    current_state = user_states[user_id]
-    
-    # Проверяем, что тест еще не завершен
-    if 'current_question' not in current_state:
-        bot.reply_to(message, "❌ Тест уже завершен. Нажмите 'Начать тест' для нового тестирования.")
-        return
-    
-    current_question = current_state['current_question']
-    
-    # Получаем все вопросы из БД
-    all_questions = db.get_all_questions()
-    question_ids = sorted(all_questions.keys())
-    
-    # Проверяем, что номер вопроса в пределах
-    if current_question > len(question_ids):
-        bot.reply_to(message, f"❌ Вопрос {current_question} не найден")
-        return
-    
-    # Получаем вопрос по номеру
-    question_id = question_ids[current_question - 1]
-    question = all_questions[question_id]
-    
-    # Проверяем, что ответ соответствует одному из вариантов
-    valid_answers = [option['text'] for option in question['options']]
-    
-    # Добавляем отладочную информацию
-    print(f"🔍 Вопрос {current_question}:")
-    print(f"📝 Полученный ответ: '{message.text}'")
-    print(f"✅ Допустимые ответы: {valid_answers}")
+    outcome, question = accept_answer(user_id, message.text)
     
-    if message.text not in valid_answers:
-        bot.reply_to(message, "❌ Пожалуйста, выберите один из предложенных вариантов")
-        print(f"❌ Ответ не найден в списке допустимых")
-        return
-    
-    # Сохраняем ответ
-    answer_value = next(option['value'] for option in question['options'] if option['text'] == message.text)
-    current_state['answers'][str(question_id)] = answer_value
-    
-    # Обновляем в базе данных
-    try:
-        db.update_user_answers(user_id, question_id, answer_value)
-    except Exception as e:
-        print(f"❌ Ошибка при обновлении ответов: {e}")
-    
-    # Переходим к следующему вопросу
-    current_state['current_question'] += 1
-    
-    total_questions = len(question_ids)
-    print(f"🔍 Текущий вопрос: {current_state['current_question']}, Всего вопросов: {total_questions}")
-    
-    if current_state['current_question'] <= total_questions:
+    if outcome == ANSWER_NEXT:
         # Отправляем следующий вопрос
-        print(f"📝 Отправляем вопрос {current_state['current_question']}")
-        send_question(message.chat.id, user_id, current_state['current_question'])
-    else:
+        send_question(message.chat.id, user_id, question.position)
+    elif outcome == ANSWER_COMPLETE:
         # Тест завершен
-        print(f"🎉 Тест завершен! Показываем результаты...")
+        logger.info("Пользователь %s завершил тест", user_id)
         show_results(message)
-        return  # Добавляем return чтобы прервать выполнение
+    else:
+        bot.reply_to(message, answer_reply(outcome, user_id))
 
 def show_results(message):
     """Показать результаты теста"""
-    print(f"🚀 Начинаем показ результатов для пользователя {message.from_user.id}")
     try:
         user_id = message.from_user.id
-        current_state = user_states[user_id]
+        current_state = get_result_session(user_id)
         
-        print(f"📊 Состояние пользователя: {current_state}")
-        print(f"📝 Количество ответов: {len(current_state.get('answers', {}))}")
+        logger.debug("Результаты для %s: ответов %s", user_id, current_state.answered, extra=LOG_RESULTS)
         
         # Инициализируем переменные
         spec_info = None
         specialization = None
         
         # Проверяем, есть ли сохраненные результаты
-        if 'saved_scores' in current_state and 'saved_percentages' in current_state:
+        results = current_state.saved_results()
+        if results is not None:
             # Используем сохраненные результаты
-            scores = current_state['saved_scores']
-            specialization_percentages = current_state['saved_percentages']
-            specialization = current_state['saved_specialization']
-            spec_info = current_state['saved_spec_info']
+            scores, counts, specialization_percentages = results
+            specialization = current_state.saved_specialization
+            spec_info = get_spec_info(specialization)
         else:
-            # Вычисляем результаты заново
-            print(f"🔍 Вычисляем результаты заново...")
-            scores = {
-                "code": 0, "data": 0, "design": 0, "security": 0,
-                "devops": 0, "mobile": 0, "game": 0, "ai_ml": 0
-            }
-            
-            print(f"📝 Обрабатываем {len(current_state['answers'])} ответов...")
-            for question_id, answer_value in current_state['answers'].items():
-                print(f"🔍 Вопрос {question_id}: значение {answer_value}")
-                question = db.get_question(int(question_id))
-                if question:
-                    for option in question['options']:
-                        if option['value'] == answer_value:
-                            category = option['category']
-                            scores[category] += answer_value
-                            print(f"✅ Добавили {answer_value} к категории {category}")
-                            break
+            # Баллы накоплены по ходу теста; пересчет нужен только если их нет
+            if any(current_state.counts) or not current_state.answered:
+                scores = as_dict(current_state.scores)
+                counts = as_dict(current_state.counts)
+            else:
+                logger.debug("Пересчет баллов %s по %s ответам", user_id, current_state.answered)
+                engine = engine_for(catalog_holder.current())
+                scores, counts = engine.score(engine.position_vector(current_state.answers))
+                scores, counts = as_dict(scores), as_dict(counts)
             
-            print(f"📊 Итоговые баллы: {scores}")
+            logger.debug("Баллы %s: %s", user_id, scores, extra=LOG_RESULTS)
             
             # Вычисляем проценты для всех 8 специализаций
             total_score = sum(scores.values())
-            print(f"📊 Общий балл: {total_score}")
             
             if total_score > 0:
                 # Базовые проценты для всех категорий
@@ -3142,8 +3578,6 @@ def show_results(message):
                     "ai_ml": int((scores["ai_ml"] / total_score) * 100)
                 }
                 
-                print(f"📊 Базовые проценты: {base_percentages}")
-                
                 # Вычисляем проценты для всех 8 специализаций
                 specialization_percentages = {
                     "Программная инженерия": base_percentages["code"],
@@ -3171,11 +3605,8 @@ def show_results(message):
                     "AI/ML инженерия": 0
                 }
             
-            print(f"📊 Проценты специализаций: {specialization_percentages}")
-            
             # Определяем специализацию на основе максимального балла и комбинаций
             max_score = max(scores.values())
-            print(f"🎯 Максимальный балл: {max_score}")
             
             # Улучшенная логика определения специализации с поддержкой всех 8 категорий
             # Сначала проверяем прямые категории
@@ -3210,12 +3641,13 @@ def show_results(message):
                     max_spec = max(specialization_percentages.items(), key=lambda x: x[1])
                     specialization = max_spec[0]
             
-            print(f"🎯 Определена специализация: {specialization}")
+            logger.debug("Пользователь %s: проценты %s, специализация %s", user_id,
+                         specialization_percentages, specialization, extra=LOG_RESULTS)
             
             # Получаем информацию о специализации из БД
-            spec_info = db.get_specialization_from_code(specialization)
-            
-            print(f"📊 Информация о специализации: {spec_info}")
+            spec_info = get_spec_info(specialization)
+            if not spec_info:
+                logger.warning("Специализация %s не найдена в базе", specialization)
         
         if spec_info:
             # Получаем университеты для этой специализации
@@ -3305,53 +3737,146 @@ def show_results(message):
         markup.add(types.KeyboardButton('Начать тест'))
         markup.add(types.KeyboardButton('Помощь'))
         
-        # Сохраняем информацию о специализации для кнопки "Все вузы" и отчёта
-        if spec_info:
-            current_state['specialization_id'] = spec_info['id']
-            current_state['specialization_name'] = spec_info['name']
-            current_state['show_all_universities'] = True
-        else:
-            current_state['show_all_universities'] = False
+        # Изменения сессии - под ее блокировкой, чтобы снимок не застал их по отдельности
+        with user_sessions.locked(user_id):
+            # Сохраняем информацию о специализации для кнопки "Все вузы" и отчёта
+            current_state.show_all_universities = bool(spec_info)
+            
+            # Сохраняем результаты для повторного использования (только при первом показе)
+            if results is None:
+                current_state.save_results(scores, counts, specialization_percentages, specialization)
             
-        # Сохраняем результаты для повторного использования (только при первом показе)
-        if 'saved_scores' not in current_state:
-            current_state['saved_scores'] = scores
-            current_state['saved_percentages'] = specialization_percentages
-            current_state['saved_specialization'] = specialization
-            current_state['saved_spec_info'] = spec_info
+            # Удаляем только данные текущего теста
+            current_state.current_question = None
         
-        # Удаляем только данные текущего теста
-        if 'current_question' in current_state:
-            del current_state['current_question']
+        # Результат переживет вытеснение сессии из памяти
+        if results is None:
+            try:
+                results_store.save(
+                    user_id, specialization,
+                    spec_info['id'] if spec_info else None,
+                    spec_info['name'] if spec_info else None,
+                    scores, counts, specialization_percentages
+                )
+            except Exception as e:
+                logger.error("Ошибка сохранения результатов пользователя %s: %s", user_id, e)
         
-        print(f"📤 Отправляем результаты пользователю...")
         bot.send_message(message.chat.id, result_text, reply_markup=markup, disable_web_page_preview=True)
-        print(f"✅ Результаты отправлены успешно!")
         
         # НЕ очищаем состояние пользователя - он нужен для кнопки "Все вузы"
         
     except Exception as e:
-        print(f"❌ Ошибка в show_results: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Ошибка в show_results")
         bot.send_message(message.chat.id, "❌ Ошибка при показе результатов")
 
+def route_message(message):
+    """Передать сообщение маршрутизатору"""
+    # Пользователь снова пишет боту - значит, рассылки ему доходят
+    mark_user_active(message.from_user.id)
+    handler = router.resolve(message)
+    if handler is not None:
+        # Время каждого обработчика попадает в гистограмму под его именем
+        with handler_metrics.time(handler.__name__):
+            handler(message)
+
+# Все текстовые сообщения, кроме команд, разбирает маршрутизатор
+bot.register_message_handler(route_message, func=lambda message: True)
+
+def start_services(resume_broadcasts=True):
+    """Восстановить сессии, запустить их снимки и продолжить прерванную рассылку"""
+    global metrics_server
+    
+    # Эндпоинт /metrics
+    if Config.METRICS_PORT:
+        try:
+            metrics_server = MetricsServer(metrics_registry, Config.METRICS_HOST, Config.METRICS_PORT).start()
+            print(f"📈 Метрики: http://{Config.METRICS_HOST}:{Config.METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"❌ Ошибка запуска сервера метрик: {e}")
+    
+    # Восстанавливаем сессии, начатые до перезапуска
+    try:
+        restored = session_snapshotter.load()
+        snapshot_stats = session_snapshotter.stats()
+        print(f"📸 Восстановлено сессий: {restored} за {snapshot_stats['last_load_ms']:.0f} мс "
+              f"(отброшено {snapshot_stats['dropped']})")
+    except Exception as e:
+        print(f"❌ Ошибка загрузки снимка сессий: {e}")
+    session_snapshotter.start()
+    
+    # Продолжаем рассылку, прерванную перезапуском
+    if resume_broadcasts:
+        try:
+            if broadcast_manager.resume():
+                print("📢 Продолжаем незавершенную рассылку")
+        except Exception as e:
+            print(f"❌ Ошибка возобновления рассылки: {e}")
+
+def stop_services():
+    """Дообработать принятые обновления, дописать ответы, сохранить сессии и отправить очередь"""
+    bot.update_executor.stop()
+    answer_writer.stop()
+    try:
+        session_snapshotter.stop()
+    except Exception as e:
+        print(f"❌ Ошибка сохранения снимка сессий: {e}")
+    # Отправляем то, что осталось в очереди исходящих
+    bot.outbox.stop()
+    if metrics_server is not None:
+        metrics_server.stop()
+
 # ===== КОНЕЦ ФАЙЛА =====
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IT-профориентационный бот")
+    parser.add_argument('--mode', choices=['sync', 'async', 'webhook'], default=Config.BOT_MODE,
+                        help="sync - TeleBot с потоками, async - AsyncTeleBot (asyncio), "
+                             "webhook - прием обновлений через вебхук")
+    args = parser.parse_args()
+    
     print("🤖 Запуск исправленного IT-профориентационного бота...")
     print("=" * 50)
     print("✅ Все зависимости установлены")
     print("✅ Конфигурация проверена")
     print("✅ База данных найдена")
     print("=" * 50)
-    print("🚀 Запуск бота...")
+    
+    start_services()
+    
+    print(f"🚀 Запуск бота (режим: {args.mode})...")
     print("Для остановки нажмите Ctrl+C")
     print("=" * 50)
     
+    webhook_server = None
     try:
-        bot.polling(none_stop=True)
+        if args.mode == 'async':
+            import async_bot
+            async_bot.run(sys.modules[__name__])
+        elif args.mode == 'webhook':
+            from webhook import WebhookServer
+            webhook_server = WebhookServer(
+                bot.process_update,
+                host=Config.WEBHOOK_HOST,
+                port=Config.WEBHOOK_PORT,
+                path=Config.WEBHOOK_PATH,
+                secret_token=Config.WEBHOOK_SECRET or None,
+                max_in_flight=Config.WEBHOOK_MAX_IN_FLIGHT
+            )
+            if Config.WEBHOOK_URL:
+                bot.remove_webhook()
+                bot.set_webhook(url=Config.WEBHOOK_URL, secret_token=Config.WEBHOOK_SECRET or None,
+                                max_connections=Config.WEBHOOK_MAX_CONNECTIONS)
+            host, port = webhook_server.address
+            print(f"🌐 Вебхук слушает http://{host}:{port}{Config.WEBHOOK_PATH}")
+            webhook_server.serve_forever()
+        else:
+            bot.polling(none_stop=True)
     except KeyboardInterrupt:
         print("\n🛑 Бот остановлен")
     except Exception as e:
-        print(f"❌ Ошибка при запуске бота: {e}") 
\ No newline at end of file
+        print(f"❌ Ошибка при запуске бота: {e}")
+    finally:
+        if webhook_server is not None:
+            webhook_server.close()
+            print(f"🌐 Вебхук: {webhook_server.stats()}")
+        stop_services()
\ No newline at end of file
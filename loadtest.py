@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: виртуальные пользователи проходят весь тест.
+
+Запускает fake_telegram.py и бота (отдельным процессом, направленным на
+локальный API), затем N виртуальных пользователей делают то же, что живые:
+/start, "Начать тест", ответы на все вопросы, "Подробный отчёт" и "Все вузы".
+Между шагами пользователь «думает» - пауза с логнормальным распределением
+(большинство отвечает за несколько секунд, некоторые задумываются надолго).
+
+Для каждого шага измеряется время от сообщения пользователя до первого ответа
+бота; в отчете p50/p95/p99 по шагам и сообщений в секунду от бота.
+
+Бот работает на копии базы, а снимок сессий и состояние рассылки держит во
+временном каталоге, поэтому рабочие сессии и незавершенная рассылка не
+загружаются и не перезаписываются.
+
+Запуск (по умолчанию на копии базы, чтобы не засорять рабочую):
+    python loadtest.py --users 200 --ramp 30 --think-median 2
+    python loadtest.py --users 50 --no-bot --port 8081    # бот уже запущен
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from fake_telegram import FakeTelegram
+
+FIRST_USER_ID = 10_000_000
+STEPS = ('start', 'begin_test', 'answer', 'results', 'detailed_report', 'all_universities')
+
+
+def keyboard_buttons(entry):
+    """Тексты кнопок обычной клавиатуры в сообщении бота"""
+    markup = entry.get('reply_markup') or {}
+    return [button['text'] if isinstance(button, dict) else button
+            for row in markup.get('keyboard', ()) for button in row]
+
+
+def is_question(entry):
+    return (entry.get('text') or '').startswith('❓ Вопрос')
+
+
+def is_results(entry):
+    return 'Подробный отчёт' in keyboard_buttons(entry)
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(math.ceil(len(ordered) * p / 100)) - 1)]
+
+
+class StepStats:
+    """Задержки ответов бота по шагам сценария"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {step: [] for step in STEPS}
+        self.timeouts = dict.fromkeys(STEPS, 0)
+
+    def add(self, step, seconds):
+        with self._lock:
+            self.latencies[step].append(seconds)
+
+    def timeout(self, step):
+        with self._lock:
+            self.timeouts[step] += 1
+
+    def summary(self):
+        result = {}
+        with self._lock:
+            for step in STEPS:
+                ordered = sorted(self.latencies[step])
+                result[step] = {
+                    'count': len(ordered),
+                    'timeouts': self.timeouts[step],
+                    'p50_ms': percentile(ordered, 50) * 1000,
+                    'p95_ms': percentile(ordered, 95) * 1000,
+                    'p99_ms': percentile(ordered, 99) * 1000,
+                    'max_ms': (ordered[-1] if ordered else 0.0) * 1000,
+                }
+        return result
+
+
+class VirtualUser:
+    """Один пользователь, проходящий сценарий целиком"""
+
+    def __init__(self, api, user_id, stats, think, rng, timeout):
+        self.api = api
+        self.user_id = user_id
+        self.stats = stats
+        self.think = think
+        self.rng = rng
+        self.timeout = timeout
+        self.completed = False
+
+    def _pause(self):
+        time.sleep(self.think(self.rng))
+
+    def _send(self, text, accept=None):
+        """Отправить text и дождаться ответа, подходящего под accept.
+
+        Возвращает (сообщение бота, задержка) или (None, None) по таймауту.
+        """
+        seen = len(self.api.sent_to(self.user_id))
+        started = time.monotonic()
+        self.api.push_message(self.user_id, text)
+        deadline = started + self.timeout
+        while True:
+            try:
+                messages = self.api.wait_for_messages(self.user_id, seen + 1,
+                                                      max(0.0, deadline - time.monotonic()))
+            except TimeoutError:
+                return None, None
+            for entry in messages[seen:]:
+                if accept is None or accept(entry):
+                    return entry, time.monotonic() - started
+            seen = len(messages)
+
+    def _step(self, step, text, accept=None):
+        entry, latency = self._send(text, accept)
+        if entry is None:
+            self.stats.timeout(step)
+        else:
+            self.stats.add(step, latency)
+        return entry
+
+    def run(self):
+        if self._step('start', '/start') is None:
+            return
+        self._pause()
+        question = self._step('begin_test', 'Начать тест', is_question)
+        if question is None:
+            return
+        while True:
+            self._pause()
+            answer = self.rng.choice(keyboard_buttons(question))
+            reply, latency = self._send(answer, lambda entry: is_question(entry) or is_results(entry))
+            if reply is None:
+                self.stats.timeout('answer')
+                return
+            if is_results(reply):
+                # Последний ответ - время до показа результатов
+                self.stats.add('results', latency)
+                break
+            self.stats.add('answer', latency)
+            question = reply
+        self._pause()
+        if self._step('detailed_report', 'Подробный отчёт') is None:
+            return
+        self._pause()
+        if self._step('all_universities', 'Все вузы') is None:
+            return
+        self.completed = True
+
+
+def lognormal_think(median, sigma, cap):
+    """Пауза пользователя: логнормальное распределение с медианой median, не дольше cap"""
+    mu = math.log(median) if median > 0 else 0.0
+
+    def think(rng):
+        if median <= 0:
+            return 0.0
+        return min(cap, rng.lognormvariate(mu, sigma))
+
+    return think
+
+
+def start_bot(command, api_url, db_url, workdir):
+    """Запустить бота отдельным процессом, направленным на локальный API.
+
+    Файлы состояния бота (снимок сессий, прогресс рассылки) - в workdir.
+    """
+    env = dict(os.environ)
+    env['TELEGRAM_API_URL'] = api_url
+    env['BOT_TOKEN'] = '1:loadtest'
+    env['BOT_SESSION_SNAPSHOT_PATH'] = os.path.join(workdir, 'sessions.snapshot')
+    env['BOT_BROADCAST_STATE_PATH'] = os.path.join(workdir, 'broadcast.json')
+    if db_url:
+        env['BOT_DB_URL'] = db_url
+    return subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+
+
+def wait_for_polling(api, timeout):
+    deadline = time.monotonic() + timeout
+    while api.stats()['requests'].get('getUpdates', 0) == 0:
+        if time.monotonic() > deadline:
+            raise TimeoutError("Бот не начал опрашивать getUpdates")
+        time.sleep(0.1)
+
+
+def run_load(api, users, ramp, think, timeout, seed):
+    """Запустить users виртуальных пользователей и дождаться их; возвращает отчет"""
+    stats = StepStats()
+    virtual_users = [
+        VirtualUser(api, FIRST_USER_ID + n, stats, think, random.Random(seed + n), timeout)
+        for n in range(users)
+    ]
+    threads = [threading.Thread(target=user.run, name=f'vu-{n}', daemon=True)
+               for n, user in enumerate(virtual_users)]
+
+    sent_before = api.stats()['sent']
+    started = time.monotonic()
+    for n, thread in enumerate(threads):
+        # Пользователи приходят равномерно в течение ramp секунд
+        delay = started + ramp * n / max(1, users) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    api_stats = api.stats()
+    sent = api_stats['sent'] - sent_before
+    return {
+        'users': users,
+        'completed': sum(user.completed for user in virtual_users),
+        'seconds': elapsed,
+        'bot_messages': sent,
+        'messages_per_second': sent / elapsed if elapsed else 0.0,
+        'rate_limited': api_stats['rate_limited'],
+        'steps': stats.summary(),
+    }
+
+
+def print_report(report):
+    print("=" * 72)
+    print(f"👥 Пользователей: {report['users']}, прошли сценарий: {report['completed']}")
+    print(f"⏱️ Длительность: {report['seconds']:.1f} с")
+    print(f"📤 Сообщений бота: {report['bot_messages']} ({report['messages_per_second']:.1f}/с), "
+          f"429: {report['rate_limited']}")
+    print(f"{'шаг':<18} {'кол-во':>7} {'таймауты':>9} {'p50, мс':>9} {'p95, мс':>9} {'p99, мс':>9} {'max, мс':>9}")
+    for step, row in report['steps'].items():
+        print(f"{step:<18} {row['count']:>7} {row['timeouts']:>9} {row['p50_ms']:>9.0f} "
+              f"{row['p95_ms']:>9.0f} {row['p99_ms']:>9.0f} {row['max_ms']:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальном API")
+    parser.add_argument('--users', type=int, default=100, help="виртуальных пользователей")
+    parser.add_argument('--ramp', type=float, default=10.0, help="за сколько секунд приходят все пользователи")
+    parser.add_argument('--think-median', type=float, default=2.0, help="медиана паузы между шагами, с")
+    parser.add_argument('--think-sigma', type=float, default=0.6, help="разброс паузы (sigma логнормального)")
+    parser.add_argument('--think-max', type=float, default=30.0, help="максимальная пауза, с")
+    parser.add_argument('--timeout', type=float, default=30.0, help="сколько ждать ответа бота, с")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=0, help="порт локального API (0 - любой свободный)")
+    parser.add_argument('--latency', type=float, default=0.0, help="задержка ответа API, с")
+    parser.add_argument('--rate-limit', type=float, default=0.0, help="доля отправок, получающих 429")
+    parser.add_argument('--db', help="база для бота (по умолчанию - временная копия database/bot_new.db)")
+    parser.add_argument('--bot-cmd', default=f"{sys.executable} fixed_bot.py --mode sync",
+                        help="команда запуска бота")
+    parser.add_argument('--no-bot', action='store_true', help="бот уже запущен и смотрит на --port")
+    parser.add_argument('--json', help="сохранить отчет в JSON")
+    args = parser.parse_args()
+
+    api = FakeTelegram(port=args.port, latency=args.latency, rate_limit_ratio=args.rate_limit,
+                       seed=args.seed).start()
+    print(f"🧪 Локальный API: {api.url}")
+
+    bot_process = None
+    workdir = None
+    try:
+        if not args.no_bot:
+            workdir = tempfile.mkdtemp(prefix='loadtest-')
+            db_url = None
+            if args.db:
+                db_url = f"sqlite:///{args.db}"
+            elif os.path.exists(os.path.join('database', 'bot_new.db')):
+                db_copy = os.path.join(workdir, 'bot_new.db')
+                shutil.copy(os.path.join('database', 'bot_new.db'), db_copy)
+                db_url = f"sqlite:///{db_copy}"
+            bot_process = start_bot(args.bot_cmd.split(), api.url, db_url, workdir)
+        wait_for_polling(api, timeout=60)
+        print(f"🚀 {args.users} пользователей за {args.ramp:.0f} с...")
+
+        think = lognormal_think(args.think_median, args.think_sigma, args.think_max)
+        report = run_load(api, args.users, args.ramp, think, args.timeout, args.seed)
+        report['api'] = api.stats()
+        print_report(report)
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    finally:
+        if bot_process is not None:
+            bot_process.terminate()
+            bot_process.wait(30)
+        api.stop()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Журнал бота без блокировки обработчиков.
+
+Отладочные print в handle_all_messages и show_results писали в stdout по
+несколько строк на каждый ответ, синхронно и под блокировкой потока вывода.
+setup_logging() настраивает корневой logger так:
+
+* обработчики только кладут запись в очередь (QueueHandler), а форматирование
+  и вывод делает отдельный поток (QueueListener);
+* уровень задается конфигурацией: на INFO вызовы logger.debug стоят одну
+  проверку уровня, аргументы не форматируются;
+* записи с extra={'event': имя} прореживаются: из событий с долей 0.01
+  проходит каждое сотое; WARNING и выше проходят всегда;
+* для ошибок вызывается on_error (счетчик ошибок текущего обработчика в
+  metrics.py) - в потоке обработчика, до постановки в очередь.
+"""
+
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import sys
+
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s'
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rates[event] записей каждого события"""
+
+    def __init__(self, rates=None, on_error=None):
+        super().__init__()
+        self._every = {}
+        self._counters = {}
+        for event, rate in (rates or {}).items():
+            # 0 - событие выключено, 1 - каждая запись, 0.01 - каждая сотая
+            self._every[event] = 0 if rate <= 0 else max(1, round(1 / rate))
+            self._counters[event] = itertools.count()
+        self._on_error = on_error
+
+    def filter(self, record):
+        if record.levelno >= logging.ERROR and self._on_error is not None:
+            self._on_error()
+        if record.levelno >= logging.WARNING:
+            return True
+        event = getattr(record, 'event', None)
+        every = self._every.get(event, 1)
+        if every == 1:
+            return True
+        if every == 0:
+            return False
+        return next(self._counters[event]) % every == 0
+
+
+def setup_logging(level='INFO', sample_rates=None, on_error=None, stream=None):
+    """Направить корневой logger через очередь в фоновый поток; возвращает QueueListener"""
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates, on_error))
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    listener = logging.handlers.QueueListener(log_queue, output)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener.start()
+    # Дописываем очередь при выходе
+    atexit.register(stop_listener, listener)
+    return listener
+
+
+def stop_listener(listener):
+    """Дописать очередь и остановить поток вывода (повторный вызов ничего не делает)"""
+    if listener._thread is not None:
+        listener.stop()
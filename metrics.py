@@ -0,0 +1,229 @@
+"""
+Гистограммы задержек и HTTP-эндпоинт /metrics в текстовом формате Prometheus.
+
+Обработчики сообщали о проблемах только через print, и было не видно, какие
+из них (и какие вызовы Telegram) занимают больше всего времени. Registry
+хранит семейства гистограмм с одной меткой (имя обработчика, метод API):
+количество вызовов, ошибки, сумма и счетчики по корзинам задержки. Также
+можно зарегистрировать датчики (длина очередей, число сессий), которые
+вычисляются в момент запроса.
+
+MetricsServer отдает Registry.render() по GET /metrics; по умолчанию слушает
+только 127.0.0.1.
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current = threading.local()
+
+
+class _Histogram:
+    __slots__ = ('buckets', 'count', 'errors', 'sum')
+
+    def __init__(self, bucket_count):
+        self.buckets = [0] * (bucket_count + 1)   # последняя - +Inf
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+
+
+class HistogramFamily:
+    """Гистограммы задержек с одной меткой (label)"""
+
+    def __init__(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.bounds = tuple(buckets)
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, seconds, error=False):
+        index = bisect.bisect_left(self.bounds, seconds)
+        with self._lock:
+            histogram = self._histograms.get(label_value)
+            if histogram is None:
+                histogram = self._histograms[label_value] = _Histogram(len(self.bounds))
+            histogram.buckets[index] += 1
+            histogram.count += 1
+            histogram.sum += seconds
+            if error:
+                histogram.errors += 1
+
+    def error(self, label_value):
+        """Учесть ошибку, которую обработчик перехватил сам"""
+        with self._lock:
+            histogram = self._histograms.get(label_value)
+            if histogram is None:
+                histogram = self._histograms[label_value] = _Histogram(len(self.bounds))
+            histogram.errors += 1
+
+    @contextmanager
+    def time(self, label_value):
+        """Замерить блок; исключение учитывается как ошибка и пробрасывается"""
+        previous = getattr(_current, 'labels', None)
+        _current.labels = (self, label_value)
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(label_value, time.perf_counter() - started, error)
+            _current.labels = previous
+
+    def timed(self, func):
+        """Декоратор: замер вызовов функции под ее именем"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.time(func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                label_value: (list(histogram.buckets), histogram.count, histogram.errors, histogram.sum)
+                for label_value, histogram in self._histograms.items()
+            }
+
+    def quantile(self, buckets, count, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины)"""
+        if not count:
+            return 0.0
+        target = q * count
+        seen = 0
+        for bound, hits in zip(self.bounds, buckets):
+            seen += hits
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        """{метка: count, errors, avg, p50, p95} для админ-статистики"""
+        result = {}
+        for label_value, (buckets, count, errors, total) in self.snapshot().items():
+            result[label_value] = {
+                'count': count,
+                'errors': errors,
+                'avg': total / count if count else 0.0,
+                'p50': self.quantile(buckets, count, 0.50),
+                'p95': self.quantile(buckets, count, 0.95),
+            }
+        return result
+
+
+def note_error():
+    """Учесть ошибку в замере, который сейчас идет в этом потоке (если есть)"""
+    labels = getattr(_current, 'labels', None)
+    if labels is not None:
+        family, label_value = labels
+        family.error(label_value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if bound != float('inf') else '+Inf'
+
+
+class Registry:
+    """Набор семейств гистограмм и датчиков"""
+
+    def __init__(self, prefix='itbot'):
+        self.prefix = prefix
+        self._families = []
+        self._gauges = []
+
+    def histogram(self, name, help_text, label, buckets=DEFAULT_BUCKETS):
+        family = HistogramFamily(f"{self.prefix}_{name}", help_text, label, buckets)
+        self._families.append(family)
+        return family
+
+    def gauge(self, name, help_text, getter):
+        """Датчик: getter() вызывается при каждом запросе /metrics"""
+        self._gauges.append((f"{self.prefix}_{name}", help_text, getter))
+
+    def render(self):
+        """Текстовый формат Prometheus 0.0.4"""
+        lines = []
+        for family in self._families:
+            snapshot = self.sorted_items(family.snapshot())
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} histogram")
+            for label_value, (buckets, count, errors, total) in snapshot:
+                label = f'{family.label}="{_escape(label_value)}"'
+                cumulative = 0
+                for bound, hits in zip(family.bounds + (float('inf'),), buckets):
+                    cumulative += hits
+                    lines.append(f'{family.name}_bucket{{{label},le="{_format_bound(bound)}"}} {cumulative}')
+                lines.append(f"{family.name}_sum{{{label}}} {total}")
+                lines.append(f"{family.name}_count{{{label}}} {count}")
+            errors_name = family.name.rsplit('_seconds', 1)[0] + '_errors_total'
+            lines.append(f"# HELP {errors_name} Errors ({family.help})")
+            lines.append(f"# TYPE {errors_name} counter")
+            for label_value, (buckets, count, errors, total) in snapshot:
+                lines.append(f'{errors_name}{{{family.label}="{_escape(label_value)}"}} {errors}')
+
+        for name, help_text, getter in self._gauges:
+            try:
+                value = getter()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def sorted_items(snapshot):
+        return sorted(snapshot.items(), key=lambda item: str(item[0]))
+
+
+class MetricsServer:
+    """HTTP-сервер с единственным адресом GET /metrics"""
+
+    def __init__(self, registry, host='127.0.0.1', port=9108):
+        self.registry = registry
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = server.registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='metrics', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
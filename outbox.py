@@ -0,0 +1,342 @@
+"""
+Очередь исходящих сообщений бота.
+
+Обработчики вызывали bot.send_message / bot.reply_to напрямую, и всплески
+(класс из 30 учеников, одновременно начавших тест, или рассылка поверх обычной
+работы) упирались в 429 от Telegram. Outbox пропускает все исходящие вызовы
+API через одну очередь:
+
+* общий лимит на бота (TokenBucket, ~30 сообщений в секунду) и лимит на чат
+  (по умолчанию 1 сообщение в секунду с небольшим запасом);
+* сообщения одного чата уходят строго по порядку;
+* ответы пользователям (PRIORITY_INTERACTIVE) обгоняют рассылки (PRIORITY_BULK);
+* при 429 очередь ждет retry_after, при сетевых ошибках повторяет отправку
+  с экспоненциальной задержкой;
+* задержка в очереди и счетчики доступны через stats(), а при заданном
+  metrics (metrics.Registry) - гистограммы длительности вызовов по методам API
+  и ожидания в очереди.
+
+QueuedTeleBot - TeleBot, у которого send_message, edit_message_text и
+send_document идут через Outbox; вызов ждет отправки и возвращает тот же
+результат, что и обычный TeleBot.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+
+import requests
+import telebot
+from telebot.apihelper import ApiHTTPException, ApiTelegramException
+
+from ratelimit import TokenBucket
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+# Временные сетевые ошибки, после которых вызов повторяется
+RETRYABLE_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, ApiHTTPException)
+
+_context = threading.local()
+
+
+@contextmanager
+def bulk():
+    """Отправки внутри блока идут с низким приоритетом (рассылки)"""
+    previous = getattr(_context, 'priority', PRIORITY_INTERACTIVE)
+    _context.priority = PRIORITY_BULK
+    try:
+        yield
+    finally:
+        _context.priority = previous
+
+
+def current_priority():
+    return getattr(_context, 'priority', PRIORITY_INTERACTIVE)
+
+
+class _Outbound:
+    """Один исходящий вызов API"""
+
+    __slots__ = ('chat_id', 'priority', 'call', 'method', 'future', 'enqueued', 'attempts')
+
+    def __init__(self, chat_id, priority, call, method):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.call = call
+        self.method = method
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+
+
+class _ChatBucket:
+    """Лимит одного чата: rate сообщений в секунду, запас burst"""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst, now):
+        self.tokens = burst
+        self.updated = now
+
+
+class Outbox:
+    """Планировщик исходящих вызовов с общим и початовым лимитами"""
+
+    def __init__(self, global_rate=30, per_chat_rate=1.0, per_chat_burst=3, workers=8,
+                 max_attempts=5, backoff=0.5, latency_window=1000, metrics=None):
+        self.global_limiter = TokenBucket(global_rate)
+        self.per_chat_rate = float(per_chat_rate)
+        self.per_chat_burst = float(per_chat_burst)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        self._cond = threading.Condition()
+        self._chats = {}          # chat_id -> deque(_Outbound)
+        self._busy = set()        # чаты, у которых вызов уже выполняется
+        self._buckets = {}        # chat_id -> _ChatBucket (только недавно писавшие)
+        self._ready = []          # куча (priority, seq, chat_id)
+        self._delayed = []        # куча (when, seq, chat_id)
+        self._seq = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='outbox')
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch, name='outbox-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+        # Метрики
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self._latencies = {
+            PRIORITY_INTERACTIVE: deque(maxlen=latency_window),
+            PRIORITY_BULK: deque(maxlen=latency_window),
+        }
+        self._call_seconds = None
+        self._wait_seconds = None
+        if metrics is not None:
+            self._call_seconds = metrics.histogram(
+                'telegram_call_seconds', "Telegram API call duration by method", 'method')
+            self._wait_seconds = metrics.histogram(
+                'outbox_wait_seconds', "Time spent in the outgoing queue before the first attempt", 'priority')
+
+    # ----- Постановка в очередь -----
+
+    def submit(self, chat_id, call, priority=None, method='call'):
+        """Поставить вызов call() для чата в очередь; возвращает Future"""
+        if priority is None:
+            priority = current_priority()
+        item = _Outbound(chat_id, priority, call, method)
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Очередь исходящих сообщений остановлена")
+            queue = self._chats.get(chat_id)
+            if queue is None:
+                queue = self._chats[chat_id] = deque()
+            queue.append(item)
+            if len(queue) == 1 and chat_id not in self._busy:
+                self._schedule(chat_id, time.monotonic())
+            self._cond.notify()
+        return item.future
+
+    def call(self, chat_id, call, priority=None, method='call'):
+        """Выполнить вызов через очередь и дождаться результата"""
+        return self.submit(chat_id, call, priority, method).result()
+
+    # ----- Планирование (под self._cond) -----
+
+    def _chat_wait(self, chat_id, now):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            return 0.0
+        tokens = min(self.per_chat_burst, bucket.tokens + (now - bucket.updated) * self.per_chat_rate)
+        if tokens >= 1:
+            return 0.0
+        return (1 - tokens) / self.per_chat_rate
+
+    def _take_chat_token(self, chat_id, now):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = _ChatBucket(self.per_chat_burst, now)
+        bucket.tokens = min(self.per_chat_burst, bucket.tokens + (now - bucket.updated) * self.per_chat_rate)
+        bucket.updated = now
+        bucket.tokens -= 1
+
+    def _schedule(self, chat_id, now, delay=0.0):
+        # Первое сообщение чата попадает в готовые или отложенные
+        delay = max(delay, self._chat_wait(chat_id, now))
+        if delay > 0:
+            heapq.heappush(self._delayed, (now + delay, next(self._seq), chat_id))
+        else:
+            priority = self._chats[chat_id][0].priority
+            heapq.heappush(self._ready, (priority, next(self._seq), chat_id))
+
+    def _prune_buckets(self, now):
+        # Ведро, которое уже наполнилось, можно забыть
+        full_after = self.per_chat_burst / self.per_chat_rate
+        stale = [chat_id for chat_id, bucket in self._buckets.items()
+                 if now - bucket.updated > full_after and chat_id not in self._chats]
+        for chat_id in stale:
+            del self._buckets[chat_id]
+
+    def _dispatch(self):
+        last_prune = time.monotonic()
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._delayed)
+                    priority = self._chats[chat_id][0].priority
+                    heapq.heappush(self._ready, (priority, next(self._seq), chat_id))
+
+                if not self._ready:
+                    if not self._running and not self._delayed and not self._busy:
+                        return
+                    timeout = self._delayed[0][0] - now if self._delayed else None
+                    self._cond.wait(timeout)
+                    continue
+
+                wait = self.global_limiter.try_acquire()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                _, _, chat_id = heapq.heappop(self._ready)
+                item = self._chats[chat_id].popleft()
+                self._busy.add(chat_id)
+                self._take_chat_token(chat_id, now)
+
+                if now - last_prune > 60:
+                    last_prune = now
+                    self._prune_buckets(now)
+
+            self._executor.submit(self._execute, item)
+
+    # ----- Выполнение -----
+
+    def _execute(self, item):
+        started = time.monotonic()
+        if item.attempts == 0:
+            self._latencies[item.priority].append(started - item.enqueued)
+            if self._wait_seconds is not None:
+                self._wait_seconds.observe(PRIORITY_NAMES[item.priority], started - item.enqueued)
+        item.attempts += 1
+        retry_delay = None
+        try:
+            result = item.call()
+            self._observe_call(item, started, False)
+            self.sent += 1
+            item.future.set_result(result)
+        except ApiTelegramException as e:
+            self._observe_call(item, started, True)
+            if e.error_code == 429 and item.attempts < self.max_attempts:
+                self.rate_limited += 1
+                retry_delay = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                # Telegram ограничил весь бот - притормаживаем общий лимит
+                self.global_limiter.pause(retry_delay)
+            else:
+                self.failed += 1
+                item.future.set_exception(e)
+        except RETRYABLE_ERRORS as e:
+            self._observe_call(item, started, True)
+            if item.attempts < self.max_attempts:
+                retry_delay = self.backoff * 2 ** (item.attempts - 1)
+            else:
+                self.failed += 1
+                item.future.set_exception(e)
+        except Exception as e:
+            self._observe_call(item, started, True)
+            self.failed += 1
+            item.future.set_exception(e)
+
+        with self._cond:
+            self._busy.discard(item.chat_id)
+            queue = self._chats[item.chat_id]
+            if retry_delay is not None:
+                self.retried += 1
+                # Повтор уходит первым, чтобы не нарушить порядок сообщений чата
+                queue.appendleft(item)
+            if queue:
+                self._schedule(item.chat_id, time.monotonic(), retry_delay or 0.0)
+            else:
+                del self._chats[item.chat_id]
+            self._cond.notify()
+
+    def _observe_call(self, item, started, error):
+        if self._call_seconds is not None:
+            self._call_seconds.observe(item.method, time.monotonic() - started, error)
+
+    def stop(self, timeout=30.0):
+        """Дождаться отправки всего, что уже в очереди, и остановиться"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._dispatcher.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    # ----- Метрики -----
+
+    def depth(self):
+        """Количество ожидающих вызовов по приоритетам"""
+        with self._cond:
+            counts = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0}
+            for queue in self._chats.values():
+                for item in queue:
+                    counts[item.priority] += 1
+        return counts
+
+    @staticmethod
+    def _summary(samples):
+        if not samples:
+            return {'count': 0, 'avg_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+        ordered = sorted(samples)
+        return {
+            'count': len(ordered),
+            'avg_ms': sum(ordered) * 1000 / len(ordered),
+            'p50_ms': ordered[len(ordered) // 2] * 1000,
+            'p95_ms': ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)] * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+
+    def stats(self):
+        """Счетчики и задержка в очереди для админ-статистики"""
+        depth = self.depth()
+        return {
+            'interactive_depth': depth[PRIORITY_INTERACTIVE],
+            'bulk_depth': depth[PRIORITY_BULK],
+            'chats': len(self._chats),
+            'sent': self.sent,
+            'retried': self.retried,
+            'rate_limited': self.rate_limited,
+            'failed': self.failed,
+            'interactive_latency': self._summary(list(self._latencies[PRIORITY_INTERACTIVE])),
+            'bulk_latency': self._summary(list(self._latencies[PRIORITY_BULK])),
+        }
+
+
+class QueuedTeleBot(telebot.TeleBot):
+    """TeleBot, отправляющий сообщения через Outbox"""
+
+    def __init__(self, token, outbox=None, **kwargs):
+        super().__init__(token, **kwargs)
+        self.outbox = outbox or Outbox()
+
+    def send_message(self, chat_id, text, *args, **kwargs):
+        parent = super().send_message
+        return self.outbox.call(chat_id, lambda: parent(chat_id, text, *args, **kwargs),
+                                method='sendMessage')
+
+    def edit_message_text(self, text, chat_id=None, *args, **kwargs):
+        parent = super().edit_message_text
+        return self.outbox.call(chat_id, lambda: parent(text, chat_id, *args, **kwargs),
+                                method='editMessageText')
+
+    def send_document(self, chat_id, document, *args, **kwargs):
+        parent = super().send_document
+        return self.outbox.call(chat_id, lambda: parent(chat_id, document, *args, **kwargs),
+                                method='sendDocument')
@@ -0,0 +1,174 @@
+"""
+Выборочный профилировщик работающего бота.
+
+Когда бот начинает тормозить, по гистограммам metrics.py видно, какой
+обработчик медленный, но не видно, на что уходит время внутри - запросы
+к базе, HTTP к Telegram или сборка текста. SamplingProfiler раз в interval
+секунд снимает стеки всех потоков процесса (sys._current_frames) и считает,
+сколько раз встретился каждый стек. Обработчики при этом не трогаются -
+накладные расходы ограничены одним фоновым потоком, и профиль можно снять
+на рабочем боте без перезапуска.
+
+Потоки пулов (updates, outbox, запись ответов) большую часть времени ждут
+работы в Condition.wait / queue.get; такие выборки по умолчанию пропускаются
+(include_idle=False, как --idle у py-spy), иначе ожидание заслоняет время
+обработчиков. Простоем считается только ожидание прямо в цикле получения
+задач пула (POOL_LOOPS). Ожидание внутри обработчика - ответ Outbox
+(Future.result), блокировка сессии, запрос к базе - остается в профиле: это
+и есть время, которое ищут.
+
+Результат - текст в формате collapsed stacks (как у stackcollapse из
+FlameGraph и у py-spy --format raw): строка "поток;внешняя функция;...;
+внутренняя функция N". Его открывают flamegraph.pl, speedscope.app или
+inferno-flamegraph.
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+# Номер потока в имени (updates-3, outbox-1) - потоки одного пула складываются вместе
+_THREAD_INDEX = re.compile(r'[-_]\d+$')
+
+# Функции ожидания (файл, имя), через которые пул ждет задачу
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+    ('handlers.py', 'dequeue'),
+    ('util.py', 'busy_wait'),           # OrEvent.wait в telebot
+}
+
+# Циклы получения задач (файл, имя): ожидание прямо под ними - простой потока
+POOL_LOOPS = {
+    ('sharding.py', '_run'),            # ShardedExecutor: tasks.get()
+    ('outbox.py', '_dispatch'),         # Outbox: ждет сообщений и токенов
+    ('answer_writer.py', '_run'),       # AnswerWriter: ждет пачку
+    ('session_snapshot.py', '_run'),    # SessionSnapshotter: ждет интервал
+    ('broadcast.py', 'worker'),         # поток рассылки: tasks.get()
+    ('thread.py', '_worker'),           # ThreadPoolExecutor
+    ('handlers.py', '_monitor'),        # QueueListener журнала
+    ('socketserver.py', 'serve_forever'),   # /metrics
+    ('base_events.py', '_run_once'),    # цикл событий asyncio
+    ('util.py', 'run'),                 # WorkerThread telebot
+    ('__init__.py', '__threaded_polling'),  # главный поток bot.polling
+}
+
+
+def _frame_key(frame):
+    code = frame.f_code
+    return os.path.basename(code.co_filename), code.co_name
+
+
+def _is_idle(frame):
+    """Поток ждет в функциях ожидания, вызванных прямо из цикла пула"""
+    key = _frame_key(frame)
+    if key in POOL_LOOPS:
+        # Цикл стоит в C-вызове (SimpleQueue.get) - ждет задачу
+        return True
+    if key not in IDLE_FRAMES:
+        return False
+    while frame is not None:
+        key = _frame_key(frame)
+        if key in POOL_LOOPS:
+            return True
+        if key not in IDLE_FRAMES and key[0] not in ('threading.py', 'queue.py'):
+            # Ожидание вызвано из обработчика (Future.result, блокировка) - не простой
+            return False
+        frame = frame.f_back
+    return False
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Снимает стеки потоков по таймеру; одновременно идет не больше одного замера"""
+
+    def __init__(self, interval=0.01, max_depth=64, include_idle=False):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.include_idle = include_idle
+        self._lock = threading.Lock()
+        self._thread = None
+        self.started_at = None
+        self.duration = 0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, duration, on_done):
+        """Начать замер на duration секунд; по окончании вызывается on_done(profile).
+
+        Возвращает False, если замер уже идет.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self.started_at = time.time()
+            self.duration = duration
+            self._thread = threading.Thread(target=self._run, args=(duration, on_done),
+                                            name='profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def _run(self, duration, on_done):
+        try:
+            profile = self.sample(duration)
+        finally:
+            with self._lock:
+                self._thread = None
+        on_done(profile)
+
+    def sample(self, duration):
+        """Снять стеки за duration секунд (в текущем потоке); возвращает Profile"""
+        own = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        idle = 0
+        started = time.perf_counter()
+        deadline = started + duration
+        while True:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.include_idle and _is_idle(frame):
+                    idle += 1
+                    continue
+                stacks[self._collapse(names.get(ident, 'thread'), frame)] += 1
+            samples += 1
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            time.sleep(min(self.interval, deadline - now))
+        return Profile(stacks, samples, time.perf_counter() - started, idle)
+
+    def _collapse(self, thread_name, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.append(_THREAD_INDEX.sub('', thread_name))
+        labels.reverse()
+        return ';'.join(labels)
+
+
+class Profile:
+    """Результат замера: {стек: число выборок}"""
+
+    def __init__(self, stacks, samples, elapsed, idle=0):
+        self.stacks = stacks
+        self.samples = samples
+        self.elapsed = elapsed
+        self.idle = idle    # пропущенные стеки простаивающих потоков
+
+    def collapsed(self):
+        """Текст в формате collapsed stacks"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
@@ -0,0 +1,93 @@
+"""
+Ограничение частоты запросов к Telegram Bot API.
+
+Telegram допускает около 30 сообщений в секунду на бота; при превышении API
+отвечает 429 с retry_after. TokenBucket выдает не больше rate токенов в
+секунду (с запасом до capacity) и умеет приостанавливать выдачу целиком,
+когда Telegram попросил подождать.
+
+Лимит Telegram - на бота, а не на процесс. SharedTokenBucket - то же ведро
+в общей памяти: его создают до запуска рабочих процессов (supervisor.py), и
+все процессы берут токены из одного запаса.
+"""
+
+import multiprocessing
+import threading
+import time
+
+
+class TokenBucket:
+    """Потокобезопасное ведро токенов"""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Взять токены без ожидания; возвращает 0 или сколько секунд ждать"""
+        with self._lock:
+            now = self._clock()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, timeout=None):
+        """Дождаться токенов; False, если не успели за timeout секунд"""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            self._sleep(wait)
+
+    def pause(self, seconds):
+        """Не выдавать токены ближайшие seconds секунд (ответ 429)"""
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            # После паузы не отдаем накопленный запас разом
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+
+def _shared_field(index):
+    """Поле состояния ведра, хранящееся в общей памяти"""
+    def set_value(self, value):
+        self._state[index] = value
+    return property(lambda self: self._state[index], set_value)
+
+
+class SharedTokenBucket(TokenBucket):
+    """TokenBucket, общий для процессов, созданных после него (fork)"""
+
+    def __init__(self, rate, capacity=None, context=None, clock=time.monotonic, sleep=time.sleep):
+        context = context or multiprocessing
+        # tokens, updated, paused_until; time.monotonic одно на всю систему
+        self._state = context.RawArray('d', 3)
+        super().__init__(rate, capacity, clock, sleep)
+        self._lock = context.Lock()
+
+    _tokens = _shared_field(0)
+    _updated = _shared_field(1)
+    _paused_until = _shared_field(2)
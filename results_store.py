@@ -0,0 +1,126 @@
+"""
+Сохраненные результаты теста.
+
+Сессия пользователя может быть вытеснена из памяти (см. sessions.py), а кнопки
+"Все вузы", "Назад к результатам" и "Подробный отчёт" должны работать и после
+этого. Поэтому итог теста записывается в таблицу test_results, и при промахе
+по хранилищу сессий результаты восстанавливаются оттуда.
+
+Таблица test_starts хранит время начала последнего теста пользователя. Вместе
+с test_results она позволяет выбирать сегменты для рассылок (см. segments.py);
+индексы построены под эти выборки с обходом по user_id.
+"""
+
+import json
+import time
+
+from storage import connect
+
+
+class ResultsStore:
+    """Таблица последних результатов теста каждого пользователя"""
+
+    def __init__(self, db_url):
+        self.db_url = db_url
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        conn = connect(self.db_url)
+        try:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS test_results (
+                    user_id INTEGER PRIMARY KEY,
+                    specialization TEXT,
+                    specialization_id INTEGER,
+                    specialization_name TEXT,
+                    scores TEXT NOT NULL,
+                    counts TEXT NOT NULL,
+                    percentages TEXT NOT NULL,
+                    finished_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS test_starts (
+                    user_id INTEGER PRIMARY KEY,
+                    started_at REAL NOT NULL
+                )
+                """
+            )
+            # Сегменты рассылок: по специализации, по дате завершения, брошенные тесты
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_test_results_specialization "
+                "ON test_results (specialization, user_id)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_test_results_finished_at "
+                "ON test_results (finished_at)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_test_starts_started_at "
+                "ON test_starts (started_at)"
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_start(self, user_id):
+        """Запомнить начало нового теста пользователем"""
+        conn = connect(self.db_url)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO test_starts (user_id, started_at) VALUES (?, ?)",
+                (user_id, time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def save(self, user_id, specialization, specialization_id, specialization_name,
+             scores, counts, percentages):
+        """Записать (или перезаписать) результат пользователя"""
+        conn = connect(self.db_url)
+        try:
+            conn.execute(
+                """
+                INSERT OR REPLACE INTO test_results
+                    (user_id, specialization, specialization_id, specialization_name,
+                     scores, counts, percentages, finished_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (user_id, specialization, specialization_id, specialization_name,
+                 json.dumps(scores), json.dumps(counts),
+                 json.dumps(percentages, ensure_ascii=False), time.time())
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def load(self, user_id):
+        """Последний результат пользователя словарем или None"""
+        conn = connect(self.db_url)
+        try:
+            row = conn.execute(
+                """
+                SELECT specialization, specialization_id, specialization_name,
+                       scores, counts, percentages, finished_at
+                FROM test_results WHERE user_id = ?
+                """,
+                (user_id,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        specialization, spec_id, spec_name, scores, counts, percentages, finished_at = row
+        return {
+            'specialization': specialization,
+            'specialization_id': spec_id,
+            'specialization_name': spec_name,
+            'scores': json.loads(scores),
+            'counts': json.loads(counts),
+            'percentages': json.loads(percentages),
+            'finished_at': finished_at,
+        }
@@ -0,0 +1,80 @@
+"""
+Маршрутизация входящих сообщений по хеш-таблицам.
+
+telebot проверяет фильтры обработчиков по очереди, поэтому обычный ответ на
+вопрос теста проходит всю цепочку кнопок админки, прежде чем попасть в общий
+обработчик. Router находит обработчик за O(1): по точному тексту кнопки, по
+паре (роль, состояние FSM) и по их сочетанию. Среди совпавших выбирается
+зарегистрированный раньше остальных - так же, как это делает telebot.
+"""
+
+ROLE_USER = 'user'
+ROLE_ADMIN = 'admin'
+
+
+class Router:
+    """Диспетчер сообщений по тексту кнопки и состоянию пользователя"""
+
+    def __init__(self, state_getter, role_getter):
+        # state_getter(user_id) -> состояние FSM или None
+        # role_getter(user_id) -> ROLE_USER / ROLE_ADMIN
+        self._state_getter = state_getter
+        self._role_getter = role_getter
+        self._by_text = {}
+        self._by_state = {}
+        self._by_text_state = {}
+        self._fallback = None
+        self._order = 0
+
+    def _add(self, table, key, handler):
+        # Для каждого ключа важен только первый обработчик
+        if key not in table:
+            table[key] = (self._order, handler)
+
+    def text(self, *texts, state=None, role=ROLE_ADMIN):
+        """Декоратор: обработчик кнопки (при state - только в этом состоянии)"""
+        def decorator(handler):
+            for text in texts:
+                if state is None:
+                    self._add(self._by_text, text, handler)
+                else:
+                    self._add(self._by_text_state, (text, role, state), handler)
+            self._order += 1
+            return handler
+        return decorator
+
+    def state(self, state, role=ROLE_ADMIN):
+        """Декоратор: обработчик любого сообщения в состоянии FSM"""
+        def decorator(handler):
+            self._add(self._by_state, (role, state), handler)
+            self._order += 1
+            return handler
+        return decorator
+
+    def fallback(self, handler):
+        """Декоратор: обработчик сообщений, не подошедших ни под один маршрут"""
+        self._fallback = handler
+        return handler
+
+    def resolve(self, message):
+        """Найти обработчик сообщения (или None)"""
+        text = message.text
+        best = self._by_text.get(text)
+
+        state = self._state_getter(message.from_user.id)
+        if state is not None:
+            role = self._role_getter(message.from_user.id)
+            for candidate in (self._by_state.get((role, state)),
+                              self._by_text_state.get((text, role, state))):
+                if candidate is not None and (best is None or candidate[0] < best[0]):
+                    best = candidate
+
+        if best is None:
+            return self._fallback
+        return best[1]
+
+    def dispatch(self, message):
+        """Передать сообщение найденному обработчику"""
+        handler = self.resolve(message)
+        if handler is not None:
+            handler(message)
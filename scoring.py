@@ -0,0 +1,127 @@
+"""
+Векторный подсчет баллов теста.
+
+Каталог вопросов компилируется в плотную матрицу весов
+(вопросы × варианты × категории): weights[q, o, c] равен value варианта o
+вопроса q, если вариант относится к категории c. Ответы пользователя
+кодируются вектором индексов вариантов по позициям каталога (-1 - нет ответа),
+и баллы по категориям считаются одной выборкой и суммой. Тот же движок
+пересчитывает тысячи векторов ответов за раз для аналитики.
+"""
+
+import threading
+
+import numpy as np
+
+# Порядок категорий совпадает с порядком в show_results / analyze_answers
+CATEGORIES = ('code', 'data', 'design', 'security', 'devops', 'mobile', 'game', 'ai_ml')
+CATEGORY_INDEX = {category: index for index, category in enumerate(CATEGORIES)}
+
+# Порядок специализаций в результатах теста
+SPECIALIZATIONS = (
+    'Программная инженерия', 'Data Science', 'UX/UI дизайн', 'Кибербезопасность',
+    'DevOps инженерия', 'Мобильная разработка', 'Game Development', 'AI/ML инженерия',
+)
+
+# Индекс варианта для вопроса без ответа
+UNANSWERED = -1
+
+# Сколько векторов обрабатывать за один проход в пакетном режиме
+BATCH_CHUNK = 4096
+
+
+class ScoringEngine:
+    """Матрица весов одного снимка каталога"""
+
+    def __init__(self, catalog):
+        self.version = catalog.version
+        self.total = catalog.total
+        max_options = max((len(question.options) for question in catalog.questions), default=0)
+
+        # Последний столбец вариантов всегда нулевой: индекс -1 (нет ответа)
+        # попадает на него и ничего не добавляет к сумме
+        shape = (self.total, max_options + 1, len(CATEGORIES))
+        self.weights = np.zeros(shape, dtype=np.int32)
+        self.hits = np.zeros(shape, dtype=np.int32)
+        self._value_index = []
+
+        for q, question in enumerate(catalog.questions):
+            value_index = {}
+            for o, option in enumerate(question.options):
+                # Как и при переборе, значение указывает на первый подходящий вариант
+                value_index.setdefault(option.value, o)
+                c = CATEGORY_INDEX.get(option.category)
+                if c is None:
+                    continue
+                self.weights[q, o, c] = option.value or 0
+                self.hits[q, o, c] = 1
+            self._value_index.append(value_index)
+
+        self._rows = np.arange(self.total)
+        self._positions = dict(catalog.positions)
+
+    def answer_vector(self, answers):
+        """Вектор индексов вариантов из словаря {str(question_id): value}"""
+        vector = np.full(self.total, UNANSWERED, dtype=np.int16)
+        for question_id, answer_value in answers.items():
+            position = self._positions.get(int(question_id))
+            if position is None:
+                continue
+            option_index = self._value_index[position - 1].get(answer_value)
+            if option_index is not None:
+                vector[position - 1] = option_index
+        return vector
+
+    def position_vector(self, positions):
+        """Вектор из индексов вариантов по позициям каталога (например, array('b') сессии)"""
+        vector = np.full(self.total, UNANSWERED, dtype=np.int16)
+        count = min(len(positions), self.total)
+        if count:
+            vector[:count] = np.frombuffer(positions, dtype=np.int8, count=count)
+        return vector
+
+    def score(self, vector):
+        """Баллы и количество ответов по категориям для одного вектора"""
+        vector = np.asarray(vector, dtype=np.intp)
+        scores = self.weights[self._rows, vector].sum(axis=0)
+        counts = self.hits[self._rows, vector].sum(axis=0)
+        return scores, counts
+
+    def score_batch(self, matrix):
+        """Баллы и количества для матрицы векторов (N × вопросы)"""
+        matrix = np.asarray(matrix, dtype=np.intp)
+        scores = np.empty((len(matrix), len(CATEGORIES)), dtype=np.int64)
+        counts = np.empty((len(matrix), len(CATEGORIES)), dtype=np.int64)
+        rows = self._rows[np.newaxis, :]
+        for start in range(0, len(matrix), BATCH_CHUNK):
+            chunk = matrix[start:start + BATCH_CHUNK]
+            scores[start:start + len(chunk)] = self.weights[rows, chunk].sum(axis=1)
+            counts[start:start + len(chunk)] = self.hits[rows, chunk].sum(axis=1)
+        return scores, counts
+
+    def score_answers(self, answers):
+        """Баллы и количества словарями {category: int} для словаря ответов"""
+        scores, counts = self.score(self.answer_vector(answers))
+        return as_dict(scores), as_dict(counts)
+
+
+def as_dict(values):
+    """Вектор по категориям -> словарь {category: int}"""
+    return {category: int(value) for category, value in zip(CATEGORIES, values)}
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def engine_for(catalog):
+    """Движок для снимка каталога; пересобирается при смене версии"""
+    global _engine
+    engine = _engine
+    if engine is None or engine.version != catalog.version:
+        with _engine_lock:
+            engine = _engine
+            if engine is None or engine.version != catalog.version:
+                engine = ScoringEngine(catalog)
+                _engine = engine
+    return engine
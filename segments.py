@@ -0,0 +1,106 @@
+"""
+Сегменты аудитории для рассылок.
+
+Сегмент - JSON-совместимый словарь {'kind': ..., параметры}, который хранится
+в состоянии рассылки (чтобы ее можно было продолжить после перезапуска) и
+превращается в источник получателей UserSource (для "всех пользователей" без
+заданной таблицы - LoaderSource поверх db.get_all_users). Выборки по сегментам идут по
+таблицам test_results / test_starts (см. results_store.py) и покрыты индексами,
+поэтому целевая рассылка стоит ровно столько отправок, сколько в ней получателей.
+"""
+
+import logging
+import time
+
+from user_source import UserSource, LoaderSource, has_column
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_ALL = 'all'
+SEGMENT_SPECIALIZATION = 'specialization'
+SEGMENT_ABANDONED = 'abandoned'
+SEGMENT_FINISHED = 'finished'
+
+
+def all_users():
+    return {'kind': SEGMENT_ALL}
+
+
+def by_specialization(specialization):
+    """Пользователи, которым тест рекомендовал specialization"""
+    return {'kind': SEGMENT_SPECIALIZATION, 'specialization': specialization}
+
+
+def abandoned(idle_seconds):
+    """Пользователи, начавшие тест и не закончившие его за idle_seconds"""
+    return {'kind': SEGMENT_ABANDONED, 'before': time.time() - idle_seconds}
+
+
+def finished_between(since, until):
+    """Пользователи, завершившие тест в интервале [since, until) (unix time)"""
+    return {'kind': SEGMENT_FINISHED, 'since': since, 'until': until}
+
+
+class Segments:
+    """Превращает описания сегментов в источники получателей"""
+
+    def __init__(self, db_url, users_table, users_id_column, page_size=1000, load_all_users=None):
+        # users_table - таблица для постраничного обхода всех пользователей;
+        # если она не задана или ее нет в базе, используется load_all_users()
+        self.db_url = db_url
+        self.users_table = users_table
+        self.users_id_column = users_id_column
+        self.page_size = page_size
+        self.load_all_users = load_all_users
+        self.stream_all_users = bool(users_table) and self._users_table_exists()
+
+    def _users_table_exists(self):
+        try:
+            if has_column(self.db_url, self.users_table, self.users_id_column):
+                return True
+        except Exception as e:
+            logger.warning("Не удалось проверить таблицу пользователей %s: %s", self.users_table, e)
+            return False
+        logger.warning("В базе нет %s.%s, рассылка всем пользователям пойдет через db.get_all_users()",
+                       self.users_table, self.users_id_column)
+        return False
+
+    def audience_for(self, segment):
+        """Источник получателей (count / iter_ids) для сегмента"""
+        kind = (segment or all_users())['kind']
+        if kind == SEGMENT_ALL:
+            if not self.stream_all_users:
+                return LoaderSource(self.load_all_users)
+            return UserSource(self.db_url, self.users_table, self.users_id_column,
+                              page_size=self.page_size)
+        if kind == SEGMENT_SPECIALIZATION:
+            return UserSource(self.db_url, 'test_results', 'user_id', page_size=self.page_size,
+                              where="specialization = ?", params=(segment['specialization'],))
+        if kind == SEGMENT_FINISHED:
+            return UserSource(self.db_url, 'test_results', 'user_id', page_size=self.page_size,
+                              where="finished_at >= ? AND finished_at < ?",
+                              params=(segment['since'], segment['until']))
+        if kind == SEGMENT_ABANDONED:
+            return UserSource(
+                self.db_url, 'test_starts', 'user_id', page_size=self.page_size,
+                where="started_at < ? AND NOT EXISTS ("
+                      "SELECT 1 FROM test_results WHERE test_results.user_id = test_starts.user_id "
+                      "AND test_results.finished_at >= test_starts.started_at)",
+                params=(segment['before'],)
+            )
+        raise ValueError(f"Неизвестный сегмент рассылки: {kind}")
+
+
+def describe(segment):
+    """Название сегмента для админа"""
+    segment = segment or all_users()
+    kind = segment['kind']
+    if kind == SEGMENT_SPECIALIZATION:
+        return f"рекомендована специализация «{segment['specialization']}»"
+    if kind == SEGMENT_ABANDONED:
+        return "начали тест и не закончили"
+    if kind == SEGMENT_FINISHED:
+        since = time.strftime('%d.%m.%Y', time.localtime(segment['since']))
+        until = time.strftime('%d.%m.%Y', time.localtime(segment['until'] - 1))
+        return f"завершили тест с {since} по {until}"
+    return "все пользователи"
@@ -0,0 +1,163 @@
+"""
+Снимки хранилища сессий на диск.
+
+Сессии живут только в памяти, поэтому перезапуск бота обрывал все начатые
+тесты. SessionSnapshotter периодически записывает SessionStore в компактный
+двоичный файл (через временный файл и os.replace, чтобы снимок никогда не был
+записан наполовину) и загружает его при старте.
+
+Формат файла: заголовок (сигнатура, версия формата, отпечаток каталога,
+время записи, число записей), затем записи от давних к недавним:
+user_id, время последнего обращения (unix time), длина и Session.to_bytes().
+Незавершенные тесты из снимка с другим отпечатком каталога не загружаются -
+индексы вариантов в них уже не соответствуют вопросам.
+"""
+
+import os
+import struct
+import threading
+import time
+
+from sessions import Session
+
+MAGIC = b'ITBS'
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct('<4sBIdI')
+_RECORD = struct.Struct('<qdH')
+
+
+def write_snapshot(path, entries, fingerprint):
+    """Записать список (user_id, Session.to_bytes(), простой в секундах) в файл атомарно"""
+    now = time.time()
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, fingerprint, now, len(entries))]
+    for user_id, data, idle_seconds in entries:
+        parts.append(_RECORD.pack(user_id, now - idle_seconds, len(data)))
+        parts.append(data)
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(b''.join(parts))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+def read_snapshot(path, limit=None):
+    """Отпечаток каталога и список (user_id, session, простой в секундах).
+
+    При limit читаются только limit самых недавних записей.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, fingerprint, _, count = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Неизвестный формат снимка сессий: {path}")
+
+    skip = count - limit if limit is not None and count > limit else 0
+    now = time.time()
+    entries = []
+    offset = _HEADER.size
+    for index in range(count):
+        user_id, last_seen, size = _RECORD.unpack_from(data, offset)
+        offset += _RECORD.size
+        if index >= skip:
+            session = Session.from_bytes(data[offset:offset + size])
+            entries.append((user_id, session, max(0.0, now - last_seen)))
+        offset += size
+    return fingerprint, entries
+
+
+class SessionSnapshotter:
+    """Периодически сохраняет хранилище сессий и восстанавливает его при старте"""
+
+    def __init__(self, store, path, fingerprint_getter, interval=60.0):
+        # fingerprint_getter() -> отпечаток текущего каталога вопросов
+        self.store = store
+        self.path = path
+        self._fingerprint_getter = fingerprint_getter
+        self.interval = interval
+        self._stop = threading.Event()
+        self._save_lock = threading.Lock()
+        self._thread = None
+
+        # Метрики
+        self.saves = 0
+        self.last_save_seconds = 0.0
+        self.last_saved = 0
+        self.last_load_seconds = 0.0
+        self.loaded = 0
+        self.dropped = 0
+
+    def load(self):
+        """Восстановить сессии из снимка; возвращает число загруженных"""
+        if not os.path.exists(self.path):
+            return 0
+        started = time.perf_counter()
+        fingerprint, entries = read_snapshot(self.path, limit=self.store.max_size)
+        catalog_matches = fingerprint == self._fingerprint_getter()
+
+        loaded = dropped = 0
+        for user_id, session, idle_seconds in entries:
+            # Начатый тест по другому набору вопросов продолжить нельзя
+            if not session.finished and not catalog_matches:
+                dropped += 1
+                continue
+            if self.store.restore(user_id, session, idle_seconds):
+                loaded += 1
+            else:
+                dropped += 1
+
+        self.loaded = loaded
+        self.dropped = dropped
+        self.last_load_seconds = time.perf_counter() - started
+        return loaded
+
+    def save(self):
+        """Записать текущее состояние хранилища; возвращает число сессий"""
+        with self._save_lock:
+            started = time.perf_counter()
+            saved = write_snapshot(self.path, self.store.snapshot(), self._fingerprint_getter())
+            self.saves += 1
+            self.last_saved = saved
+            self.last_save_seconds = time.perf_counter() - started
+            return saved
+
+    def start(self):
+        """Запустить периодическое сохранение в фоне"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='session-snapshot', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.save()
+            except Exception as e:
+                print(f"❌ Ошибка сохранения снимка сессий: {e}")
+
+    def stop(self):
+        """Остановить фоновое сохранение и записать финальный снимок"""
+        self._stop.set()
+        thread = self._thread
+        self._thread = None
+        if thread is not None:
+            thread.join()
+        self.save()
+
+    def stats(self):
+        """Счетчики снимков для админ-статистики"""
+        return {
+            'saves': self.saves,
+            'last_saved': self.last_saved,
+            'last_save_ms': self.last_save_seconds * 1000,
+            'loaded': self.loaded,
+            'dropped': self.dropped,
+            'last_load_ms': self.last_load_seconds * 1000,
+        }
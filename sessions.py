@@ -0,0 +1,277 @@
+"""
+Хранилище сессий теста с ограничением размера и времени простоя.
+
+Раньше состояние каждого пользователя навсегда оставалось в словаре
+user_states. SessionStore держит не больше max_size сессий (вытесняется та,
+к которой дольше всего не обращались) и удаляет сессии, простаивающие дольше
+idle_ttl секунд. Сами сессии - компактные объекты со __slots__ и массивами
+вместо словарей.
+"""
+
+import struct
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+from scoring import CATEGORIES, CATEGORY_INDEX, SPECIALIZATIONS, UNANSWERED
+
+
+class Session:
+    """Состояние одного пользователя: текущий тест и его результаты.
+
+    Ответы хранятся массивом array('b') индексов вариантов по позициям каталога
+    (UNANSWERED - нет ответа), баллы и количества - массивами по CATEGORIES,
+    итоговые результаты - кортежами фиксированной длины. Сессия целиком
+    сериализуется в пару сотен байт (to_bytes / from_bytes).
+    """
+
+    __slots__ = (
+        'session_id',
+        'current_question',       # номер текущего вопроса; None - тест завершен
+        'answers',                # array('b'): индекс варианта по позиции вопроса
+        'scores',                 # array('i'): баллы по CATEGORIES, копятся по ходу теста
+        'counts',                 # array('i'): количество ответов по CATEGORIES
+        'saved_scores',           # кортеж по CATEGORIES
+        'saved_counts',           # кортеж по CATEGORIES
+        'saved_percentages',      # кортеж по SPECIALIZATIONS
+        'saved_specialization',   # название рекомендованной специализации
+        'show_all_universities',
+        'last_seen',
+    )
+
+    def __init__(self, session_id=None, current_question=1, total_questions=0):
+        self.session_id = session_id
+        self.current_question = current_question
+        self.answers = array('b', [UNANSWERED]) * total_questions
+        self.scores = array('i', bytes(4 * len(CATEGORIES)))
+        self.counts = array('i', bytes(4 * len(CATEGORIES)))
+        self.saved_scores = None
+        self.saved_counts = None
+        self.saved_percentages = None
+        self.saved_specialization = None
+        self.show_all_universities = False
+        self.last_seen = 0.0
+
+    @property
+    def finished(self):
+        return self.current_question is None
+
+    @property
+    def answered(self):
+        """Количество отвеченных вопросов"""
+        return len(self.answers) - self.answers.count(UNANSWERED)
+
+    def record_answer(self, position, option_index, value, category):
+        """Запомнить ответ на вопрос с номером position и учесть его в баллах"""
+        if position > len(self.answers):
+            self.answers.extend([UNANSWERED] * (position - len(self.answers)))
+        self.answers[position - 1] = option_index
+        category_index = CATEGORY_INDEX.get(category)
+        if category_index is not None:
+            self.scores[category_index] += value
+            self.counts[category_index] += 1
+
+    def save_results(self, scores, counts, percentages, specialization):
+        """Сохранить итог теста из словарей {category: int} / {specialization: int}"""
+        self.saved_scores = tuple(scores[category] for category in CATEGORIES)
+        self.saved_counts = tuple(counts[category] for category in CATEGORIES)
+        self.saved_percentages = tuple(percentages[name] for name in SPECIALIZATIONS)
+        self.saved_specialization = specialization
+
+    def saved_results(self):
+        """Итог теста словарями (scores, counts, percentages) или None"""
+        if self.saved_scores is None:
+            return None
+        return (
+            dict(zip(CATEGORIES, self.saved_scores)),
+            dict(zip(CATEGORIES, self.saved_counts)),
+            dict(zip(SPECIALIZATIONS, self.saved_percentages)),
+        )
+
+    def to_bytes(self):
+        """Компактное двоичное представление (без last_seen)"""
+        flags = 0
+        if self.show_all_universities:
+            flags |= _FLAG_SHOW_ALL_UNIVERSITIES
+        if self.saved_scores is not None:
+            flags |= _FLAG_HAS_RESULTS
+        if self.session_id is not None:
+            flags |= _FLAG_HAS_SESSION_ID
+        specialization = _SPECIALIZATION_INDEX.get(self.saved_specialization, _NO_SPECIALIZATION)
+        parts = [
+            _HEADER.pack(flags, self.session_id or 0, self.current_question or 0,
+                         specialization, len(self.answers)),
+            self.answers.tobytes(),
+            self.scores.tobytes(),
+            self.counts.tobytes(),
+        ]
+        if self.saved_scores is not None:
+            parts.append(_RESULTS.pack(*self.saved_scores, *self.saved_counts, *self.saved_percentages))
+        return b''.join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Восстановить сессию из to_bytes()"""
+        flags, session_id, current_question, specialization, answer_count = _HEADER.unpack_from(data)
+        offset = _HEADER.size
+        session = cls(
+            session_id if flags & _FLAG_HAS_SESSION_ID else None,
+            current_question or None,
+        )
+        session.answers.frombytes(data[offset:offset + answer_count])
+        offset += answer_count
+        size = 4 * len(CATEGORIES)
+        session.scores = array('i', data[offset:offset + size])
+        session.counts = array('i', data[offset + size:offset + 2 * size])
+        offset += 2 * size
+        if flags & _FLAG_HAS_RESULTS:
+            values = _RESULTS.unpack_from(data, offset)
+            n = len(CATEGORIES)
+            session.saved_scores = values[:n]
+            session.saved_counts = values[n:2 * n]
+            session.saved_percentages = values[2 * n:]
+        if specialization != _NO_SPECIALIZATION:
+            session.saved_specialization = SPECIALIZATIONS[specialization]
+        session.show_all_universities = bool(flags & _FLAG_SHOW_ALL_UNIVERSITIES)
+        return session
+
+    def __repr__(self):
+        return (f"Session(session_id={self.session_id!r}, current_question={self.current_question!r}, "
+                f"answered={self.answered}, specialization={self.saved_specialization!r})")
+
+
+# Двоичный формат сессии: заголовок, ответы, баллы, количества, [результаты]
+_HEADER = struct.Struct('<BqHBH')
+_RESULTS = struct.Struct('<' + 'i' * (2 * len(CATEGORIES)) + 'h' * len(SPECIALIZATIONS))
+_FLAG_SHOW_ALL_UNIVERSITIES = 1
+_FLAG_HAS_RESULTS = 2
+_FLAG_HAS_SESSION_ID = 4
+_NO_SPECIALIZATION = 255
+_SPECIALIZATION_INDEX = {name: index for index, name in enumerate(SPECIALIZATIONS)}
+
+
+class SessionStore:
+    """LRU-хранилище сессий с вытеснением по времени простоя"""
+
+    def __init__(self, max_size=100000, idle_ttl=7 * 24 * 3600, clock=time.monotonic, lock_stripes=64):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # Блокировки изменения сессий: одна на группу пользователей, а не на сессию
+        self._session_locks = [threading.Lock() for _ in range(lock_stripes)]
+        self.hits = 0
+        self.misses = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, user_id):
+        """Сессия пользователя или None (продлевает время жизни)"""
+        now = self._clock()
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is None:
+                self.misses += 1
+                return None
+            if now - session.last_seen > self.idle_ttl:
+                del self._sessions[user_id]
+                self.evicted_ttl += 1
+                self.misses += 1
+                return None
+            session.last_seen = now
+            self._sessions.move_to_end(user_id)
+            self.hits += 1
+            return session
+
+    def put(self, user_id, session):
+        """Сохранить сессию, при необходимости вытеснив старые"""
+        now = self._clock()
+        session.last_seen = now
+        with self._lock:
+            self._sessions[user_id] = session
+            self._sessions.move_to_end(user_id)
+            self._evict(now)
+
+    def pop(self, user_id):
+        """Удалить сессию пользователя (если есть)"""
+        with self._lock:
+            return self._sessions.pop(user_id, None)
+
+    def locked(self, user_id):
+        """Блокировка для изменения сессии пользователя из нескольких полей.
+
+        snapshot() сериализует сессию под той же блокировкой, поэтому в снимок
+        не попадает, например, ответ без перехода к следующему вопросу.
+        """
+        return self._session_locks[hash(user_id) % len(self._session_locks)]
+
+    def snapshot(self):
+        """Список (user_id, Session.to_bytes(), простой в секундах) от давних к недавним"""
+        now = self._clock()
+        with self._lock:
+            sessions = [(user_id, session, now - session.last_seen)
+                        for user_id, session in self._sessions.items()]
+        # Сериализуем вне общей блокировки, чтобы не останавливать остальных пользователей
+        entries = []
+        for user_id, session, idle_seconds in sessions:
+            with self.locked(user_id):
+                data = session.to_bytes()
+            entries.append((user_id, data, idle_seconds))
+        return entries
+
+    def restore(self, user_id, session, idle_seconds):
+        """Вернуть сессию из снимка, сохранив ее время простоя"""
+        now = self._clock()
+        if idle_seconds > self.idle_ttl:
+            return False
+        session.last_seen = now - idle_seconds
+        with self._lock:
+            self._sessions[user_id] = session
+            self._sessions.move_to_end(user_id)
+            self._evict(now)
+        return True
+
+    def _evict(self, now):
+        # Порядок OrderedDict совпадает с порядком последних обращений,
+        # поэтому и просроченные, и самые старые сессии лежат в начале
+        while self._sessions:
+            user_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_seen > self.idle_ttl:
+                self.evicted_ttl += 1
+            elif len(self._sessions) > self.max_size:
+                self.evicted_lru += 1
+            else:
+                break
+            del self._sessions[user_id]
+
+    def approx_bytes(self, sample_size=100):
+        """Оценка занимаемой сессиями памяти по выборке"""
+        with self._lock:
+            total = len(self._sessions)
+            sample = [session for _, session in zip(range(sample_size), reversed(self._sessions.values()))]
+        if not sample:
+            return 0
+        sampled = 0
+        for session in sample:
+            sampled += sys.getsizeof(session)
+            for name in Session.__slots__:
+                sampled += sys.getsizeof(getattr(session, name))
+        return sampled * total // len(sample)
+
+    def stats(self):
+        """Счетчики хранилища для админ-статистики"""
+        return {
+            'size': len(self._sessions),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evicted_lru': self.evicted_lru,
+            'evicted_ttl': self.evicted_ttl,
+            'approx_bytes': self.approx_bytes(),
+        }
@@ -0,0 +1,137 @@
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата.
+
+Без потоков один медленный запрос к базе или отправка сообщения задерживает
+всех пользователей, а встроенный пул потоков telebot обрабатывает обновления
+одного пользователя в произвольном порядке и гоняется за его состоянием.
+ShardedExecutor держит N рабочих потоков, у каждого своя очередь; обновления
+распределяются по потокам по ID чата, поэтому сообщения одного пользователя
+обрабатываются строго по очереди одним потоком, а разные пользователи -
+параллельно.
+"""
+
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update):
+    """ID чата (или пользователя), к которому относится обновление"""
+    for message in (update.message, update.edited_message, update.channel_post,
+                    update.edited_channel_post):
+        if message is not None:
+            return message.chat.id
+    for event in (update.callback_query, update.inline_query, update.chosen_inline_result,
+                  update.shipping_query, update.pre_checkout_query, update.poll_answer,
+                  update.my_chat_member, update.chat_member, update.chat_join_request):
+        if event is not None:
+            user = getattr(event, 'from_user', None) or getattr(event, 'user', None)
+            if user is not None:
+                return user.id
+    return 0
+
+
+class ShardedExecutor:
+    """Пул потоков, где задачи с одним ключом выполняются по порядку одним потоком"""
+
+    def __init__(self, workers=8, queue_size=1000, name='shard'):
+        self.workers = workers
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._threads = [
+            threading.Thread(target=self._run, args=(n, q), name=f'{name}-{n}', daemon=True)
+            for n, q in enumerate(self._queues)
+        ]
+        self.processed = [0] * workers
+        self.errors = 0
+        for thread in self._threads:
+            thread.start()
+
+    def shard_for(self, key):
+        return hash(key) % self.workers
+
+    def submit(self, key, func, *args):
+        """Выполнить func(*args) в потоке, отвечающем за key.
+
+        При переполнении очереди вызов ждет - так опрос Telegram притормаживает,
+        если обработчики не успевают.
+        """
+        self._queues[self.shard_for(key)].put((func, args))
+
+    def _run(self, shard, tasks):
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            func, args = task
+            try:
+                func(*args)
+            except Exception:
+                self.errors += 1
+                logger.exception("Ошибка обработки обновления")
+            self.processed[shard] += 1
+
+    def join(self):
+        """Дождаться выполнения всех поставленных задач"""
+        for tasks in self._queues:
+            done = threading.Event()
+            tasks.put((done.set, ()))
+            done.wait()
+
+    def stop(self):
+        """Выполнить оставшиеся задачи и остановить потоки"""
+        for tasks in self._queues:
+            tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def stats(self):
+        """Длина очередей и количество обработанных задач по потокам"""
+        return {
+            'workers': self.workers,
+            'depth': [tasks.qsize() for tasks in self._queues],
+            'processed': list(self.processed),
+            'errors': self.errors,
+        }
+
+
+class ShardedUpdatesMixin:
+    """Примесь к TeleBot: обновления обрабатываются ShardedExecutor по ID чата.
+
+    Бот создается с threaded=False: обработчики выполняются прямо в потоке
+    своего шарда, а не во встроенном пуле telebot.
+    """
+
+    def __init__(self, *args, update_workers=8, **kwargs):
+        kwargs['threaded'] = False
+        super().__init__(*args, **kwargs)
+        self.update_executor = ShardedExecutor(update_workers, name='updates')
+
+    def process_new_updates(self, updates):
+        if not updates:
+            return
+        # Смещение опроса двигаем сразу, иначе getUpdates вернет те же обновления
+        self.last_update_id = max(self.last_update_id, max(update.update_id for update in updates))
+
+        # Соседние обновления одного чата отдаем одной пачкой, сохраняя порядок
+        batches = {}
+        for update in updates:
+            batches.setdefault(update_key(update), []).append(update)
+        parent = super().process_new_updates
+        for key, batch in batches.items():
+            self.update_executor.submit(key, parent, batch)
+
+    def process_update(self, update, on_done=None):
+        """Обработать одно обновление (вебхук); on_done() вызывается после обработки"""
+        parent = super().process_new_updates
+
+        def run():
+            try:
+                parent([update])
+            finally:
+                if on_done is not None:
+                    on_done()
+
+        self.update_executor.submit(update_key(update), run)
+
@@ -0,0 +1,28 @@
+"""
+Прямой доступ к SQLite-файлу бота для служебных таблиц.
+
+Основные данные живут в database.queries.Database; здесь только небольшие
+таблицы, которые нужны инфраструктуре бота (результаты тестов, статусы
+доставки и т.п.). Путь к файлу берется из Config.DB_URL.
+"""
+
+import os
+import sqlite3
+
+SQLITE_PREFIX = 'sqlite:///'
+
+
+def sqlite_path(db_url):
+    """Путь к файлу базы из SQLAlchemy URL вида sqlite:///path/to.db"""
+    if not db_url.startswith(SQLITE_PREFIX):
+        raise ValueError(f"Поддерживается только SQLite: {db_url}")
+    return db_url[len(SQLITE_PREFIX):]
+
+
+def connect(db_url):
+    """Новое соединение с базой (по одному на операцию, как в sync_server.py)"""
+    path = sqlite_path(db_url)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    return sqlite3.connect(path, timeout=30)
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Запуск бота в нескольких процессах.
+
+Один процесс Python упирается в GIL: построение текста результатов, анализ
+ответов и работа с JSON занимают одно ядро, сколько бы потоков ни было.
+Супервизор сам опрашивает Telegram и раздает обновления N рабочим процессам
+по ID чата (для личных чатов это ID пользователя), поэтому сессия
+пользователя всегда живет в одном процессе и не требует общей памяти.
+
+Каталог вопросов загружается один раз в супервизоре до запуска процессов;
+рабочие процессы создаются через fork и получают его готовым (страницы памяти
+общие, пока их никто не меняет). Когда админ меняет вопросы в одном процессе,
+тот сообщает супервизору, и остальные перечитывают каталог. Так же расходятся
+изменения списка недоступных получателей (delivery_status.py): рассылка из
+одного процесса помечает пользователя, а снова написать боту он может в другой.
+
+У каждого процесса свои файлы снимка сессий и состояния рассылки (с номером
+процесса в имени) и свой порт /metrics (METRICS_PORT + номер процесса). Лимит
+отправки (OUTBOX_GLOBAL_RATE) у процессов общий - SharedTokenBucket из
+ratelimit.py: рассылка, идущая в одном процессе, получает весь лимит, пока
+остальные молчат, а вместе процессы не превышают лимит Telegram на бота.
+
+benchmarks/bench_multiprocess.py измеряет масштабирование на синтетической
+нагрузке (CPU-работа вместо обработчиков, без базы и Telegram). Что реальные
+обработчики масштабируются почти линейно, он не доказывает: их упирают еще
+база, общий лимит отправки и неравномерное распределение чатов.
+
+Запуск: python supervisor.py [--workers N]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from telebot import apihelper
+
+from catalog import QuestionCatalog
+from config import Config
+from ratelimit import SharedTokenBucket
+
+MESSAGE_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post')
+EVENT_FIELDS = ('callback_query', 'inline_query', 'chosen_inline_result', 'shipping_query',
+                'pre_checkout_query', 'poll_answer', 'my_chat_member', 'chat_member',
+                'chat_join_request')
+
+
+def raw_update_key(raw):
+    """То же, что sharding.update_key, но для обновления в виде словаря из JSON"""
+    for field in MESSAGE_FIELDS:
+        message = raw.get(field)
+        if message is not None:
+            return message['chat']['id']
+    for field in EVENT_FIELDS:
+        event = raw.get(field)
+        if event is not None:
+            user = event.get('from') or event.get('user')
+            if user is not None:
+                return user['id']
+    return 0
+
+
+def route(key, workers):
+    """Номер процесса для ключа"""
+    return hash(key) % workers
+
+
+def default_context():
+    # fork: рабочие процессы наследуют уже загруженные данные без копирования
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('fork' if 'fork' in methods else None)
+
+
+class WorkerPool:
+    """N процессов, у каждого своя очередь входящих сообщений.
+
+    target(index, workers, inbox, control, *args) выполняется в процессе;
+    inbox.get() возвращает None, когда процессу пора остановиться, а через
+    control процесс может писать супервизору.
+    """
+
+    def __init__(self, target, workers, args=(), context=None):
+        if context is None:
+            context = default_context()
+        self.workers = workers
+        self.control = context.Queue()
+        self._inboxes = [context.Queue() for _ in range(workers)]
+        self._processes = [
+            context.Process(target=target, args=(n, workers, inbox, self.control) + tuple(args),
+                            name=f'worker-{n}', daemon=True)
+            for n, inbox in enumerate(self._inboxes)
+        ]
+        self.dispatched = [0] * workers
+
+    def start(self):
+        for process in self._processes:
+            process.start()
+
+    def dispatch(self, key, item):
+        """Отдать item процессу, отвечающему за key"""
+        n = route(key, self.workers)
+        self._inboxes[n].put(item)
+        self.dispatched[n] += 1
+
+    def broadcast(self, item, exclude=None):
+        """Отдать item всем процессам (кроме exclude)"""
+        for n, inbox in enumerate(self._inboxes):
+            if n != exclude:
+                inbox.put(item)
+
+    def stop(self, timeout=60.0):
+        """Дать процессам доработать очередь и остановиться"""
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'alive': sum(process.is_alive() for process in self._processes),
+            'dispatched': list(self.dispatched),
+        }
+
+
+def bot_worker(index, workers, inbox, control, catalog, send_limiter):
+    """Рабочий процесс: полноценный бот, получающий обновления от супервизора"""
+    # Ctrl+C получает вся группа процессов; останавливает нас супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # Свои файлы состояния
+    Config.SESSION_SNAPSHOT_PATH = f"{Config.SESSION_SNAPSHOT_PATH}.{index}"
+    Config.BROADCAST_STATE_PATH = f"{Config.BROADCAST_STATE_PATH}.{index}"
+    if Config.METRICS_PORT:
+        Config.METRICS_PORT += index
+
+    import fixed_bot as app
+    from telebot import types
+
+    # Лимит Telegram - на бота: берем токены из общего для всех процессов ведра
+    app.bot.outbox.global_limiter = send_limiter
+    app.catalog_holder.install(catalog)
+    app.catalog_reload_hooks.append(lambda: control.put(('reload', index, None)))
+    app.delivery_status.change_hooks.append(
+        lambda user_id, status: control.put(('delivery', index, (user_id, status))))
+    app.start_services()
+    print(f"⚙️ Процесс {index} (pid {os.getpid()}) готов")
+
+    try:
+        while True:
+            item = inbox.get()
+            if item is None:
+                break
+            kind, payload = item
+            if kind == 'update':
+                app.bot.process_new_updates([types.Update.de_json(payload)])
+            elif kind == 'reload':
+                # Вопросы или специализации изменил админ в другом процессе
+                app.refresh_question_catalog(notify=False)
+                app.refresh_specializations(notify=False)
+            elif kind == 'delivery':
+                # Пользователь помечен недоступным или снова доступен в другом процессе
+                app.delivery_status.apply(*payload)
+    finally:
+        app.stop_services()
+
+
+class Supervisor:
+    """Опрос Telegram и раздача обновлений рабочим процессам"""
+
+    def __init__(self, token, workers, catalog, poll_timeout=20):
+        self.token = token
+        self.poll_timeout = poll_timeout
+        context = default_context()
+        # Создается до fork, чтобы все процессы видели одно ведро
+        self.send_limiter = SharedTokenBucket(Config.OUTBOX_GLOBAL_RATE, context=context)
+        self.pool = WorkerPool(bot_worker, workers, args=(catalog, self.send_limiter), context=context)
+        self.offset = None
+        self.received = 0
+        self.reloads = 0
+        self._stopped = threading.Event()
+
+    def _control_loop(self):
+        while True:
+            message = self.pool.control.get()
+            if message is None:
+                return
+            kind, origin, payload = message
+            if kind == 'reload':
+                self.reloads += 1
+                self.pool.broadcast(('reload', None), exclude=origin)
+            elif kind == 'delivery':
+                self.pool.broadcast(('delivery', payload), exclude=origin)
+
+    def poll(self):
+        """Долгий опрос getUpdates, пока не вызван stop()"""
+        while not self._stopped.is_set():
+            try:
+                updates = apihelper.get_updates(self.token, offset=self.offset, limit=100,
+                                                timeout=self.poll_timeout,
+                                                long_polling_timeout=self.poll_timeout)
+            except Exception as e:
+                print(f"❌ Ошибка получения обновлений: {e}")
+                time.sleep(1)
+                continue
+            for raw in updates:
+                self.offset = raw['update_id'] + 1
+                self.pool.dispatch(raw_update_key(raw), ('update', json.dumps(raw)))
+            self.received += len(updates)
+
+    def run(self):
+        self.pool.start()
+        control_thread = threading.Thread(target=self._control_loop, name='control', daemon=True)
+        control_thread.start()
+        try:
+            self.poll()
+        finally:
+            self.pool.stop()
+            self.pool.control.put(None)
+            control_thread.join()
+
+    def stop(self):
+        self._stopped.set()
+
+
+def load_catalog():
+    """Снимок каталога вопросов для всех процессов"""
+    from database.queries import Database
+    db = Database(Config.DB_URL)
+    return QuestionCatalog(db.get_all_questions(), version=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бот в нескольких процессах")
+    parser.add_argument('--workers', type=int, default=Config.SUPERVISOR_WORKERS or os.cpu_count(),
+                        help="количество рабочих процессов (по умолчанию - число ядер)")
+    args = parser.parse_args()
+
+    if Config.TELEGRAM_API_URL:
+        apihelper.API_URL = Config.TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+
+    catalog = load_catalog()
+    print(f"📚 Каталог: {catalog.total} вопросов")
+    print(f"🚀 Запуск {args.workers} рабочих процессов...")
+    print("Для остановки нажмите Ctrl+C")
+    print("=" * 50)
+
+    supervisor = Supervisor(Config.BOT_TOKEN, args.workers, catalog)
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        print("\n🛑 Бот остановлен")
+    print(f"📊 Получено обновлений: {supervisor.received}, по процессам: {supervisor.pool.dispatched}")
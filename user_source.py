@@ -0,0 +1,111 @@
+"""
+Потоковый обход пользователей для рассылок.
+
+db.get_all_users() загружает весь список пользователей в память до того,
+как уйдет первое сообщение. UserSource читает ID страницами по ключу
+(WHERE id > последний ORDER BY id LIMIT n), поэтому память не зависит от
+размера аудитории, а первые сообщения уходят сразу. Обход идет по
+возрастанию ID, что совпадает с порядком курсора в broadcast.py.
+
+LoaderSource дает тот же интерфейс поверх db.get_all_users() - для базы,
+где таблица пользователей не задана в конфигурации или не найдена.
+"""
+
+import bisect
+import re
+
+from storage import connect
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _identifier(name):
+    # Имена таблиц и колонок приходят из конфигурации и подставляются в SQL
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Недопустимое имя в SQL: {name}")
+    return name
+
+
+def has_column(db_url, table, column):
+    """Есть ли в базе таблица table с колонкой column"""
+    conn = connect(db_url)
+    try:
+        rows = conn.execute(f"PRAGMA table_info({_identifier(table)})").fetchall()
+    finally:
+        conn.close()
+    return any(row[1] == column for row in rows)
+
+
+class UserSource:
+    """ID пользователей из таблицы базы постранично по возрастанию.
+
+    where/params задают дополнительное условие отбора (сегмент рассылки).
+    """
+
+    def __init__(self, db_url, table='users', id_column='telegram_id', page_size=1000,
+                 where=None, params=()):
+        self.db_url = db_url
+        self.table = _identifier(table)
+        self.id_column = _identifier(id_column)
+        self.page_size = page_size
+        self.where = f" AND ({where})" if where else ''
+        self.params = tuple(params)
+
+    def count(self, after=None):
+        """Количество пользователей с ID больше after"""
+        conn = connect(self.db_url)
+        try:
+            row = conn.execute(
+                f"SELECT COUNT(*) FROM {self.table} WHERE {self.id_column} > ?{self.where}",
+                (after if after is not None else -1,) + self.params
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+    def iter_ids(self, after=None):
+        """Генератор ID пользователей с ID больше after"""
+        last = after if after is not None else -1
+        while True:
+            conn = connect(self.db_url)
+            try:
+                rows = conn.execute(
+                    f"SELECT {self.id_column} FROM {self.table} "
+                    f"WHERE {self.id_column} > ?{self.where} ORDER BY {self.id_column} LIMIT ?",
+                    (last,) + self.params + (self.page_size,)
+                ).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                return
+            for (user_id,) in rows:
+                yield user_id
+            last = rows[-1][0]
+            if len(rows) < self.page_size:
+                return
+
+
+class LoaderSource:
+    """Источник поверх функции, возвращающей весь список (например, db.get_all_users).
+
+    Список загружается и сортируется один раз на источник: рассылка берет
+    новый источник и вызывает у него count(), а затем iter_ids().
+    """
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._sorted = None
+
+    def _ids(self, after):
+        if self._sorted is None:
+            self._sorted = sorted(int(user_id) for user_id in self._loader())
+        ids = self._sorted
+        if after is None:
+            return ids
+        return ids[bisect.bisect_right(ids, after):]
+
+    def count(self, after=None):
+        return len(self._ids(after))
+
+    def iter_ids(self, after=None):
+        return iter(self._ids(after))
@@ -0,0 +1,188 @@
+"""
+Прием обновлений через вебхук вместо long polling.
+
+При опросе каждое обновление ждет очередного getUpdates, а запустить второй
+экземпляр бота нельзя - Telegram отдает обновления только одному опрашивающему.
+В режиме вебхука Telegram сам присылает обновления POST-запросами на
+локальный HTTP-сервер (обычно за nginx с TLS), и экземпляров за балансировщиком
+может быть несколько.
+
+WebhookServer:
+* проверяет заголовок X-Telegram-Bot-Api-Secret-Token (если задан secret_token);
+* отбрасывает повторы по update_id - Telegram повторяет доставку, если не
+  дождался ответа;
+* ограничивает число обновлений в обработке (max_in_flight); сверх лимита
+  отвечает 503, и Telegram повторит доставку позже;
+* отвечает 200 сразу после постановки обновления в очередь обработки.
+
+Запуск: python fixed_bot.py --mode webhook
+"""
+
+import hmac
+import json
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+# Обновление от Telegram не бывает больше нескольких десятков килобайт
+MAX_BODY_SIZE = 1024 * 1024
+
+
+class UpdateDeduplicator:
+    """Помнит последние size значений update_id"""
+
+    def __init__(self, size=10000):
+        self._order = deque()
+        self._seen = set()
+        self.size = size
+        self._lock = threading.Lock()
+
+    def seen(self, update_id):
+        """True, если update_id уже был; иначе запоминает его"""
+        with self._lock:
+            if update_id in self._seen:
+                return True
+            self._seen.add(update_id)
+            self._order.append(update_id)
+            if len(self._order) > self.size:
+                self._seen.discard(self._order.popleft())
+            return False
+
+    def forget(self, update_id):
+        """Забыть update_id (обновление не удалось принять)"""
+        with self._lock:
+            self._seen.discard(update_id)
+
+
+class WebhookServer:
+    """HTTP-сервер, принимающий обновления Telegram.
+
+    process(update, on_done) ставит обновление в обработку и должен вызвать
+    on_done() по ее завершении (см. ShardedUpdatesMixin.process_update).
+    """
+
+    def __init__(self, process, host='127.0.0.1', port=8443, path='/webhook', secret_token=None,
+                 max_in_flight=256, dedup_size=10000):
+        self.process = process
+        self.path = path
+        self.secret_token = secret_token
+        self.max_in_flight = max_in_flight
+        self.dedup = UpdateDeduplicator(dedup_size)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+
+        # Метрики
+        self.received = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.forbidden = 0
+        self.invalid = 0
+        self.in_flight = 0
+        self.max_in_flight_seen = 0
+        self._stats_lock = threading.Lock()
+
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self):
+        host, port = self.httpd.server_address[:2]
+        return host, port
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                status = server.handle(self.path, self.headers, self._read_body())
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _read_body(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length <= 0 or length > MAX_BODY_SIZE:
+                    return None
+                return self.rfile.read(length)
+
+            def log_message(self, format, *args):
+                # Журнал каждого запроса не нужен
+                pass
+
+        return Handler
+
+    def handle(self, path, headers, body):
+        """Обработать POST-запрос; возвращает HTTP-статус ответа"""
+        if path != self.path:
+            return 404
+        if self.secret_token and not hmac.compare_digest(
+                headers.get(SECRET_HEADER, ''), self.secret_token):
+            self.forbidden += 1
+            return 403
+        try:
+            update = types.Update.de_json(json.loads(body))
+        except Exception:
+            self.invalid += 1
+            return 400
+
+        # Сверх лимита не принимаем - Telegram повторит доставку
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            return 503
+        if self.dedup.seen(update.update_id):
+            self._slots.release()
+            self.duplicates += 1
+            return 200
+
+        with self._stats_lock:
+            self.received += 1
+            self.in_flight += 1
+            if self.in_flight > self.max_in_flight_seen:
+                self.max_in_flight_seen = self.in_flight
+        try:
+            self.process(update, self._done)
+        except Exception as e:
+            self._done()
+            self.dedup.forget(update.update_id)
+            logger.error("Ошибка приема обновления %s: %s", update.update_id, e)
+            return 500
+        return 200
+
+    def _done(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def start(self):
+        """Запустить сервер в фоновом потоке"""
+        thread = threading.Thread(target=self.serve_forever, name='webhook', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """Остановить сервер (из другого потока) и закрыть сокет"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def close(self):
+        self.httpd.server_close()
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'duplicates': self.duplicates,
+            'rejected': self.rejected,
+            'forbidden': self.forbidden,
+            'invalid': self.invalid,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight_seen,
+        }